@@ -0,0 +1,129 @@
+import os
+import pickle
+import hashlib
+import tempfile
+from cminiAst import Node, tree_depth
+from frontend import parse_ast
+
+# everything whose change can change a cached AST or output
+_VERSIONED_FILES = ("cminiAst.py", "fastLexer.py", "prattParser.py", "frontend.py",
+                    "treePatterns.py", "symbols.py", "passManager.py", "costModel.py",
+                    "obfuscator.py", "deObfuscator.py")
+_tool_version = None
+# pickle recurses on the C stack, a few levels per node, under the default
+# recursion limit; deeper trees are not cached
+MAX_PICKLE_DEPTH = 150
+
+
+def tool_version():
+    global _tool_version
+    if _tool_version is None:
+        h = hashlib.sha256()
+        here = os.path.dirname(os.path.abspath(__file__))
+        for name in _VERSIONED_FILES:
+            with open(os.path.join(here, name), "rb") as f:
+                h.update(f.read())
+        _tool_version = h.hexdigest()[:16]
+    return _tool_version
+
+
+class AstCache:
+    """Content-addressed pickle cache on disk, bounded by total size.
+
+    Entries are files named by the sha256 of their key. A hit refreshes
+    the file's mtime, so evicting oldest-mtime-first is LRU.
+    """
+
+    def __init__(self, directory=".cmini_cache", max_bytes=64 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._size = None
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, *parts):
+        h = hashlib.sha256(tool_version().encode())
+        for part in parts:
+            h.update(b"\0")
+            h.update(repr(part).encode("utf-8"))
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+            os.utime(path)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        if isinstance(value, Node) and tree_depth(value) > MAX_PICKLE_DEPTH:
+            return
+        try:
+            data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        except RecursionError:
+            return  # pickle recurses on the C stack; very deep trees stay uncached
+        if len(data) > self.max_bytes:
+            return
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        path = self._path(key)
+        old = os.path.getsize(path) if os.path.exists(path) else 0
+        size = self.total_bytes()
+        os.replace(tmp, path)
+        self._size = size + len(data) - old
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def total_bytes(self):
+        if self._size is None:
+            self._size = sum(e.stat().st_size for e in os.scandir(self.directory)
+                             if e.is_file() and not e.name.endswith(".tmp"))
+        return self._size
+
+    def evict(self):
+        entries = []
+        for e in os.scandir(self.directory):
+            if e.is_file() and not e.name.endswith(".tmp"):
+                st = e.stat()
+                entries.append((st.st_mtime, st.st_size, e.path))
+        entries.sort()
+        size = sum(e[1] for e in entries)
+        for _, entry_size, path in entries:
+            if size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            size -= entry_size
+            self.evictions += 1
+        self._size = size
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        rate = 100.0 * self.hits / lookups if lookups else 0.0
+        return (f"cache: {self.hits} hits, {self.misses} misses ({rate:.0f}% hit rate), "
+                f"{self.evictions} evictions, {self.total_bytes()} bytes in {self.directory}")
+
+
+def load_ast(source, cache=None):
+    """parse_ast(source), going through cache when one is given."""
+    if cache is None:
+        return parse_ast(source)
+    key = cache.key("ast", source)
+    program = cache.get(key)
+    if program is None:
+        program = parse_ast(source)
+        cache.put(key, program)
+    return program
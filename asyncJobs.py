@@ -0,0 +1,296 @@
+import os
+import sys
+import json
+import time
+import signal
+import asyncio
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from buildCache import BuildCache
+from cminiVM import run_source, MAX_STEPS
+from batchRunner import collect_inputs, error_record, summarize
+from obfuscator import parse_spec, obfuscate_source
+from deObfuscator import deobfuscate_source, TIMEOUT_RUN
+
+COMPILE_TIMEOUT = 60
+# CMini inputs use printf without including stdio.h
+CFLAGS = ("-include", "stdio.h")
+
+
+class JobTimeout(Exception):
+    pass
+
+
+async def _reap(spawn):
+    if spawn.cancelled() or (spawn.done() and spawn.exception() is not None):
+        return
+    proc = await spawn
+    if proc.returncode is None:
+        proc.kill()
+    # drains and closes the pipes too, not just reaps the process
+    await proc.communicate()
+
+
+async def run_process(argv, timeout):
+    """(returncode, stdout, stderr) of argv; the process is killed if it
+    outlives timeout or the awaiting task is cancelled."""
+    spawn = asyncio.ensure_future(asyncio.create_subprocess_exec(
+        *argv, stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE))
+    try:
+        proc = await asyncio.shield(spawn)
+        out, err = await asyncio.wait_for(proc.communicate(), timeout)
+    except BaseException:
+        # a second cancel (fail-fast, Ctrl-C) must not interrupt the cleanup
+        cleanup = asyncio.ensure_future(_reap(spawn))
+        while not cleanup.done():
+            try:
+                await asyncio.shield(cleanup)
+            except asyncio.CancelledError:
+                pass
+        raise
+    return proc.returncode, out.decode("utf-8", "replace"), err.decode("utf-8", "replace")
+
+
+def transform(source, spec, seed, deobfuscate):
+    """Process-pool stage: the obfuscated text and, optionally, its
+    deobfuscated text."""
+    obfuscated = obfuscate_source(source, None, seed, spec)
+    cleaned = deobfuscate_source(obfuscated, None, seed) if deobfuscate else None
+    return obfuscated, cleaned
+
+
+def interpret(texts, max_steps):
+    """Process-pool stage: (exit code, stdout) of every text run on the
+    CMini bytecode VM, or None if it cannot decide one of them."""
+    results = []
+    for text in texts:
+        result = run_source(text, max_steps)
+        if not result.decided:
+            return None
+        results.append((result.exit_code, result.stdout))
+    return results
+
+
+def first_difference(expected, actual):
+    want, got = expected.splitlines(), actual.splitlines()
+    for i, (a, b) in enumerate(zip(want, got), 1):
+        if a != b:
+            return f"line {i} is {b!r}, expected {a!r}"
+    return f"{len(got)} lines, expected {len(want)}"
+
+
+class JobRunner:
+    """Obfuscate -> compile -> run -> compare, for many files at once.
+
+    Each stage has its own concurrency limit: transforms run in a process
+    pool, gcc and the compiled programs run as asyncio subprocesses, so a
+    job waiting on gcc does not hold up another job's parsing or runs.
+    Every program run is limited to run_timeout seconds and every job to
+    job_timeout; cancelling a job kills the processes it started. With
+    max_steps set, the CMini interpreter tries each job first, and only
+    the jobs it cannot decide are compiled.
+    """
+
+    def __init__(self, spec, seed=None, deobfuscate=False, jobs=None, compile_jobs=None,
+                 run_jobs=None, run_timeout=TIMEOUT_RUN, job_timeout=None, build_cache=None,
+                 max_steps=None):
+        jobs = jobs or os.cpu_count()
+        self.build_cache = build_cache
+        self.max_steps = max_steps
+        self.spec = spec
+        self.seed = seed
+        self.deobfuscate = deobfuscate
+        self.run_timeout = run_timeout
+        self.job_timeout = job_timeout
+        self.pool = ProcessPoolExecutor(jobs)
+        self.limits = {"transform": asyncio.Semaphore(jobs),
+                       "interpret": asyncio.Semaphore(jobs),
+                       "compile": asyncio.Semaphore(compile_jobs or jobs),
+                       "run": asyncio.Semaphore(run_jobs or jobs)}
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+    async def _stage(self, record, stage, start_work):
+        # start_work is only called once the stage has a free slot
+        async with self.limits[stage]:
+            record["stage"] = stage
+            start = time.perf_counter()
+            try:
+                return await start_work()
+            finally:
+                record["passes"][stage] = record["passes"].get(stage, 0.0) + time.perf_counter() - start
+
+    async def _compile(self, record, tmp, name, text):
+        """Path of the executable for text, taken from the build cache when
+        there is one and it already holds this program."""
+        key = None
+        if self.build_cache is not None:
+            key = self.build_cache.key(text, CFLAGS)
+            exe = self.build_cache.lookup(key)
+            if exe is not None:
+                record["cache_hits"] += 1
+                return exe
+            src, exe = self.build_cache.staging(key)
+        else:
+            src, exe = os.path.join(tmp, name + ".c"), os.path.join(tmp, name)
+        try:
+            with open(src, "w", encoding="utf-8") as f:
+                f.write(text)
+            code, _, err = await self._stage(record, "compile", lambda: run_process(
+                ["gcc", "-x", "c", *CFLAGS, src, "-o", exe], COMPILE_TIMEOUT))
+            if code != 0:
+                raise RuntimeError(f"gcc failed on the {name} program:\n{err}")
+            return exe if key is None else self.build_cache.add(key, exe)
+        finally:
+            if key is not None:
+                for leftover in (src, exe):
+                    if os.path.exists(leftover):
+                        os.remove(leftover)
+
+    async def _build_and_run(self, record, tmp, name, text):
+        exe = await self._compile(record, tmp, name, text)
+        try:
+            code, out, _ = await self._stage(record, "run", lambda: run_process([exe], self.run_timeout))
+        except asyncio.TimeoutError:
+            raise JobTimeout(f"{name} program ran longer than {self.run_timeout} s") from None
+        return code, out
+
+    async def _job(self, path, record):
+        with open(path, "r", encoding="utf-8") as f:
+            source = f.read()
+        record["bytes"] = len(source.encode("utf-8"))
+        loop = asyncio.get_running_loop()
+        obfuscated, cleaned = await self._stage(record, "transform", lambda: loop.run_in_executor(
+            self.pool, transform, source, self.spec, self.seed, self.deobfuscate))
+        variants = [("original", source), ("obfuscated", obfuscated)]
+        if cleaned is not None:
+            variants.append(("cleaned", cleaned))
+        if self.max_steps:
+            results = await self._stage(record, "interpret", lambda: loop.run_in_executor(
+                self.pool, interpret, [text for _, text in variants], self.max_steps))
+            if results is not None:
+                record["decided_by"] = "interpreter"
+                self._compare(record, variants, results)
+                return
+        record["decided_by"] = "gcc"
+        with tempfile.TemporaryDirectory(prefix="cmini-job-") as tmp:
+            tasks = [asyncio.create_task(self._build_and_run(record, tmp, name, text))
+                     for name, text in variants]
+            try:
+                results = await asyncio.gather(*tasks)
+            finally:
+                # one variant failing must not leave the others running
+                # after their directory is gone
+                for t in tasks:
+                    t.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+        self._compare(record, variants, results)
+
+    def _compare(self, record, variants, results):
+        record["stage"] = "compare"
+        expected = results[0]
+        for (name, _), result in zip(variants[1:], results[1:]):
+            if result[0] != expected[0]:
+                raise AssertionError(f"{name} program exited {result[0]}, original {expected[0]}")
+            if result[1] != expected[1]:
+                raise AssertionError(f"{name} program output differs: {first_difference(expected[1], result[1])}")
+
+    async def job(self, path):
+        record = {"path": path, "ok": False, "seconds": 0.0, "bytes": 0, "passes": {},
+                  "cache_hits": 0, "stage": "read", "error": None}
+        start = time.perf_counter()
+        try:
+            try:
+                await asyncio.wait_for(self._job(path, record), self.job_timeout)
+            except asyncio.TimeoutError:
+                raise JobTimeout(f"job took longer than {self.job_timeout} s") from None
+            record["ok"] = True
+        except asyncio.CancelledError as e:
+            record["error"] = error_record(e, "cancelled")
+        except Exception as e:
+            record["error"] = error_record(e, record["stage"])
+        record["seconds"] = time.perf_counter() - start
+        del record["stage"]
+        return record
+
+    async def run_all(self, paths, fail_fast=False):
+        tasks = [asyncio.create_task(self.job(p)) for p in paths]
+
+        def cancel_all(*_):
+            for t in tasks:
+                t.cancel()
+
+        if fail_fast:
+            for t in tasks:
+                t.add_done_callback(lambda t: None if t.cancelled() or t.result()["ok"] else cancel_all())
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGINT, cancel_all)
+        try:
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            loop.remove_signal_handler(signal.SIGINT)
+        records = []
+        for path, r in zip(paths, results):
+            if isinstance(r, BaseException):  # cancelled before it started
+                r = {"path": path, "ok": False, "seconds": 0.0, "bytes": 0, "passes": {},
+                     "cache_hits": 0, "error": error_record(r, "cancelled")}
+            records.append(r)
+        return records
+
+
+async def _main(args, spec, files):
+    build_cache = None if args.no_build_cache else BuildCache(args.build_cache_dir)
+    runner = JobRunner(spec, args.seed, args.deobfuscate, args.jobs, args.compile_jobs,
+                       args.run_jobs, args.run_timeout, args.job_timeout, build_cache,
+                       args.max_steps if args.interpret else None)
+    try:
+        start = time.perf_counter()
+        records = await runner.run_all(files, args.fail_fast)
+        return records, time.perf_counter() - start, build_cache
+    finally:
+        runner.close()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="obfuscate, compile, run and compare many CMini files concurrently")
+    ap.add_argument("inputs", metavar="DIR_OR_GLOB")
+    ap.add_argument("--techniques", default="1,2,3", help="comma separated technique numbers or pass names")
+    ap.add_argument("--seed", type=int, default=None)
+    ap.add_argument("--deobfuscate", action="store_true", help="also deobfuscate and check the cleaned program")
+    ap.add_argument("--jobs", type=int, default=os.cpu_count(), help="parallel transforms")
+    ap.add_argument("--compile-jobs", type=int, default=None, help="parallel gcc processes (default --jobs)")
+    ap.add_argument("--run-jobs", type=int, default=None, help="parallel program runs (default --jobs)")
+    ap.add_argument("--run-timeout", type=float, default=TIMEOUT_RUN, help="seconds per program run")
+    ap.add_argument("--job-timeout", type=float, default=None, help="seconds per file, all stages included")
+    ap.add_argument("--build-cache-dir", default=".cmini_build", help="compiled executables, keyed by source")
+    ap.add_argument("--no-build-cache", action="store_true", help="compile every program afresh")
+    ap.add_argument("--interpret", action="store_true",
+                    help="decide files in-process with the CMini interpreter; only compile the ones it cannot")
+    ap.add_argument("--max-steps", type=int, default=MAX_STEPS, help="VM instruction limit per program")
+    ap.add_argument("--fail-fast", action="store_true", help="cancel the remaining jobs after the first failure")
+    ap.add_argument("--report", help="write per-file records to this JSON file")
+    args = ap.parse_args(argv)
+
+    try:
+        spec = parse_spec(t.strip() for t in args.techniques.split(","))
+    except ValueError as e:
+        ap.error(str(e))
+    _, files = collect_inputs(args.inputs)
+    records, wall, build_cache = asyncio.run(_main(args, spec, files))
+    print(summarize(records, wall, args.jobs))
+    if args.interpret:
+        interpreted = sum(r.get("decided_by") == "interpreter" for r in records)
+        print(f"interpreter: decided {interpreted} of {len(records)} files, gcc checked the rest")
+    if build_cache is not None:
+        print(build_cache.stats())
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump({"wall_seconds": wall, "files": records}, f, indent=2)
+    sys.exit(0 if all(r["ok"] for r in records) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import os
+import glob
+import json
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+
+def collect_inputs(spec, pattern="*.mc"):
+    """Files named by spec (a directory, searched recursively, or a glob)
+    and the base directory their relative output paths are taken from."""
+    if os.path.isdir(spec):
+        files = sorted(glob.glob(os.path.join(spec, "**", pattern), recursive=True))
+        return spec, files
+    files = sorted(f for f in glob.glob(spec, recursive=True) if os.path.isfile(f))
+    if not files:
+        return ".", []
+    return os.path.commonpath([os.path.dirname(os.path.abspath(f)) for f in files]), files
+
+
+def mirror_path(path, base, out_dir):
+    rel = os.path.relpath(os.path.abspath(path), os.path.abspath(base))
+    return os.path.join(out_dir, rel)
+
+
+def error_record(exc, stage):
+    return {"stage": stage, "type": type(exc).__name__, "message": str(exc),
+            "traceback": traceback.format_exc()}
+
+
+def _failed(task, exc):
+    return {"path": task[0], "ok": False, "seconds": 0.0, "bytes": 0, "error": error_record(exc, "worker")}
+
+
+def _run_alone(worker, task):
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        return pool.submit(worker, task).result()
+
+
+def run_pool(worker, tasks, jobs):
+    """Run worker(task) for every task in a process pool. A task is a tuple
+    whose first item is the input path; each worker returns a record dict.
+    A worker that dies or raises still yields a failed record.
+
+    A worker process that dies (a crash, an OOM kill) breaks the pool, and
+    every task not finished by then fails with BrokenProcessPool. The
+    oldest of those were the ones handed to workers, so they run again
+    each in a process of its own, where only the task that kills its
+    process fails; the rest go to a fresh pool."""
+    jobs = jobs or os.cpu_count() or 1
+    records = []
+    pending = list(tasks)
+    while pending:
+        unfinished = []
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = {pool.submit(worker, task): i for i, task in enumerate(pending)}
+            for fut in as_completed(futures):
+                try:
+                    records.append(fut.result())
+                except BrokenProcessPool:
+                    unfinished.append(futures[fut])
+                except Exception as e:
+                    records.append(_failed(pending[futures[fut]], e))
+        if not unfinished:
+            break
+        unfinished = [pending[i] for i in sorted(unfinished)]
+        # the executor keeps up to jobs tasks running and jobs + 1 queued
+        suspects, pending = unfinished[:2 * jobs + 1], unfinished[2 * jobs + 1:]
+        with ThreadPoolExecutor(max_workers=jobs) as threads:
+            futures = {threads.submit(_run_alone, worker, task): task for task in suspects}
+            for fut in as_completed(futures):
+                try:
+                    records.append(fut.result())
+                except Exception as e:
+                    records.append(_failed(futures[fut], e))
+    records.sort(key=lambda r: r["path"])
+    return records
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    pos = (len(values) - 1) * q / 100.0
+    lo = int(pos)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (pos - lo)
+
+
+def summarize(records, wall, jobs):
+    ok = [r for r in records if r["ok"]]
+    failed = [r for r in records if not r["ok"]]
+    latencies = [r["seconds"] for r in records]
+    total_bytes = sum(r["bytes"] for r in records)
+    lines = [f"batch: {len(records)} files ({len(ok)} ok, {len(failed)} failed) in {wall:.2f} s with {jobs} workers",
+             f"throughput: {len(records) / wall if wall else 0:.1f} files/sec, "
+             f"{total_bytes / wall if wall else 0:,.0f} bytes/sec",
+             f"latency per file: p50 {percentile(latencies, 50) * 1000:.1f} ms, "
+             f"p95 {percentile(latencies, 95) * 1000:.1f} ms"]
+    lines += pass_table(records)
+    for r in records:
+        if r.get("converged") is False:
+            lines.append(f"no fixpoint: {r['path']} stopped at the iteration cap after {r['rounds']} round(s)")
+    for r in failed:
+        err = r["error"]
+        lines.append(f"failed: {r['path']} [{err['stage']}] {err['type']}: {err['message']}")
+    return "\n".join(lines)
+
+
+def pass_table(records):
+    """Per-file milliseconds for workers that report a "passes" dict."""
+    names = []
+    for r in records:
+        for name in r.get("passes") or ():
+            if name not in names:
+                names.append(name)
+    if not names:
+        return []
+    width = max(len(r["path"]) for r in records)
+    lines = ["per-pass time (ms):", f"{'file':<{width}}  " + "  ".join(f"{n:>{len(n)}}" for n in names)]
+    totals = dict.fromkeys(names, 0.0)
+    for r in records:
+        passes = r.get("passes") or {}
+        cells = []
+        for n in names:
+            if n in passes:
+                totals[n] += passes[n]
+                cells.append(f"{passes[n] * 1000:>{len(n)}.2f}")
+            else:
+                cells.append(f"{'-':>{len(n)}}")
+        lines.append(f"{r['path']:<{width}}  " + "  ".join(cells))
+    lines.append(f"{'total':<{width}}  " + "  ".join(f"{totals[n] * 1000:>{len(n)}.2f}" for n in names))
+    return lines
+
+
+def run_batch(worker, tasks, jobs, report=None):
+    start = time.perf_counter()
+    records = run_pool(worker, tasks, jobs)
+    wall = time.perf_counter() - start
+    print(summarize(records, wall, jobs))
+    if report:
+        with open(report, "w", encoding="utf-8") as f:
+            json.dump({"wall_seconds": wall, "jobs": jobs, "files": records}, f, indent=2)
+    return records
@@ -0,0 +1,351 @@
+import os
+import re
+import sys
+import json
+import math
+import time
+import argparse
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from asyncJobs import first_difference
+from batchRunner import collect_inputs, error_record, run_pool, summarize
+from deObfuscator import deobfuscate_source, TIMEOUT_RUN
+from fastLexer import lex, ID, INT_KW, VOID, LPAREN, RPAREN, LBRACE, RBRACE
+from obfuscator import parse_spec, obfuscate_source
+
+# a child that outlives its alarm dies of SIGALRM
+_SIGALRM = 14
+
+_DRIVER = r"""
+#line 1 "cmini-driver.c"
+static int (*const cmini_entries[])(void) = {
+%(entries)s
+};
+
+int main(int argc, char **argv) {
+    int n = sizeof cmini_entries / sizeof cmini_entries[0];
+    unsigned seconds = argc > 1 ? (unsigned) atoi(argv[1]) : 5;
+    for (int i = 0; i < n; i++) {
+        int fds[2];
+        if (pipe(fds) != 0) {
+            perror("pipe");
+            return 2;
+        }
+        fflush(stdout);
+        pid_t pid = fork();
+        if (pid < 0) {
+            perror("fork");
+            return 2;
+        }
+        if (pid == 0) {
+            close(fds[0]);
+            dup2(fds[1], 1);
+            close(fds[1]);
+            alarm(seconds);
+            int code = cmini_entries[i]();
+            fflush(stdout);
+            _exit(code & 0xff);
+        }
+        close(fds[1]);
+        char *buf = NULL;
+        size_t len = 0, cap = 0;
+        for (;;) {
+            if (cap - len < 4096) {
+                cap = cap ? cap * 2 : 8192;
+                buf = realloc(buf, cap);
+            }
+            ssize_t got = read(fds[0], buf + len, cap - len);
+            if (got <= 0)
+                break;
+            len += got;
+        }
+        close(fds[0]);
+        int status;
+        waitpid(pid, &status, 0);
+        int code = WIFEXITED(status) ? WEXITSTATUS(status) : -WTERMSIG(status);
+        printf("%%d %%d %%zu\n", i, code, len);
+        fwrite(buf, 1, len, stdout);
+        free(buf);
+    }
+    return 0;
+}
+"""
+
+_HEADER = """#include <stdio.h>
+#include <stdlib.h>
+#include <unistd.h>
+#include <sys/types.h>
+#include <sys/wait.h>
+"""
+
+_DIRECTIVE_RE = re.compile(r"^[ \t]*#.*$", re.M)
+_ENTRY_FILE_RE = re.compile(r"cmini-entry-(\d+)\.c:")
+_ENTRY_SYMBOL_RE = re.compile(r"\bcmini(\d+)_")
+
+
+class Unsupported(Exception):
+    pass
+
+
+def namespaced(source, index):
+    """source with every function it defines renamed into namespace index,
+    the name its main became and whether main is void. Only identifiers
+    are touched, so the rest of the program is compiled byte for byte."""
+    # preprocessor lines (the obfuscator adds #include <stdio.h>) are
+    # blanked to the same length, so token offsets still fit source;
+    # anything else CMini does not lex is left for gcc to judge
+    buf = lex(_DIRECTIVE_RE.sub(lambda m: " " * len(m.group()), source))
+    types, values = buf.types, buf.values
+    defined = {}
+    depth = 0
+    for i in range(len(types) - 2):
+        t = types[i]
+        if t == LBRACE:
+            depth += 1
+        elif t == RBRACE:
+            depth -= 1
+        elif depth == 0 and (t == INT_KW or t == VOID) and types[i + 1] == ID and types[i + 2] == LPAREN:
+            defined[values[i + 1]] = (t, types[i + 3] == RPAREN)
+    main = buf.names.index("main") if "main" in buf.names else -1
+    if main not in defined:
+        raise Unsupported("no main function")
+    if not defined[main][1]:
+        raise Unsupported("main takes parameters")
+    # the prefix must not turn a renamed function into a name already in use
+    prefix = f"cmini{index}_"
+    while any(name.startswith(prefix) for name in buf.names):
+        prefix += "_"
+    parts = []
+    pos = 0
+    for i in range(len(types)):
+        if types[i] == ID and values[i] in defined:
+            start = buf.starts[i]
+            parts.append(source[pos:start])
+            parts.append(prefix)
+            pos = start
+    parts.append(source[pos:])
+    return "".join(parts), prefix + "main", defined[main][0] == VOID
+
+
+def driver_source(programs):
+    """One C file running every (index, text, entry, void) program in a
+    forked child. #line directives name each program's own file, so gcc
+    blames the right entry."""
+    parts = [_HEADER]
+    entries = []
+    for index, text, entry, void in programs:
+        parts.append(f'#line 1 "cmini-entry-{index}.c"\n{text}\n')
+        if void:
+            parts.append(f"static int {entry}_wrapper(void) {{ {entry}(); return 0; }}\n")
+            entry += "_wrapper"
+        entries.append(f"    {entry},")
+    parts.append(_DRIVER % {"entries": "\n".join(entries)})
+    return "".join(parts)
+
+
+def blamed_entries(stderr):
+    """Entry indices that gcc's error output points at."""
+    blamed = set()
+    function = None  # the linker names the function on the line before its errors
+    for line in stderr.splitlines():
+        if "in function" in line:
+            function = _ENTRY_SYMBOL_RE.search(line)
+        elif "error" in line or "undefined reference" in line:
+            blamed.update(int(m) for m in _ENTRY_FILE_RE.findall(line))
+            blamed.update(int(m) for m in _ENTRY_SYMBOL_RE.findall(line))
+            if "undefined reference" in line and function is not None:
+                blamed.add(int(function.group(1)))
+    return blamed
+
+
+def parse_frames(data):
+    """{index: (exit code, stdout)} from the driver's output: per entry a
+    "index code length" line followed by length bytes of stdout."""
+    results = {}
+    pos = 0
+    while pos < len(data):
+        end = data.index(b"\n", pos)
+        index, code, length = map(int, data[pos:end].split())
+        pos = end + 1 + length
+        results[index] = (code, data[end + 1:pos].decode("utf-8", "replace"))
+    return results
+
+
+class BatchVerifier:
+    """Compiles many CMini programs into a few driver executables and runs
+    each program in a forked child of its driver.
+
+    Every program's functions are moved into their own namespace
+    (cmini<N>_...), so hundreds of programs link together. A program
+    that does not compile is dropped from its driver and reported on its
+    own; the rest of the batch is compiled again without it. A crash only
+    takes down its child: the result is the negated signal number, as for
+    a subprocess. Drivers are built and run on up to jobs threads.
+    """
+
+    def __init__(self, batch_size=256, jobs=None, run_timeout=TIMEOUT_RUN):
+        self.batch_size = batch_size
+        self.jobs = jobs or os.cpu_count()
+        self.run_timeout = run_timeout
+        self.gcc_calls = 0
+        self.compile_seconds = 0.0
+        self.run_seconds = 0.0
+
+    def _compile(self, source, exe):
+        start = time.perf_counter()
+        proc = subprocess.run(["gcc", "-x", "c", "-", "-o", exe], input=source,
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        self.gcc_calls += 1
+        self.compile_seconds += time.perf_counter() - start
+        return proc.returncode == 0, proc.stderr
+
+    def _run_batch(self, batch, exe):
+        """{index: (code, stdout) or Exception} for one batch of
+        (index, text, entry, void) programs."""
+        results = {}
+        while batch:
+            ok, err = self._compile(driver_source(batch), exe)
+            if ok:
+                break
+            blamed = blamed_entries(err)
+            if not blamed:
+                raise RuntimeError(f"driver does not compile:\n{err}")
+            for index, *_ in batch:
+                if index in blamed:
+                    results[index] = RuntimeError(f"gcc failed:\n{err}")
+            batch = [p for p in batch if p[0] not in blamed]
+        if not batch:
+            return results
+        start = time.perf_counter()
+        try:
+            # alarm() counts whole seconds
+            proc = subprocess.run([exe, str(max(math.ceil(self.run_timeout), 1))], stdout=subprocess.PIPE,
+                                  stderr=subprocess.DEVNULL, timeout=self.run_timeout * len(batch) + 10)
+        finally:
+            self.run_seconds += time.perf_counter() - start
+        frames = parse_frames(proc.stdout)
+        for position, (index, *_) in enumerate(batch):
+            code, out = frames.get(position, (None, ""))
+            if code is None:
+                results[index] = RuntimeError(f"driver exited {proc.returncode} before running it")
+            elif code == -_SIGALRM:
+                results[index] = TimeoutError(f"ran longer than {self.run_timeout} s")
+            else:
+                results[index] = (code, out)
+        return results
+
+    def run(self, sources):
+        """(exit code, stdout) or an exception for every source, in order."""
+        results = [None] * len(sources)
+        programs = []
+        for i, source in enumerate(sources):
+            try:
+                programs.append((i, *namespaced(source, i)))
+            except Unsupported as e:
+                results[i] = e
+        batches = [programs[i:i + self.batch_size] for i in range(0, len(programs), self.batch_size)]
+        with tempfile.TemporaryDirectory(prefix="cmini-drivers-") as tmp, ThreadPoolExecutor(self.jobs) as pool:
+            futures = [pool.submit(self._run_batch, batch, os.path.join(tmp, f"driver{n}"))
+                       for n, batch in enumerate(batches)]
+            for batch, fut in zip(batches, futures):
+                try:
+                    for index, result in fut.result().items():
+                        results[index] = result
+                except Exception as e:
+                    for index, *_ in batch:
+                        results[index] = e
+        return results
+
+
+def transform_file(task):
+    """Process-pool worker: (path, spec, seed, deobfuscate) -> record whose
+    "variants" hold the original, obfuscated and maybe cleaned text."""
+    path, spec, seed, deobfuscate = task
+    record = {"path": path, "ok": False, "seconds": 0.0, "bytes": 0, "variants": {}, "error": None}
+    start = time.perf_counter()
+    stage = "read"
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            source = f.read()
+        record["bytes"] = len(source.encode("utf-8"))
+        stage = "obfuscate"
+        obfuscated = obfuscate_source(source, None, seed, spec)
+        record["variants"] = {"original": source, "obfuscated": obfuscated}
+        if deobfuscate:
+            stage = "deobfuscate"
+            record["variants"]["cleaned"] = deobfuscate_source(obfuscated, None, seed)
+        record["ok"] = True
+    except Exception as e:
+        record["error"] = error_record(e, stage)
+    record["seconds"] = time.perf_counter() - start
+    return record
+
+
+def verify_records(records, verifier):
+    """Runs every variant of every transformed record once (identical
+    texts share a run) and fails records whose variants disagree."""
+    texts = []
+    index_of = {}
+    for r in records:
+        if r["ok"]:
+            for text in r["variants"].values():
+                if text not in index_of:
+                    index_of[text] = len(texts)
+                    texts.append(text)
+    results = verifier.run(texts)
+    for r in records:
+        variants = r.pop("variants")
+        if not r["ok"]:
+            continue
+        try:
+            expected = results[index_of[variants["original"]]]
+            if isinstance(expected, Exception):
+                raise expected
+            for name, text in variants.items():
+                result = results[index_of[text]]
+                if isinstance(result, Exception):
+                    raise type(result)(f"{name} program: {result}")
+                if result[0] != expected[0]:
+                    raise AssertionError(f"{name} program exited {result[0]}, original {expected[0]}")
+                if result[1] != expected[1]:
+                    raise AssertionError(f"{name} program output differs: {first_difference(expected[1], result[1])}")
+        except Exception as e:
+            r["ok"] = False
+            r["error"] = error_record(e, "verify")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="obfuscate many CMini files and check them with a few gcc calls")
+    ap.add_argument("inputs", metavar="DIR_OR_GLOB")
+    ap.add_argument("--techniques", default="1,2,3", help="comma separated technique numbers or pass names")
+    ap.add_argument("--seed", type=int, default=None)
+    ap.add_argument("--deobfuscate", action="store_true", help="also deobfuscate and check the cleaned program")
+    ap.add_argument("--batch-size", type=int, default=256, help="programs linked into one driver")
+    ap.add_argument("--jobs", type=int, default=os.cpu_count(), help="parallel transforms and driver builds")
+    ap.add_argument("--run-timeout", type=float, default=TIMEOUT_RUN, help="seconds per program")
+    ap.add_argument("--report", help="write per-file records to this JSON file")
+    args = ap.parse_args(argv)
+
+    try:
+        spec = parse_spec(t.strip() for t in args.techniques.split(","))
+    except ValueError as e:
+        ap.error(str(e))
+    _, files = collect_inputs(args.inputs)
+    start = time.perf_counter()
+    records = run_pool(transform_file, [(f, spec, args.seed, args.deobfuscate) for f in files], args.jobs)
+    verifier = BatchVerifier(args.batch_size, args.jobs, args.run_timeout)
+    verify_records(records, verifier)
+    wall = time.perf_counter() - start
+    print(summarize(records, wall, args.jobs))
+    programs = sum(2 + args.deobfuscate for r in records)
+    print(f"gcc: {verifier.gcc_calls} calls for {programs} programs "
+          f"({verifier.compile_seconds:.2f} s compiling, {verifier.run_seconds:.2f} s running)")
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump({"wall_seconds": wall, "gcc_calls": verifier.gcc_calls, "files": records}, f, indent=2)
+    sys.exit(0 if all(r["ok"] for r in records) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import sys
+import glob
+import time
+import argparse
+import tracemalloc
+from antlr4 import InputStream, CommonTokenStream
+from CMiniLexer import CMiniLexer
+from CMiniParser import CMiniParser
+from cminiAst import lower, same_tree
+from fastLexer import lex, BufferTokenSource
+from benchParsers import load_corpus
+
+
+def antlr_tokens(source):
+    return CMiniLexer(InputStream(source)).getAllTokens()
+
+
+def check(corpus):
+    failures = 0
+    for name, source in corpus:
+        reference = [(t.type, t.text, t.start, t.line, t.column) for t in antlr_tokens(source)]
+        buf = lex(source)
+        fast = []
+        for i in range(len(buf) - 1):
+            line, col = buf.position(buf.starts[i])
+            fast.append((buf.types[i], buf.text(i), buf.starts[i], line, col))
+        parsed = CMiniParser(CommonTokenStream(BufferTokenSource(buf))).program()
+        direct = CMiniParser(CommonTokenStream(CMiniLexer(InputStream(source)))).program()
+        if fast != reference or not same_tree(lower(parsed), lower(direct)):
+            failures += 1
+            print(f"MISMATCH {name}")
+    print(f"equivalence: {len(corpus) - failures}/{len(corpus)} sources lex identically")
+    return failures
+
+
+def measure_memory(fn, sources):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    kept = [fn(s) for s in sources]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    return size, kept
+
+
+def bench(corpus, repeat):
+    sources = [src for _, src in corpus]
+    tokens = sum(len(lex(s)) - 1 for s in sources)
+    times = {}
+    for label, fn in (("CMiniLexer", antlr_tokens), ("fastLexer", lex)):
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for s in sources:
+                fn(s)
+            best = min(best, time.perf_counter() - start)
+        size, _ = measure_memory(fn, sources)
+        times[label] = best
+        print(f"{label:>11}: {tokens / best:>12,.0f} tokens/sec   {size / tokens:>7.1f} bytes/token")
+    print(f"speedup: {times['CMiniLexer'] / times['fastLexer']:.1f}x")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="compare the regex bulk lexer with CMiniLexer")
+    ap.add_argument("files", nargs="*", help="defaults to input*.mc and output.mc")
+    ap.add_argument("--generated", type=int, default=50)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args(argv)
+
+    paths = args.files or sorted(glob.glob("input*.mc")) + ["output.mc"]
+    corpus = load_corpus(paths, args.generated, args.seed)
+    failures = check(corpus)
+    bench(corpus, args.repeat)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+"""Runtime cost of obfuscation, measured on the compiled programs.
+
+Every input is compiled as written, obfuscated, and obfuscated then
+cleaned, at each -O level. The runs of all variants are interleaved,
+warmup runs first, and each run's CPU time comes from os.wait4. Overhead
+is the ratio of a variant's median CPU time to the original's, with a
+bootstrap confidence interval. "startup" is the median of an empty
+program at the same level: what every run pays before main, which is
+most of the time for small inputs. Binary sizes come from the file and
+`size`, static instruction counts from `objdump -d`, and dynamic ones
+from `perf stat` where perf is installed.
+"""
+import os
+import re
+import sys
+import glob
+import json
+import math
+import random
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+from buildCache import BuildCache
+from cminiGen import generate
+from costModel import describe, parse_overhead
+from deObfuscator import deobfuscate_source, TIMEOUT_RUN
+from obfuscator import obfuscate_source, parse_spec
+from processTiming import cpu_time
+
+VARIANTS = ("original", "obfuscated", "cleaned")
+EMPTY = "int main() { return 0; }\n"
+CFLAGS = ("-include", "stdio.h")
+# gcc/glibc start-up code, not the program's own
+_RUNTIME_SYMBOLS = {"_start", "_dl_relocate_static_pie", "deregister_tm_clones", "register_tm_clones",
+                    "__do_global_dtors_aux", "frame_dummy", "_init", "_fini"}
+_SYMBOL_RE = re.compile(r"^[0-9a-f]+ <([^>]+)>:$")
+_INSN_RE = re.compile(r"^\s+[0-9a-f]+:\t\S")
+
+
+def static_instructions(exe):
+    """Instructions in the program's own functions of .text, or None
+    without objdump."""
+    if shutil.which("objdump") is None:
+        return None
+    out = subprocess.run(["objdump", "-d", "-j", ".text", "--no-show-raw-insn", exe],
+                         stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True).stdout
+    count = 0
+    counting = False
+    for line in out.splitlines():
+        m = _SYMBOL_RE.match(line)
+        if m:
+            counting = m.group(1) not in _RUNTIME_SYMBOLS
+        elif counting and _INSN_RE.match(line):
+            count += 1
+    return count
+
+
+def text_size(exe):
+    if shutil.which("size") is None:
+        return None
+    out = subprocess.run(["size", exe], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True).stdout
+    lines = out.splitlines()
+    return int(lines[1].split()[0]) if len(lines) > 1 else None
+
+
+def dynamic_instructions(exe):
+    """User-space instructions retired by one run, or None without perf
+    (or without access to its counters)."""
+    if shutil.which("perf") is None:
+        return None
+    proc = subprocess.run(["perf", "stat", "-x", ",", "-e", "instructions:u", exe],
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    for line in proc.stderr.splitlines():
+        fields = line.split(",")
+        if len(fields) > 2 and fields[2].startswith("instructions") and fields[0].isdigit():
+            return int(fields[0])
+    return None
+
+
+def bootstrap_ratio(values, reference, resamples, confidence, rng):
+    """median(values) / median(reference) and its percentile bootstrap
+    interval. A run too short for the kernel to charge it any CPU time
+    takes 0 s, so a median can be 0, and the ratio is then None. A
+    resample whose reference median is 0 counts as an infinite ratio
+    rather than being dropped, which would narrow the interval: when such
+    resamples reach a tail, that bound is inf."""
+    base = statistics.median(reference)
+    ratio = statistics.median(values) / base if base else None
+    estimates = []
+    for _ in range(resamples):
+        below = statistics.median(rng.choices(reference, k=len(reference)))
+        above = statistics.median(rng.choices(values, k=len(values)))
+        estimates.append(above / below if below else math.inf)
+    if not estimates:
+        return ratio, None, None
+    estimates.sort()
+    tail = (1 - confidence) / 2
+    n = len(estimates)
+    return ratio, estimates[int(tail * (n - 1))], estimates[int((1 - tail) * (n - 1))]
+
+
+class Builder:
+    """Compiles through a BuildCache when given one, else into a private
+    temporary directory."""
+
+    def __init__(self, build_cache=None):
+        self.build_cache = build_cache
+        self.tmp = tempfile.TemporaryDirectory(prefix="cmini-overhead-")
+        self.count = 0
+
+    def build(self, source, flags):
+        if self.build_cache is not None:
+            exe, err = self.build_cache.build(source, flags)
+        else:
+            self.count += 1
+            src = os.path.join(self.tmp.name, f"p{self.count}.c")
+            exe = os.path.join(self.tmp.name, f"p{self.count}")
+            with open(src, "w", encoding="utf-8") as f:
+                f.write(source)
+            proc = subprocess.run(["gcc", "-x", "c", *flags, src, "-o", exe],
+                                  stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+            err = proc.stderr
+            if proc.returncode != 0:
+                exe = None
+        if exe is None:
+            raise RuntimeError(f"gcc {' '.join(flags)} failed:\n{err}")
+        return exe
+
+    def close(self):
+        self.tmp.cleanup()
+
+
+def run_interleaved(exes, warmup, repeat, timeout):
+    """{key: CPU seconds of repeat runs} for {key: executable}, taking
+    turns so that drift in the machine's speed hits every key alike."""
+    times = {key: [] for key in exes}
+    for i in range(warmup + repeat):
+        for key, exe in exes.items():
+            seconds, _ = cpu_time([exe], timeout)
+            if i >= warmup:
+                times[key].append(seconds)
+    return times
+
+
+def bench_file(name, source, builder, args, rng):
+    plan = {} if args.max_overhead is not None else None
+    obfuscated = obfuscate_source(source, None, args.seed, args.spec, max_overhead=args.max_overhead, plan=plan)
+    if plan is not None:
+        print(f"{name}: {describe(plan)}")
+    texts = {"original": source, "obfuscated": obfuscated,
+             "cleaned": deobfuscate_source(obfuscated, None, args.seed)}
+    rows = []
+    for level in args.levels:
+        flags = CFLAGS + (f"-O{level}",)
+        exes = {variant: builder.build(texts[variant], flags) for variant in VARIANTS}
+        exes["startup"] = builder.build(EMPTY, flags)
+        times = run_interleaved(exes, args.warmup, args.repeat, args.timeout)
+        startup = statistics.median(times["startup"])
+        for variant in VARIANTS:
+            exe = exes[variant]
+            t = times[variant]
+            row = {"file": name, "level": f"-O{level}", "variant": variant,
+                   "median": statistics.median(t),
+                   "mad": statistics.median([abs(x - statistics.median(t)) for x in t]),
+                   "startup": startup, "samples": t,
+                   "binary_bytes": os.path.getsize(exe), "text_bytes": text_size(exe),
+                   "static_instructions": static_instructions(exe),
+                   "dynamic_instructions": dynamic_instructions(exe) if args.perf else None}
+            if variant != "original":
+                ratio, lo, hi = bootstrap_ratio(t, times["original"], args.resamples, args.confidence, rng)
+                row.update(ratio=ratio, ci_low=lo, ci_high=hi)
+            if variant == "obfuscated" and plan is not None:
+                row["estimated_overhead"] = plan["estimated_overhead"]
+            rows.append(row)
+    return rows
+
+
+def print_table(rows, confidence):
+    ci = f"{confidence:.0%} CI"
+    print(f"{'file':<20}{'opt':>5}{'variant':>12}{'cpu ms':>9}{'MAD':>7}{'startup':>9}{'overhead':>10}{ci:>17}"
+          f"{'bytes':>8}{'.text':>7}{'insns':>7}{'dyn insns':>11}")
+    for r in rows:
+        dash = lambda v: "-" if v is None else v
+        ratio = interval = ""
+        if "ratio" in r:
+            ratio = "-" if r["ratio"] is None else f"{r['ratio']:.3f}x"
+            interval = "-" if r["ci_low"] is None else f"[{r['ci_low']:.3f}, {r['ci_high']:.3f}]"
+        print(f"{r['file'][-20:]:<20}{r['level']:>5}{r['variant']:>12}{r['median'] * 1000:>9.3f}"
+              f"{r['mad'] * 1000:>7.3f}{r['startup'] * 1000:>9.3f}{ratio:>10}{interval:>17}"
+              f"{r['binary_bytes']:>8}{dash(r['text_bytes']):>7}{dash(r['static_instructions']):>7}"
+              f"{dash(r['dynamic_instructions']):>11}")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="CPU time, size and instruction counts of original, obfuscated "
+                                             "and cleaned programs")
+    ap.add_argument("files", nargs="*", help="defaults to input*.mc")
+    ap.add_argument("--generated", type=int, default=0, help="number of generated programs to add")
+    ap.add_argument("--techniques", default="1,2,3", help="comma separated technique numbers or pass names")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--levels", default="0,2", help="comma separated -O levels")
+    ap.add_argument("--warmup", type=int, default=3)
+    ap.add_argument("--repeat", type=int, default=30)
+    ap.add_argument("--timeout", type=float, default=TIMEOUT_RUN, help="seconds per run")
+    ap.add_argument("--confidence", type=float, default=0.95)
+    ap.add_argument("--resamples", type=int, default=2000, help="bootstrap resamples")
+    ap.add_argument("--max-overhead", metavar="PERCENT",
+                    help="obfuscate within this estimated overhead (see costModel.py), e.g. 5%%")
+    ap.add_argument("--perf", action="store_true", help="count retired instructions with perf stat")
+    ap.add_argument("--build-cache-dir", default=".cmini_build")
+    ap.add_argument("--no-build-cache", action="store_true")
+    ap.add_argument("--report", help="write every measurement to this JSON file")
+    args = ap.parse_args(argv)
+    try:
+        args.spec = parse_spec(t.strip() for t in args.techniques.split(","))
+    except ValueError as e:
+        ap.error(str(e))
+    args.levels = [l.strip().lstrip("O") for l in args.levels.split(",")]
+    try:
+        args.max_overhead = None if args.max_overhead is None else parse_overhead(args.max_overhead)
+    except ValueError as e:
+        ap.error(str(e))
+
+    corpus = []
+    for path in args.files or sorted(glob.glob("input*.mc")):
+        with open(path, encoding="utf-8") as f:
+            corpus.append((path, f.read()))
+    for i in range(args.generated):
+        corpus.append((f"generated-{args.seed + i}", generate(args.seed + i, functions=4, stmts_per_block=6)))
+
+    builder = Builder(None if args.no_build_cache else BuildCache(args.build_cache_dir))
+    rng = random.Random(args.seed)
+    rows = []
+    try:
+        for name, source in corpus:
+            rows += bench_file(name, source, builder, args, rng)
+    finally:
+        builder.close()
+    print_table(rows, args.confidence)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump({"warmup": args.warmup, "repeat": args.repeat, "confidence": args.confidence,
+                       "techniques": args.techniques, "seed": args.seed, "results": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
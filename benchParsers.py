@@ -0,0 +1,60 @@
+import glob
+import time
+import argparse
+from antlr4 import InputStream
+from CMiniLexer import CMiniLexer
+from cminiAst import lower
+from frontend import parse
+from prattParser import parse_program
+from cminiGen import generate
+
+
+def strip_includes(text):
+    return "".join(l for l in text.splitlines(True) if not l.strip().startswith("#include"))
+
+
+def count_tokens(source):
+    return len(CMiniLexer(InputStream(source)).getAllTokens())
+
+
+def load_corpus(paths, generated, seed):
+    corpus = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            corpus.append((path, strip_includes(f.read())))
+    for i in range(generated):
+        corpus.append((f"<generated seed={seed + i}>",
+                       generate(seed + i, functions=1 + i % 6, block_depth=1 + i % 3, expr_depth=1 + i % 5)))
+    return corpus
+
+
+def bench(corpus, repeat):
+    tokens = sum(count_tokens(src) for _, src in corpus)
+    results = {}
+    for label, fn in (("antlr", lambda s: lower(parse(s))), ("pratt", parse_program)):
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _, source in corpus:
+                fn(source)
+            best = min(best, time.perf_counter() - start)
+        results[label] = best
+        print(f"{label:>6}: {tokens} tokens in {best:.4f} s  ->  {tokens / best:,.0f} tokens/sec")
+    print(f"speedup: {results['antlr'] / results['pratt']:.1f}x")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="compare the speed of the Pratt parser and the ANTLR parser "
+                                             "(tests/test_parser_conformance.py checks they agree)")
+    ap.add_argument("files", nargs="*", help="defaults to input*.mc and output.mc")
+    ap.add_argument("--generated", type=int, default=50, help="number of generated programs to add")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args(argv)
+
+    paths = args.files or sorted(glob.glob("input*.mc")) + ["output.mc"]
+    bench(load_corpus(paths, args.generated, args.seed), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""How parsing, obfuscation and deobfuscation scale with program size.
+
+Each sweep varies one cminiGen parameter and, at every value, times the
+three stages on the same generated programs. Every measurement runs in a
+fresh process so its peak RSS is its own. The log-log slope of time
+against tokens is each stage's (and pass's) empirical scaling exponent;
+about 1 is linear, and a slope above --max-exponent fails the run.
+"""
+import sys
+import json
+import math
+import time
+import resource
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from cminiGen import generate
+from fastLexer import lex
+from frontend import parse_ast
+from obfuscator import obfuscate_source
+from deObfuscator import deobfuscate_source
+
+SWEEPS = {
+    "functions": [1, 2, 4, 8, 16, 32, 64],
+    "stmts_per_block": [2, 4, 8, 16, 32, 64],
+    "expr_depth": [1, 2, 3, 4, 5, 6, 7],
+    "block_depth": [1, 2, 3, 4, 5],
+}
+STAGES = ("parse", "obfuscate", "deobfuscate")
+# below this a stage is timer noise, not a point on its curve
+MIN_SECONDS = 1e-4
+
+
+def strip_includes(text):
+    return "".join(l for l in text.splitlines(True) if not l.strip().startswith("#include"))
+
+
+def count_tokens(source):
+    return len(lex(source)) - 1  # without EOF
+
+
+def _peak_rss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _current_rss():
+    # the high-water mark may still be that of the imports, so growth is
+    # measured from what is resident now where the platform tells us
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        return _peak_rss()
+
+
+def measure(stage, texts, repeat, seed):
+    """Child process: best-of-repeat seconds for stage over texts, the
+    per-pass seconds of one extra run, and peak RSS before and after."""
+    baseline = _current_rss()
+    passes = {}
+    if stage == "parse":
+        run = lambda text: parse_ast(strip_includes(text))
+    elif stage == "obfuscate":
+        run = lambda text: obfuscate_source(text, None, seed)
+    else:
+        run = lambda text: deobfuscate_source(text, None, seed)
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in texts:
+            run(text)
+        best = min(best, time.perf_counter() - start)
+    if stage != "parse":
+        for text in texts:
+            stats = {}
+            if stage == "obfuscate":
+                obfuscate_source(text, None, seed, stats=stats)
+                stats = {name: r["seconds"] for name, r in stats.items()}
+            else:
+                deobfuscate_source(text, None, seed, stats)
+            for name, seconds in stats.items():
+                passes[name] = passes.get(name, 0.0) + seconds
+    return best, passes, baseline, _peak_rss()
+
+
+def run_point(param, value, programs, seed, repeat):
+    sources = [generate(seed + i, **{param: value}) for i in range(programs)]
+    obfuscated = [obfuscate_source(s, None, seed) for s in sources]
+    inputs = {"parse": sources, "obfuscate": sources, "deobfuscate": obfuscated}
+    point = {"param": param, "value": value, "programs": programs,
+             "bytes": sum(len(s) for s in sources), "stages": {}}
+    # spawned, so no stage starts out with the RSS of another
+    ctx = multiprocessing.get_context("spawn")
+    for stage in STAGES:
+        texts = inputs[stage]
+        tokens = sum(count_tokens(strip_includes(t)) for t in texts)
+        with ProcessPoolExecutor(1, mp_context=ctx) as pool:
+            seconds, passes, baseline, peak = pool.submit(measure, stage, texts, repeat, seed).result()
+        point["stages"][stage] = {"tokens": tokens, "seconds": seconds,
+                                  "tokens_per_sec": tokens / seconds if seconds else None,
+                                  "peak_rss": peak, "rss_growth": peak - baseline, "passes": passes}
+    return point
+
+
+def slope(xs, ys):
+    """Least squares slope of log(y) against log(x)."""
+    pts = [(math.log(x), math.log(y)) for x, y in zip(xs, ys) if x > 0 and y >= MIN_SECONDS]
+    if len(pts) < 3:
+        return None
+    mx = sum(p[0] for p in pts) / len(pts)
+    my = sum(p[1] for p in pts) / len(pts)
+    var = sum((p[0] - mx) ** 2 for p in pts)
+    if var == 0:
+        return None
+    return sum((p[0] - mx) * (p[1] - my) for p in pts) / var
+
+
+def exponents(points):
+    """{stage or stage/pass: scaling exponent} over one sweep."""
+    out = {}
+    for stage in STAGES:
+        tokens = [p["stages"][stage]["tokens"] for p in points]
+        out[stage] = slope(tokens, [p["stages"][stage]["seconds"] for p in points])
+        names = {n for p in points for n in p["stages"][stage]["passes"]}
+        for name in sorted(names):
+            out[f"{stage}/{name}"] = slope(tokens, [p["stages"][stage]["passes"].get(name, 0.0) for p in points])
+    return out
+
+
+def print_sweep(param, points, fits):
+    print(f"\nsweep {param}")
+    print(f"{param:>16}{'stage':>13}{'tokens':>9}{'seconds':>10}{'tokens/s':>12}{'peak RSS':>11}{'growth':>9}")
+    for p in points:
+        for stage in STAGES:
+            s = p["stages"][stage]
+            print(f"{p['value']:>16}{stage:>13}{s['tokens']:>9}{s['seconds']:>10.4f}"
+                  f"{s['tokens_per_sec'] or 0:>12,.0f}{s['peak_rss'] / 2**20:>9.1f}MB{s['rss_growth'] / 2**20:>7.1f}MB")
+    print("scaling exponents (time ~ tokens^k):")
+    for name, k in fits.items():
+        print(f"  {name:<48}{'-' if k is None else f'{k:.2f}'}")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="time parse/obfuscate/deobfuscate over generated programs of growing size")
+    ap.add_argument("--sweep", action="append", choices=sorted(SWEEPS),
+                    help="generator parameter to vary (repeatable; default functions)")
+    ap.add_argument("--values", help="comma separated values, for a single --sweep")
+    ap.add_argument("--programs", type=int, default=3, help="generated programs per point")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--max-exponent", type=float, default=1.5,
+                    help="fail if a stage or pass scales worse than tokens^this")
+    ap.add_argument("--report", help="write every point and the exponents to this JSON file")
+    args = ap.parse_args(argv)
+    sweeps = args.sweep or ["functions"]
+    if args.values and len(sweeps) != 1:
+        ap.error("--values needs exactly one --sweep")
+
+    report = {"seed": args.seed, "programs": args.programs, "repeat": args.repeat, "sweeps": {}}
+    superlinear = []
+    for param in sweeps:
+        values = [int(v) for v in args.values.split(",")] if args.values else SWEEPS[param]
+        points = [run_point(param, v, args.programs, args.seed, args.repeat) for v in values]
+        fits = exponents(points)
+        print_sweep(param, points, fits)
+        report["sweeps"][param] = {"points": points, "exponents": fits}
+        superlinear += [f"{param}: {name} {k:.2f}" for name, k in fits.items()
+                        if k is not None and k > args.max_exponent]
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if superlinear:
+        print(f"\nscaling worse than tokens^{args.max_exponent}:")
+        for line in superlinear:
+            print("  " + line)
+    sys.exit(1 if superlinear else 0)
+
+
+if __name__ == "__main__":
+    main()
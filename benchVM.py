@@ -0,0 +1,105 @@
+import os
+import sys
+import glob
+import time
+import argparse
+import tempfile
+import subprocess
+from benchParsers import load_corpus
+from cminiInterp import Interpreter, MAX_STEPS
+from cminiVM import compile_program, execute
+from frontend import parse_ast
+
+
+# the grammar reads comparison chains flat and left to right; C binds the
+# relational operators tighter than == and !=
+MIXED_COMPARISONS = """int f(int x) {
+    return x == 1 < 2 != x >= 3;
+}
+int main() {
+    int a = 3;
+    printf("%d\\n", 0 == 1 < 2);
+    printf("%d %d\\n", a < 5 == 1, 2 != a > 1 == 0);
+    printf("%d %d\\n", f(0), f(4));
+    if (1 == 2 > 3) {
+        printf("wrong\\n");
+    }
+    return a == 3 < 4;
+}
+"""
+
+
+def best_of(repeat, fn):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def gcc_run(source, tmp, name):
+    """(seconds to compile, seconds to run, (exit code, stdout)) with gcc."""
+    src, exe = os.path.join(tmp, name + ".c"), os.path.join(tmp, name)
+    with open(src, "w", encoding="utf-8") as f:
+        f.write(source)
+    start = time.perf_counter()
+    subprocess.run(["gcc", "-x", "c", "-include", "stdio.h", src, "-o", exe], check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    compiled = time.perf_counter()
+    proc = subprocess.run([exe], stdout=subprocess.PIPE, text=True, timeout=10)
+    code = proc.returncode & 0xFF if proc.returncode >= 0 else proc.returncode
+    return compiled - start, time.perf_counter() - compiled, (code, proc.stdout)
+
+
+def bench(corpus, repeat, max_steps):
+    rows = []
+    failures = 0
+    with tempfile.TemporaryDirectory(prefix="cmini-benchvm-") as tmp:
+        for i, (name, source) in enumerate(corpus):
+            program = parse_ast(source)
+            t_compile, code = best_of(repeat, lambda: compile_program(program))
+            t_vm, vm = best_of(repeat, lambda: execute(code, max_steps))
+            t_tree, tree = best_of(repeat, lambda: Interpreter(program, max_steps).run())
+            t_gcc, t_run, native = gcc_run(source, tmp, f"p{i}")
+            agree = "-"
+            if vm.decided:
+                same = (vm.exit_code, vm.stdout) == (tree.exit_code, tree.stdout) == native
+                agree = "yes" if same else "NO"
+                failures += agree == "NO"
+            rows.append((name, vm.steps, t_compile, t_vm, t_tree, t_gcc + t_run, agree))
+    print(f"{'program':<28}{'instrs':>10}{'Minstr/s':>10}{'bytecode':>10}{'vm':>10}{'tree':>10}{'gcc+run':>10}  agree")
+    for name, steps, t_compile, t_vm, t_tree, t_gcc, agree in rows:
+        print(f"{name[-28:]:<28}{steps:>10}{steps / t_vm / 1e6:>10.2f}{t_compile * 1000:>8.2f}ms"
+              f"{t_vm * 1000:>8.2f}ms{t_tree * 1000:>8.2f}ms{t_gcc * 1000:>8.1f}ms  {agree}")
+    steps = sum(r[1] for r in rows)
+    vm_total = sum(r[2] + r[3] for r in rows)
+    tree_total = sum(r[4] for r in rows)
+    gcc_total = sum(r[5] for r in rows)
+    print(f"vm: {steps} instructions in {vm_total:.4f} s (bytecode compile included)  ->  "
+          f"{steps / vm_total:,.0f} instructions/sec")
+    print(f"per program: vm {vm_total / len(rows) * 1000:.2f} ms, tree interpreter "
+          f"{tree_total / len(rows) * 1000:.2f} ms, gcc compile+run {gcc_total / len(rows) * 1000:.1f} ms")
+    print(f"speedup: {gcc_total / vm_total:.0f}x over gcc compile+run, {tree_total / vm_total:.1f}x over the tree interpreter")
+    return failures
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="compare the CMini bytecode VM with the tree interpreter and gcc")
+    ap.add_argument("files", nargs="*", help="defaults to input*.mc")
+    ap.add_argument("--generated", type=int, default=20, help="number of generated programs to add")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--max-steps", type=int, default=MAX_STEPS)
+    args = ap.parse_args(argv)
+
+    paths = args.files or sorted(glob.glob("input*.mc"))
+    corpus = load_corpus(paths, args.generated, args.seed) + [("<mixed comparisons>", MIXED_COMPARISONS)]
+    failures = bench(corpus, args.repeat, args.max_steps)
+    if failures:
+        print(f"{failures} programs where the vm, the tree interpreter and gcc disagree")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
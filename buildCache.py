@@ -0,0 +1,162 @@
+import os
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+import subprocess
+
+_compiler_ids = {}
+_compiler_lock = threading.Lock()
+
+# an entry used this recently may be about to run, so eviction spares it
+_IN_USE_SECONDS = 30
+
+
+def compiler_id(compiler="gcc"):
+    """Resolved path and --version banner of compiler: what a cached binary
+    depends on besides its source and flags."""
+    with _compiler_lock:
+        if compiler not in _compiler_ids:
+            path = shutil.which(compiler)
+            if path is None:
+                raise FileNotFoundError(f"compiler {compiler!r} not found on PATH")
+            path = os.path.realpath(path)
+            banner = subprocess.run([path, "--version"], stdout=subprocess.PIPE,
+                                    stderr=subprocess.DEVNULL, text=True).stdout
+            _compiler_ids[compiler] = (path, banner.strip())
+        return _compiler_ids[compiler]
+
+
+class BuildCache:
+    """Content-addressed cache of compiled executables.
+
+    An entry is named by the sha256 of the compiler's path and version,
+    the flags and the source bytes, so an unchanged program is compiled
+    once no matter which file it was written to. Like AstCache, a hit
+    refreshes the entry's mtime and eviction removes oldest-mtime-first
+    until the cache is within max_bytes and max_entries. Compile failures
+    are not cached. Several processes may share a directory: entries are
+    written under a temporary name and renamed into place.
+    """
+
+    def __init__(self, directory=".cmini_build", max_bytes=256 * 1024 * 1024, max_entries=2048,
+                 compiler="gcc"):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.compiler = compiler
+        self.compiler_id = compiler_id(compiler)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, source, flags=()):
+        if isinstance(source, str):
+            source = source.encode("utf-8")
+        path, banner = self.compiler_id
+        h = hashlib.sha256()
+        for part in (path, banner, *flags):
+            h.update(part.encode("utf-8"))
+            h.update(b"\0")
+        h.update(b"\0")
+        h.update(source)
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def _count(self, hit):
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def lookup(self, key):
+        """Path of the executable for key, or None. Counts a hit or miss."""
+        path = self._path(key)
+        try:
+            os.utime(path)
+        except OSError:
+            self._count(False)
+            return None
+        self._count(True)
+        return path
+
+    def staging(self, key):
+        """(source path, executable path) to compile a miss into; add()
+        then moves the executable into the cache."""
+        fd, src = tempfile.mkstemp(dir=self.directory, prefix=key[:16] + "-", suffix=".c.tmp")
+        os.close(fd)
+        return src, src[:-len(".c.tmp")] + ".tmp"
+
+    def add(self, key, built):
+        path = self._path(key)
+        os.replace(built, path)
+        self.evict()
+        return path
+
+    def build(self, source, flags=()):
+        """(executable path, None) for source compiled with flags, or
+        (None, compiler stderr) when it does not compile."""
+        key = self.key(source, flags)
+        path = self.lookup(key)
+        if path is not None:
+            return path, None
+        src, exe = self.staging(key)
+        try:
+            with open(src, "wb") as f:
+                f.write(source.encode("utf-8") if isinstance(source, str) else source)
+            proc = subprocess.run([self.compiler_id[0], "-x", "c", *flags, src, "-o", exe],
+                                  stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+            if proc.returncode != 0:
+                return None, proc.stderr
+            return self.add(key, exe), None
+        finally:
+            for leftover in (src, exe):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+
+    def _entries(self):
+        entries = []
+        for e in os.scandir(self.directory):
+            if e.is_file() and not e.name.endswith(".tmp"):
+                try:
+                    st = e.stat()
+                except OSError:
+                    continue  # evicted by another process meanwhile
+                entries.append((st.st_mtime, st.st_size, e.path))
+        return entries
+
+    def evict(self):
+        entries = self._entries()
+        size = sum(e[1] for e in entries)
+        count = len(entries)
+        if size <= self.max_bytes and count <= self.max_entries:
+            return
+        entries.sort()
+        newest_allowed = time.time() - _IN_USE_SECONDS
+        for mtime, entry_size, path in entries:
+            if (size <= self.max_bytes and count <= self.max_entries) or mtime > newest_allowed:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            size -= entry_size
+            count -= 1
+            with self.lock:
+                self.evictions += 1
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return 100.0 * self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        entries = self._entries()
+        return (f"build cache: {self.hits} hits, {self.misses} misses ({self.hit_rate():.0f}% hit rate), "
+                f"{self.evictions} evictions, {len(entries)} executables, "
+                f"{sum(e[1] for e in entries)} bytes in {self.directory}")
@@ -0,0 +1,90 @@
+"""Importable obfuscate/deobfuscate for use from other programs.
+
+    from cminiApi import obfuscate, ObfuscateOptions
+    opts = ObfuscateOptions(passes=["rename", "complex_expr"], seed=7)
+    result = obfuscate(source, opts)
+    print(result.source, result.stats)
+
+Calls keep no state between them: each gets its own RNG, symbol table and
+pass instances, so any number of threads may call these functions at once
+and options objects may be shared. The parsers, the compiled rewrite rules
+and (optionally) an AstCache are the only things calls share.
+"""
+import time
+from obfuscator import parse_spec, obfuscate_source, TECHNIQUES
+from deObfuscator import deobfuscate_source
+
+
+class ObfuscateOptions:
+    """passes: names, technique numbers or {"name": ..., option: value}
+    dicts, as in a --config file (default: all techniques). seed makes
+    the output reproducible; key names functions consistently across
+    files (see RenamePass). stats measures each pass, which runs them as
+    separate walks; trace adds tracemalloc allocation counts, but tracing
+    is process-wide, so only use it when no other call is running.
+    max_overhead (a fraction) limits dead_code and complex_expr to the
+    sites costModel.plan_sites fits into that much estimated run time."""
+    __slots__ = ("spec", "seed", "stats", "trace", "cache", "max_overhead")
+
+    def __init__(self, passes=None, seed=None, key=None, stats=False, trace=False, cache=None,
+                 max_overhead=None):
+        spec = parse_spec(TECHNIQUES.values() if passes is None else passes)
+        if key is not None:
+            spec = [(name, dict(options, key=key)) if name == "rename" else (name, options)
+                    for name, options in spec]
+        self.spec = spec
+        self.seed = seed
+        self.stats = stats or trace
+        self.trace = trace
+        self.cache = cache
+        self.max_overhead = max_overhead
+
+
+class DeobfuscateOptions:
+    __slots__ = ("seed", "max_rounds", "cache")
+
+    def __init__(self, seed=None, max_rounds=8, cache=None):
+        self.seed = seed
+        self.max_rounds = max_rounds
+        self.cache = cache
+
+
+class Result:
+    """source: the transformed program. stats: pass name -> measurements
+    (obfuscate, when asked for: seconds, visited, rewritten and maybe
+    allocations; deobfuscate: seconds and changes). seconds: wall time.
+    converged: for deobfuscate, whether the passes reached a fixpoint
+    within max_rounds; None for obfuscate."""
+    __slots__ = ("source", "stats", "seconds", "converged")
+
+    def __init__(self, source, stats, seconds, converged=None):
+        self.source = source
+        self.stats = stats
+        self.seconds = seconds
+        self.converged = converged
+
+    def __repr__(self):
+        return f"Result({len(self.source)} chars, {self.seconds * 1000:.2f} ms)"
+
+
+_DEFAULT_OBFUSCATE = ObfuscateOptions()
+_DEFAULT_DEOBFUSCATE = DeobfuscateOptions()
+
+
+def obfuscate(source, options=None):
+    options = options or _DEFAULT_OBFUSCATE
+    start = time.perf_counter()
+    stats = {} if options.stats else None
+    text = obfuscate_source(source, options.cache, options.seed, options.spec, stats, options.trace,
+                            options.max_overhead)
+    return Result(text, stats or {}, time.perf_counter() - start)
+
+
+def deobfuscate(source, options=None):
+    options = options or _DEFAULT_DEOBFUSCATE
+    start = time.perf_counter()
+    timings, changes, convergence = {}, {}, {}
+    text = deobfuscate_source(source, options.cache, options.seed, timings, options.max_rounds, changes,
+                              convergence)
+    stats = {name: {"seconds": sec, "changes": changes.get(name, 0)} for name, sec in timings.items()}
+    return Result(text, stats, time.perf_counter() - start, convergence["converged"])
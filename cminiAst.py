@@ -0,0 +1,616 @@
+import sys
+from antlr4.tree.Tree import TerminalNode, ErrorNode
+from CMiniParser import CMiniParser
+
+
+class Node:
+    __slots__ = ()
+    _children = ()
+
+    def __repr__(self):
+        fields = ", ".join(f"{s}={getattr(self, s)!r}" for s in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+class Program(Node):
+    __slots__ = ("functions",)
+    _children = ("functions",)
+
+    def __init__(self, functions):
+        self.functions = functions
+
+
+class FunctionDecl(Node):
+    __slots__ = ("ret_type", "name", "params", "body")
+    _children = ("params", "body")
+
+    def __init__(self, ret_type, name, params, body):
+        self.ret_type = ret_type
+        self.name = name
+        self.params = params
+        self.body = body
+
+
+class Param(Node):
+    __slots__ = ("type", "name")
+
+    def __init__(self, type, name):
+        self.type = type
+        self.name = name
+
+
+class Block(Node):
+    __slots__ = ("items",)
+    _children = ("items",)
+
+    def __init__(self, items):
+        self.items = items
+
+
+class VarDecl(Node):
+    __slots__ = ("type", "name", "init")
+    _children = ("init",)
+
+    def __init__(self, type, name, init=None):
+        self.type = type
+        self.name = name
+        self.init = init
+
+
+class If(Node):
+    __slots__ = ("cond", "then", "orelse")
+    _children = ("cond", "then", "orelse")
+
+    def __init__(self, cond, then, orelse=None):
+        self.cond = cond
+        self.then = then
+        self.orelse = orelse
+
+
+class While(Node):
+    __slots__ = ("cond", "body")
+    _children = ("cond", "body")
+
+    def __init__(self, cond, body):
+        self.cond = cond
+        self.body = body
+
+
+class Return(Node):
+    __slots__ = ("value",)
+    _children = ("value",)
+
+    def __init__(self, value=None):
+        self.value = value
+
+
+class Printf(Node):
+    __slots__ = ("fmt", "args")
+    _children = ("args",)
+
+    def __init__(self, fmt, args):
+        self.fmt = fmt
+        self.args = args
+
+
+class ExprStmt(Node):
+    __slots__ = ("expr",)
+    _children = ("expr",)
+
+    def __init__(self, expr):
+        self.expr = expr
+
+
+class BinOp(Node):
+    __slots__ = ("op", "left", "right")
+    _children = ("left", "right")
+
+    def __init__(self, op, left, right):
+        self.op = op
+        self.left = left
+        self.right = right
+
+
+class Assign(Node):
+    __slots__ = ("name", "value")
+    _children = ("value",)
+
+    def __init__(self, name, value):
+        self.name = name
+        self.value = value
+
+
+class Call(Node):
+    __slots__ = ("name", "args")
+    _children = ("args",)
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+
+class Name(Node):
+    __slots__ = ("id",)
+
+    def __init__(self, id):
+        self.id = id
+
+
+class Num(Node):
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+
+class Paren(Node):
+    __slots__ = ("expr",)
+    _children = ("expr",)
+
+    def __init__(self, expr):
+        self.expr = expr
+
+
+class Neg(Node):
+    # not in CMini.g4: the obfuscator emits (-1*-(x)), which the ANTLR
+    # parser only accepts by turning each '-' into an error node
+    __slots__ = ("operand",)
+    _children = ("operand",)
+
+    def __init__(self, operand):
+        self.operand = operand
+
+
+# ---------------------------------------------------------------- lowering
+
+_intern = sys.intern
+
+
+def _ident(terminal):
+    return _intern(terminal.getText())
+
+
+def lower(program_ctx):
+    return Program([_lower_function(f) for f in program_ctx.functionDecl()])
+
+
+def _lower_function(ctx):
+    params = []
+    if ctx.params() is not None:
+        params = [Param(p.type_().getText(), _ident(p.ID())) for p in ctx.params().param()]
+    return FunctionDecl(ctx.type_().getText(), _ident(ctx.ID()), params, _lower_block(ctx.block()))
+
+
+def _lower_block(ctx):
+    items = []
+    for child in ctx.getChildren():
+        if isinstance(child, CMiniParser.VarDeclContext):
+            init = _lower_expr(child.expr()) if child.expr() is not None else None
+            items.append(VarDecl(child.type_().getText(), _ident(child.ID()), init))
+        elif isinstance(child, CMiniParser.StatementContext):
+            items.append(_lower_statement(child))
+    return Block(items)
+
+
+def _lower_statement(ctx):
+    if ctx.block() is not None:
+        return _lower_block(ctx.block())
+    first = ctx.getChild(0).getText()
+    if first == "if":
+        stmts = ctx.statement()
+        orelse = _lower_statement(stmts[1]) if len(stmts) > 1 else None
+        return If(_lower_expr(ctx.expr(0)), _lower_statement(stmts[0]), orelse)
+    if first == "while":
+        return While(_lower_expr(ctx.expr(0)), _lower_statement(ctx.statement(0)))
+    if first == "return":
+        value = ctx.expr(0)
+        return Return(_lower_expr(value) if value is not None else None)
+    if first == "printf":
+        return Printf(ctx.STRING().getText(), [_lower_expr(e) for e in ctx.expr()])
+    return ExprStmt(_lower_expr(ctx.expr(0)))
+
+
+def _stray_minus_before(ctx):
+    # recovery sometimes leaves the '-' on the enclosing rule instead of the
+    # expr itself; a run that starts an enclosing expr is counted by that expr
+    parent = ctx.parentCtx
+    if parent is None:
+        return 0
+    siblings = parent.children
+    j = siblings.index(ctx) - 1
+    count = 0
+    while j >= 0 and isinstance(siblings[j], ErrorNode):
+        if siblings[j].getText() == "-":
+            count += 1
+        j -= 1
+    if j < 0:
+        if isinstance(parent, CMiniParser.ArgsContext):
+            return count + _stray_minus_before(parent)
+        if isinstance(parent, CMiniParser.ExprContext):
+            return 0
+    return count
+
+
+def _lower_expr(ctx):
+    children = list(ctx.getChildren())
+    negations = _stray_minus_before(ctx)
+    while children and isinstance(children[0], ErrorNode):
+        if children[0].getText() == "-":
+            negations += 1
+        children.pop(0)
+    children = [c for c in children if not isinstance(c, ErrorNode)]
+    if not children:
+        raise ValueError(f"line {ctx.start.line}:{ctx.start.column} malformed expression")
+
+    first = children[0]
+    if ctx.op is not None:
+        node = BinOp(ctx.op.text, _lower_expr(children[0]), _lower_expr(children[2]))
+    elif isinstance(first, TerminalNode):
+        ttype = first.symbol.type
+        if ttype == CMiniParser.ID:
+            if len(children) == 1:
+                node = Name(_ident(first))
+            elif children[1].getText() == "=":
+                node = Assign(_ident(first), _lower_expr(children[2]))
+            else:
+                args = ctx.args()
+                node = Call(_ident(first), [_lower_expr(a) for a in args.expr()] if args is not None else [])
+        elif ttype == CMiniParser.INT:
+            node = Num(first.getText())
+        else:
+            node = Paren(_lower_expr(children[1]))
+    else:
+        node = _lower_expr(first)
+    for _ in range(negations):
+        node = Neg(node)
+    return node
+
+
+def same_tree(a, b):
+    pairs = [(a, b)]
+    while pairs:
+        a, b = pairs.pop()
+        if type(a) is not type(b):
+            return False
+        if type(a) is list:
+            if len(a) != len(b):
+                return False
+            pairs.extend(zip(a, b))
+        elif isinstance(a, Node):
+            pairs.extend((getattr(a, s), getattr(b, s)) for s in a.__slots__)
+        elif a != b:
+            return False
+    return True
+
+
+# ---------------------------------------------------------------- walking
+
+class _Dispatch:
+    __slots__ = ("enters", "has_exit", "by_listener", "children")
+
+
+def _dispatch_table(listeners):
+    """Node class -> the enter/exit methods the listeners define for it,
+    looked up once per walk instead of once per node."""
+    table = {}
+    pending = [Node]
+    while pending:
+        cls = pending.pop()
+        pending.extend(cls.__subclasses__())
+        name = cls.__name__
+        entry = _Dispatch()
+        entry.enters = tuple(f for f in (getattr(l, "enter" + name, None) for l in listeners)
+                             if f is not None)
+        entry.by_listener = tuple(getattr(l, "exit" + name, None) for l in listeners)
+        entry.has_exit = any(f is not None for f in entry.by_listener)
+        entry.children = tuple(reversed(cls._children))
+        table[cls] = entry
+    return table
+
+
+def walk_many(listeners, node):
+    """Visit node depth-first once for all listeners, calling each one's
+    enterX before the children and exitX after them, in listener order.
+
+    An exit method may return a new node, which takes the visited node's
+    place in its parent; later listeners get the new node's exit method.
+    The walk keeps its own stack, so nesting depth is not limited by the
+    interpreter's recursion limit. Returns the (possibly replaced) root.
+    """
+    table = _dispatch_table(listeners)
+    root = node
+    # (node, container, key, entry); entry is None until the node is entered
+    stack = [(node, None, None, None)]
+    pop = stack.pop
+    push = stack.append
+    while stack:
+        node, container, key, entry = pop()
+        if entry is None:
+            entry = table[type(node)]
+            for enter in entry.enters:
+                enter(node)
+            if entry.has_exit:
+                push((node, container, key, entry))
+            for field in entry.children:
+                value = getattr(node, field)
+                if value is None:
+                    continue
+                if type(value) is list:
+                    for i in range(len(value) - 1, -1, -1):
+                        push((value[i], value, i, None))
+                else:
+                    push((value, node, field, None))
+            continue
+        new = node
+        by_listener = entry.by_listener
+        for i in range(len(by_listener)):
+            exit_ = by_listener[i]
+            if exit_ is None:
+                continue
+            replaced = exit_(new)
+            if replaced is not None and replaced is not new:
+                new = replaced
+                # the rest of the listeners see the replacement's type
+                by_listener = table[type(new)].by_listener
+        if new is not node:
+            if container is None:
+                root = new
+            elif type(container) is list:
+                container[key] = new
+            else:
+                setattr(container, key, new)
+    return root
+
+
+def walk(listener, node):
+    """Visit node depth-first, calling listener.enterX / listener.exitX.
+
+    An exit method may return a new node, which takes the visited node's
+    place in its parent.
+    """
+    return walk_many((listener,), node)
+
+
+def iter_nodes(node):
+    """Every node under node (inclusive), preorder, without recursion."""
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        yield node
+        for field in reversed(node._children):
+            value = getattr(node, field)
+            if value is None:
+                continue
+            if type(value) is list:
+                stack.extend(reversed(value))
+            else:
+                stack.append(value)
+
+
+def tree_depth(node):
+    """Nodes on the longest path from node down to a leaf, without
+    recursion."""
+    deepest = 0
+    stack = [(node, 1)]
+    while stack:
+        node, depth = stack.pop()
+        if depth > deepest:
+            deepest = depth
+        for field in node._children:
+            value = getattr(node, field)
+            if value is None:
+                continue
+            if type(value) is list:
+                stack.extend((v, depth + 1) for v in value)
+            else:
+                stack.append((value, depth + 1))
+    return deepest
+
+
+# ---------------------------------------------------------------- printing
+
+INDENT = "    "
+
+_PRECEDENCE = {
+    "==": 1, "!=": 1, "<": 1, ">": 1, "<=": 1, ">=": 1,
+    "+": 2, "-": 2,
+    "*": 3, "/": 3,
+}
+
+
+def _prec(node):
+    t = type(node)
+    if t is BinOp:
+        return _PRECEDENCE[node.op]
+    if t is Assign:
+        return 0
+    if t is Neg:
+        return 4
+    return 5
+
+
+def _wrap(text, node, parent_prec, strict):
+    p = _prec(node)
+    if p < parent_prec or (strict and p == parent_prec):
+        return f"({text})"
+    return text
+
+
+_EQUALITY = ("==", "!=")
+_RELATIONAL = ("<", ">", "<=", ">=")
+
+
+def reassociate_comparisons(node):
+    """The tree C reads for a comparison chain. The grammar and this
+    printer keep all comparisons at one level, left-associative, so
+    a == b < c is BinOp(<, BinOp(==, a, b), c); C binds < tighter and
+    compiles a == (b < c). For a BinOp heading a chain that mixes the two
+    kinds, returns a new tree grouping each run of relational operators
+    in a Paren, which prints back to the same C; any other node is
+    returned as it is. The operands stay the same nodes, in order."""
+    ops = []
+    operands = []
+    head = node
+    while type(head) is BinOp and (head.op in _EQUALITY or head.op in _RELATIONAL):
+        ops.append(head.op)
+        operands.append(head.right)
+        head = head.left
+    if not any(op in _EQUALITY for op in ops) or not any(op in _RELATIONAL for op in ops):
+        return node
+    ops.reverse()
+    operands.append(head)
+    operands.reverse()
+    # terms of the equality chain, each a run of relational operators
+    terms = [operands[0]]
+    for op, operand in zip(ops, operands[1:]):
+        if op in _RELATIONAL:
+            terms[-1] = BinOp(op, terms[-1], operand)
+        else:
+            terms.append(operand)
+    terms = [Paren(t) if type(t) is BinOp and t.op in _RELATIONAL else t for t in terms]
+    out = terms[0]
+    for op, term in zip((op for op in ops if op in _EQUALITY), terms[1:]):
+        out = BinOp(op, out, term)
+    return out
+
+
+def expr_to_source(node):
+    """Text of an expression, parenthesised by precedence. Builds the text
+    bottom-up on an explicit stack, so deep expressions do not recurse."""
+    out = []
+    # (node, False) is expanded into its operands; (node, True) combines
+    # the operands' text, which by then is on top of out
+    stack = [(node, False)]
+    while stack:
+        node, ready = stack.pop()
+        t = type(node)
+        if t is Name:
+            out.append(node.id)
+            continue
+        if t is Num:
+            out.append(node.value)
+            continue
+        if not ready:
+            stack.append((node, True))
+            if t is BinOp:
+                stack.append((node.right, False))
+                stack.append((node.left, False))
+            elif t is Paren:
+                stack.append((node.expr, False))
+            elif t is Neg:
+                stack.append((node.operand, False))
+            elif t is Assign:
+                stack.append((node.value, False))
+            elif t is Call:
+                stack.extend((a, False) for a in reversed(node.args))
+            else:
+                raise TypeError(f"not an expression: {node!r}")
+            continue
+        if t is BinOp:
+            p = _PRECEDENCE[node.op]
+            right = _wrap(out.pop(), node.right, p, True)
+            left = _wrap(out.pop(), node.left, p, False)
+            out.append(f"{left} {node.op} {right}")
+        elif t is Paren:
+            out.append(f"({out.pop()})")
+        elif t is Neg:
+            operand = out.pop()
+            if _prec(node.operand) < 4:
+                operand = f"({operand})"
+            elif operand.startswith("-"):
+                operand = " " + operand
+            out.append(f"-{operand}")
+        elif t is Assign:
+            out.append(f"{node.name} = {out.pop()}")
+        else:
+            n = len(node.args)
+            args = out[len(out) - n:] if n else []
+            del out[len(out) - n:]
+            out.append(f"{node.name}({', '.join(args)})")
+    return out[0]
+
+
+class _Printer:
+    """Statement printer. Nested statements go through an explicit stack of
+    pending work: ("stmt", node, level, lead), ("line", text) or ("else",
+    if_node, level), so deep nesting does not recurse."""
+
+    def __init__(self):
+        self.lines = []
+
+    def function(self, f):
+        params = ", ".join(f"{p.type} {p.name}" for p in f.params)
+        self.lines.append(f"{f.ret_type} {f.name}({params}) {{")
+        stack = [("line", "}")]
+        self.items(f.body.items, 1, stack)
+        self.run(stack)
+
+    def items(self, items, level, stack):
+        stack.extend(("stmt", item, level, "") for item in reversed(items))
+
+    def suite(self, head, body, level, stack):
+        pad = INDENT * level
+        if type(body) is Block:
+            self.lines.append(f"{pad}{head} {{")
+            stack.append(("line", pad + "}"))
+            self.items(body.items, level + 1, stack)
+        else:
+            self.lines.append(pad + head)
+            stack.append(("stmt", body, level + 1, ""))
+
+    def run(self, stack):
+        lines = self.lines
+        while stack:
+            task = stack.pop()
+            what = task[0]
+            if what == "line":
+                lines.append(task[1])
+                continue
+            if what == "else":
+                _, node, level = task
+                lead = "else "
+                if type(node.then) is Block:
+                    lines.pop()
+                    lead = "} else "
+                if type(node.orelse) is If:
+                    stack.append(("stmt", node.orelse, level, lead))
+                else:
+                    self.suite(lead.rstrip(), node.orelse, level, stack)
+                continue
+            _, node, level, lead = task
+            pad = INDENT * level
+            t = type(node)
+            if t is VarDecl:
+                if node.init is None:
+                    lines.append(f"{pad}{node.type} {node.name};")
+                else:
+                    lines.append(f"{pad}{node.type} {node.name} = {expr_to_source(node.init)};")
+            elif t is Block:
+                lines.append(pad + "{")
+                stack.append(("line", pad + "}"))
+                self.items(node.items, level + 1, stack)
+            elif t is If:
+                if node.orelse is not None:
+                    stack.append(("else", node, level))
+                self.suite(f"{lead}if ({expr_to_source(node.cond)})", node.then, level, stack)
+            elif t is While:
+                self.suite(f"while ({expr_to_source(node.cond)})", node.body, level, stack)
+            elif t is Return:
+                if node.value is None:
+                    lines.append(pad + "return;")
+                else:
+                    lines.append(f"{pad}return {expr_to_source(node.value)};")
+            elif t is Printf:
+                args = "".join(", " + expr_to_source(a) for a in node.args)
+                lines.append(f"{pad}printf({node.fmt}{args});")
+            elif t is ExprStmt:
+                lines.append(f"{pad}{expr_to_source(node.expr)};")
+            else:
+                raise TypeError(f"not a statement: {node!r}")
+
+
+def to_source(program):
+    printer = _Printer()
+    for f in program.functions:
+        printer.function(f)
+    return "\n".join(printer.lines) + "\n"
@@ -0,0 +1,118 @@
+"""Thin client for cminiDaemon.py. Imports nothing but the standard
+library, so it starts in a fraction of the time the tools themselves take."""
+import os
+import sys
+import json
+import socket
+import argparse
+import urllib.error
+import urllib.request
+
+DEFAULT_SOCKET = f"/tmp/cmini-{os.getuid()}.sock"
+
+
+class Client:
+    """One connection to the daemon; requests on it are sent one at a time."""
+
+    def __init__(self, socket_path=DEFAULT_SOCKET, http=None, timeout=60):
+        self.http = http.rstrip("/") if http else None
+        self.timeout = timeout
+        self.sock = None
+        if self.http is None:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.settimeout(timeout)
+            self.sock.connect(socket_path)
+            self.reader = self.sock.makefile("rb")
+
+    def request(self, op, **fields):
+        if self.http is not None:
+            return self._http(op, fields)
+        fields["op"] = op
+        self.sock.sendall(json.dumps(fields).encode("utf-8") + b"\n")
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError("daemon closed the connection")
+        return json.loads(line)
+
+    def _http(self, op, fields):
+        data = json.dumps(fields).encode("utf-8") if fields else None
+        req = urllib.request.Request(f"{self.http}/{op}", data=data,
+                                     headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                return json.load(resp)
+        except urllib.error.HTTPError as e:
+            # busy and bad requests still carry a JSON body
+            return json.load(e)
+
+    def close(self):
+        if self.sock is not None:
+            self.reader.close()
+            self.sock.close()
+
+
+def _read(path):
+    if path == "-":
+        return sys.stdin.read()
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="send a request to a running cminiDaemon.py")
+    ap.add_argument("--socket", default=DEFAULT_SOCKET)
+    ap.add_argument("--http", metavar="URL", help="e.g. http://127.0.0.1:8765 for a daemon started with --http")
+    sub = ap.add_subparsers(dest="op", required=True)
+    ob = sub.add_parser("obfuscate")
+    ob.add_argument("file", help="CMini source, or - for stdin")
+    ob.add_argument("-o", "--output", help="write the result here instead of stdout")
+    ob.add_argument("--passes", help="comma separated pass names or technique numbers")
+    ob.add_argument("--seed", type=int)
+    ob.add_argument("--key")
+    de = sub.add_parser("deobfuscate")
+    de.add_argument("file")
+    de.add_argument("-o", "--output")
+    de.add_argument("--seed", type=int)
+    de.add_argument("--max-rounds", type=int, default=8)
+    ve = sub.add_parser("verify", help="compile and run two programs and compare their output")
+    ve.add_argument("original")
+    ve.add_argument("transformed")
+    sub.add_parser("stats", help="latency histograms and counters")
+    sub.add_parser("ping")
+    sub.add_parser("shutdown")
+    args = ap.parse_args(argv)
+
+    fields = {}
+    if args.op == "obfuscate":
+        fields = {"source": _read(args.file), "seed": args.seed, "key": args.key}
+        if args.passes:
+            fields["passes"] = [p.strip() for p in args.passes.split(",")]
+    elif args.op == "deobfuscate":
+        fields = {"source": _read(args.file), "seed": args.seed, "max_rounds": args.max_rounds}
+    elif args.op == "verify":
+        fields = {"original": _read(args.original), "transformed": _read(args.transformed)}
+
+    client = Client(args.socket, args.http)
+    try:
+        response = client.request(args.op, **fields)
+    finally:
+        client.close()
+
+    if not response.get("ok"):
+        print(json.dumps(response.get("error"), indent=2), file=sys.stderr)
+        sys.exit(1)
+    if args.op in ("obfuscate", "deobfuscate"):
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                f.write(response["source"])
+        else:
+            sys.stdout.write(response["source"])
+    elif args.op == "verify":
+        print("outputs match" if response["equal"] else "outputs differ")
+        sys.exit(0 if response["equal"] else 1)
+    elif args.op == "stats":
+        print(json.dumps(response, indent=2))
+
+
+if __name__ == "__main__":
+    main()
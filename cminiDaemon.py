@@ -0,0 +1,274 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import socketserver
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from astCache import AstCache
+from batchRunner import error_record
+from buildCache import BuildCache
+from cminiApi import obfuscate, deobfuscate, ObfuscateOptions, DeobfuscateOptions
+from deObfuscator import verify_sources
+from frontend import parse, parse_ast
+
+DEFAULT_SOCKET = f"/tmp/cmini-{os.getuid()}.sock"
+
+# exercises every parser rule once, so the first real request finds the
+# ATNs deserialized and the DFA cache populated
+_WARMUP = """int add(int a, int b) {
+    return a + b;
+}
+void show(int x) {
+    printf("%d\\n", x);
+}
+int main() {
+    int i = 0;
+    while (i < 3) {
+        if (i == 1) {
+            show(add(i, (2)));
+        } else {
+            i = i - 1;
+        }
+        i = i + 1;
+    }
+    return i * 2 / 1;
+}
+"""
+
+
+class LatencyHistogram:
+    """Latencies in power-of-two microsecond buckets: bucket k counts
+    requests that took [2^k, 2^(k+1)) us. Percentiles are bucket bounds."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = [0] * 40
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        us = max(int(seconds * 1e6), 1)
+        with self.lock:
+            self.buckets[min(us.bit_length() - 1, len(self.buckets) - 1)] += 1
+            self.count += 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+
+    def percentile(self, q):
+        with self.lock:
+            target = self.count * q / 100.0
+            seen = 0
+            for k, n in enumerate(self.buckets):
+                seen += n
+                if n and seen >= target:
+                    return (1 << (k + 1)) / 1e6
+        return 0.0
+
+    def snapshot(self):
+        with self.lock:
+            buckets = {f"<{(1 << (k + 1)) / 1000:g}ms": n for k, n in enumerate(self.buckets) if n}
+            count, total, peak = self.count, self.total, self.max
+        return {"count": count, "mean_ms": total / count * 1000 if count else 0.0,
+                "max_ms": peak * 1000, "p50_ms": self.percentile(50) * 1000,
+                "p95_ms": self.percentile(95) * 1000, "p99_ms": self.percentile(99) * 1000,
+                "buckets": buckets}
+
+
+class Service:
+    """Runs requests with at most max_concurrent at a time. Up to
+    max_pending more wait for a slot; beyond that a request is refused at
+    once with a "busy" error instead of queueing without bound."""
+
+    def __init__(self, max_concurrent=4, max_pending=16, cache=None, build_cache=None):
+        self.slots = threading.BoundedSemaphore(max_concurrent)
+        self.admission = threading.BoundedSemaphore(max_concurrent + max_pending)
+        self.cache = cache
+        self.build_cache = build_cache
+        self.ops = {"obfuscate": self.obfuscate, "deobfuscate": self.deobfuscate, "verify": self.verify}
+        self.histograms = {op: LatencyHistogram() for op in self.ops}
+        self.lock = threading.Lock()
+        self.rejected = 0
+        self.failed = 0
+        self.started = time.time()
+        self.stop = None  # set by serve() to shut the server down
+
+    def warm_up(self):
+        start = time.perf_counter()
+        parse(_WARMUP)
+        for _ in range(3):
+            deobfuscate(obfuscate(_WARMUP).source)
+        parse_ast(_WARMUP)
+        return time.perf_counter() - start
+
+    def obfuscate(self, req):
+        options = ObfuscateOptions(passes=req.get("passes"), seed=req.get("seed"),
+                                   key=req.get("key"), stats=req.get("stats", False), cache=self.cache)
+        result = obfuscate(req["source"], options)
+        return {"source": result.source, "stats": result.stats}
+
+    def deobfuscate(self, req):
+        options = DeobfuscateOptions(seed=req.get("seed"), max_rounds=req.get("max_rounds", 8),
+                                     cache=self.cache)
+        result = deobfuscate(req["source"], options)
+        return {"source": result.source, "stats": result.stats, "converged": result.converged}
+
+    def verify(self, req):
+        return verify_sources(req["original"], req["transformed"], self.build_cache)
+
+    def stats(self):
+        with self.lock:
+            rejected, failed = self.rejected, self.failed
+        stats = {"ok": True, "uptime_s": time.time() - self.started, "rejected": rejected,
+                 "failed": failed, "latency": {op: h.snapshot() for op, h in self.histograms.items()}}
+        if self.build_cache is not None:
+            stats["build_cache"] = {"hits": self.build_cache.hits, "misses": self.build_cache.misses,
+                                    "hit_rate": self.build_cache.hit_rate(),
+                                    "evictions": self.build_cache.evictions}
+        return stats
+
+    def handle(self, req):
+        """Request dict -> (status, response dict); status is an HTTP code."""
+        op = req.get("op") if isinstance(req, dict) else None
+        if op == "ping":
+            return 200, {"ok": True}
+        if op == "stats":
+            return 200, self.stats()
+        if op == "shutdown":
+            if self.stop is not None:
+                threading.Thread(target=self.stop, daemon=True).start()
+            return 200, {"ok": True}
+        if op not in self.ops:
+            return 400, {"ok": False, "error": {"stage": "request", "type": "BadRequest",
+                                                "message": f"unknown op {op!r}"}}
+        arrived = time.perf_counter()
+        if not self.admission.acquire(blocking=False):
+            with self.lock:
+                self.rejected += 1
+            return 503, {"ok": False, "error": {"stage": "admission", "type": "Busy",
+                                                "message": "too many requests in flight, retry later"}}
+        try:
+            with self.slots:
+                response = self.ops[op](req)
+            response["ok"] = True
+            status = 200
+        except Exception as e:
+            with self.lock:
+                self.failed += 1
+            response = {"ok": False, "error": error_record(e, op)}
+            status = 400 if isinstance(e, (KeyError, ValueError, TypeError)) else 500
+        finally:
+            self.admission.release()
+        # queueing for a slot counts: it is what the client waited for
+        self.histograms[op].add(time.perf_counter() - arrived)
+        response["seconds"] = time.perf_counter() - arrived
+        return status, response
+
+
+class _LineHandler(socketserver.StreamRequestHandler):
+    # one JSON request per line, answered by one JSON line, any number per connection
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                req = json.loads(line)
+            except ValueError as e:
+                status, response = 400, {"ok": False, "error": error_record(e, "request")}
+            else:
+                status, response = self.server.service.handle(req)
+            self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+
+class _UnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+class _HttpHandler(BaseHTTPRequestHandler):
+    # POST /<op> with the request as the JSON body; GET /stats
+    protocol_version = "HTTP/1.1"
+
+    def _reply(self, status, response):
+        body = json.dumps(response).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if status == 503:
+            self.send_header("Retry-After", "1")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._reply(*self.server.service.handle({"op": self.path.strip("/")}))
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            req = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError as e:
+            self._reply(400, {"ok": False, "error": error_record(e, "request")})
+            return
+        if not isinstance(req, dict):
+            self._reply(400, {"ok": False, "error": {"stage": "request", "type": "BadRequest",
+                                                     "message": "the body must be a JSON object"}})
+            return
+        req["op"] = self.path.strip("/")
+        self._reply(*self.server.service.handle(req))
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _HttpServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+
+def serve(service, socket_path=None, http=None):
+    if http:
+        host, _, port = http.rpartition(":")
+        server = _HttpServer((host or "127.0.0.1", int(port)), _HttpHandler)
+        where = f"http://{host or '127.0.0.1'}:{server.server_address[1]}"
+    else:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)  # left behind by a daemon that did not exit cleanly
+        server = _UnixServer(socket_path, _LineHandler)
+        os.chmod(socket_path, 0o600)
+        where = socket_path
+    server.service = service
+    service.stop = server.shutdown
+    print(f"cmini daemon listening on {where}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if not http and os.path.exists(socket_path):
+            os.remove(socket_path)
+    print(json.dumps(service.stats()["latency"], indent=2))
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="keep the CMini tools warm and serve requests over a local socket")
+    ap.add_argument("--socket", default=DEFAULT_SOCKET, help="Unix socket path (default %(default)s)")
+    ap.add_argument("--http", metavar="[HOST:]PORT", help="serve HTTP on localhost instead of a Unix socket")
+    ap.add_argument("--max-concurrent", type=int, default=os.cpu_count(), help="requests worked on at once")
+    ap.add_argument("--max-pending", type=int, default=64, help="requests allowed to wait for a slot")
+    ap.add_argument("--cache-dir", help="share an AST/output cache on disk between requests")
+    ap.add_argument("--build-cache-dir", help="reuse compiled executables across verify requests")
+    args = ap.parse_args(argv)
+    if args.http and ":" not in args.http:
+        args.http = "127.0.0.1:" + args.http
+
+    service = Service(args.max_concurrent, args.max_pending,
+                      AstCache(args.cache_dir) if args.cache_dir else None,
+                      BuildCache(args.build_cache_dir) if args.build_cache_dir else None)
+    print(f"warmed up in {service.warm_up() * 1000:.0f} ms", file=sys.stderr)
+    serve(service, args.socket, args.http)
+
+
+if __name__ == "__main__":
+    main()
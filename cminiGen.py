@@ -0,0 +1,171 @@
+import random
+import argparse
+from cminiAst import (Program, FunctionDecl, Param, Block, VarDecl, If, While, Return, Printf,
+                      ExprStmt, BinOp, Assign, Call, Name, Num, Paren, to_source)
+
+_ARITH = ("+", "-", "*", "/")
+_COMPARE = ("==", "!=", "<", ">", "<=", ">=")
+
+
+class ProgramGenerator:
+    """Seeded generator of valid CMini programs.
+
+    Programs always terminate: loops count a private counter up to a small
+    constant, functions only call functions defined before them, and a
+    call is only placed where the callee's estimated step count still fits
+    the caller's budget. Division is only by non-zero constants.
+
+    Only main prints. C leaves the order of operands and arguments
+    unspecified, and calls appear in both, so a function with output
+    would make the program's output depend on the compiler.
+    """
+
+    def __init__(self, seed=0, functions=3, block_depth=2, expr_depth=3,
+                 var_density=0.4, call_density=0.15, stmts_per_block=4, step_budget=20000):
+        self.rng = random.Random(seed)
+        self.functions = functions
+        self.block_depth = block_depth
+        self.expr_depth = expr_depth
+        self.var_density = var_density
+        self.call_density = call_density
+        self.stmts_per_block = stmts_per_block
+        self.step_budget = step_budget
+        self.signatures = []   # (name, param count, estimated steps)
+
+    # each scope is a list of (name, writable)
+    def visible(self, scopes, writable=False):
+        return [n for scope in scopes for n, w in scope if w or not writable]
+
+    def fresh(self, state):
+        state["vars"] += 1
+        return f"v{state['vars']}"
+
+    def program(self):
+        functions = []
+        for i in range(self.functions):
+            functions.append(self.function(f"f{i}", self.rng.randint(0, 3)))
+        functions.append(self.main())
+        return Program(functions)
+
+    def function(self, name, nparams):
+        params = [Param("int", f"p{i}") for i in range(nparams)]
+        state = {"vars": 0, "cost": 0, "mult": 1, "prints": False}
+        scopes = [[(p.name, True) for p in params]]
+        body = self.block(scopes, state, self.block_depth)
+        body.items.append(Return(self.expr(scopes, state, self.expr_depth)))
+        self.signatures.append((name, nparams, state["cost"] + 1))
+        return FunctionDecl("int", name, params, body)
+
+    def main(self):
+        state = {"vars": 0, "cost": 0, "mult": 1, "prints": True}
+        scopes = [[]]
+        items = []
+        for name, nparams, _ in self.signatures:
+            var = self.fresh(state)
+            args = [self.expr(scopes, state, 1) for _ in range(nparams)]
+            items.append(VarDecl("int", var, self.call(name, args, state)))
+            items.append(Printf('"%d\\n"', [Name(var)]))
+            scopes[0].append((var, True))
+        items += self.block(scopes, state, self.block_depth).items
+        visible = self.visible(scopes)
+        if visible:
+            items.append(Printf('"%d\\n"', [Name(self.rng.choice(visible))]))
+        items.append(Return(Num("0")))
+        return FunctionDecl("int", "main", [], Block(items))
+
+    def block(self, scopes, state, depth):
+        scopes.append([])
+        items = []
+        for _ in range(self.rng.randint(1, self.stmts_per_block)):
+            items.append(self.statement(scopes, state, depth))
+        scopes.pop()
+        return Block(items)
+
+    def statement(self, scopes, state, depth):
+        rng = self.rng
+        state["cost"] += state["mult"]
+        writable = self.visible(scopes, writable=True)
+        roll = rng.random()
+        if roll < self.var_density or not writable:
+            name = self.fresh(state)
+            decl = VarDecl("int", name, self.expr(scopes, state, self.expr_depth))
+            scopes[-1].append((name, True))
+            return decl
+        if depth > 0 and roll < self.var_density + 0.15:
+            cond = BinOp(rng.choice(_COMPARE), self.expr(scopes, state, 1), self.expr(scopes, state, 1))
+            then = self.block(scopes, state, depth - 1)
+            orelse = self.block(scopes, state, depth - 1) if rng.random() < 0.5 else None
+            return If(cond, then, orelse)
+        if depth > 0 and roll < self.var_density + 0.3:
+            return self.loop(scopes, state, depth)
+        if roll < self.var_density + 0.4 and state["prints"]:
+            return Printf('"%d\\n"', [self.expr(scopes, state, 1)])
+        return ExprStmt(Assign(rng.choice(writable), self.expr(scopes, state, self.expr_depth)))
+
+    def loop(self, scopes, state, depth):
+        # { int c = 0; while (c < K) { ...; c = c + 1; } }
+        counter = self.fresh(state)
+        times = self.rng.randint(1, 4)
+        scopes.append([(counter, False)])
+        outer_mult = state["mult"]
+        state["mult"] = outer_mult * times
+        body = self.block(scopes, state, depth - 1)
+        state["mult"] = outer_mult
+        scopes.pop()
+        body.items.append(ExprStmt(Assign(counter, BinOp("+", Name(counter), Num("1")))))
+        loop = While(BinOp("<", Name(counter), Num(str(times))), body)
+        return Block([VarDecl("int", counter, Num("0")), loop])
+
+    def call(self, name, args, state):
+        for callee, _, steps in self.signatures:
+            if callee == name:
+                state["cost"] += steps * state["mult"]
+        return Call(name, args)
+
+    def expr(self, scopes, state, depth):
+        rng = self.rng
+        visible = self.visible(scopes)
+        if depth <= 0 or rng.random() < 0.25:
+            if self.signatures and rng.random() < self.call_density:
+                room = (self.step_budget - state["cost"]) // state["mult"]
+                callees = [s for s in self.signatures if s[2] <= room]
+                if callees:
+                    name, nparams, _ = rng.choice(callees)
+                    args = [self.expr(scopes, state, 0) for _ in range(nparams)]
+                    return self.call(name, args, state)
+            if visible and rng.random() < 0.7:
+                return Name(rng.choice(visible))
+            return Num(str(rng.randint(0, 20)))
+        op = rng.choice(_ARITH)
+        left = self.expr(scopes, state, depth - 1)
+        if op == "/":
+            right = Num(str(rng.randint(1, 9)))
+        else:
+            right = self.expr(scopes, state, depth - 1)
+        node = BinOp(op, left, right)
+        if rng.random() < 0.3:
+            node = Paren(node)
+        return node
+
+
+def generate(seed=0, **params):
+    return to_source(ProgramGenerator(seed, **params).program())
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="generate a random CMini program")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--functions", type=int, default=3)
+    ap.add_argument("--block-depth", type=int, default=2)
+    ap.add_argument("--expr-depth", type=int, default=3)
+    ap.add_argument("--var-density", type=float, default=0.4)
+    ap.add_argument("--call-density", type=float, default=0.15)
+    ap.add_argument("--stmts-per-block", type=int, default=4)
+    args = ap.parse_args(argv)
+    print(generate(args.seed, functions=args.functions, block_depth=args.block_depth,
+                   expr_depth=args.expr_depth, var_density=args.var_density,
+                   call_density=args.call_density, stmts_per_block=args.stmts_per_block), end="")
+
+
+if __name__ == "__main__":
+    main()
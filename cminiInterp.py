@@ -0,0 +1,373 @@
+"""Runs CMini programs in-process, for checking a transformation without
+gcc.
+
+ints are 32-bit and wrap around, / truncates toward zero, and dividing by
+zero (or INT_MIN by -1) is a fault, as on x86. A chain such as
+a == b < c means what C makes of it, a == (b < c), not the grammar's flat
+left-to-right grouping. Operands and arguments are
+evaluated left to right. C leaves that order unspecified and gcc often
+picks another, so a result whose output depends on it is reported as
+undecided. So is anything else whose behaviour C does not define: reading
+an uninitialised variable, or a printf conversion without an argument.
+gcc stays the final word; the interpreter only saves compiling the
+programs it can decide.
+"""
+import re
+import sys
+import argparse
+from cminiAst import (Assign, BinOp, Block, Call, ExprStmt, If, Name, Neg,
+                      Num, Paren, Printf, Return, VarDecl, While, reassociate_comparisons)
+from frontend import parse_ast
+
+MAX_STEPS = 10_000_000
+MAX_DEPTH = 2000
+
+# negated signal numbers, as subprocess reports a process killed by one
+SIGFPE = -8
+SIGSEGV = -11
+
+_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "0": "\0", "a": "\a", "b": "\b", "f": "\f",
+            "v": "\v", "\\": "\\", '"': '"', "'": "'", "?": "?"}
+_ESCAPE_RE = re.compile(r"\\(x[0-9a-fA-F]+|[0-7]{1,3}|.)", re.S)
+_CONVERSION_RE = re.compile(r"%([-+ #0]*)(\d*)(?:\.(\d*))?(?:hh|h|ll|l)?([diuxXoc%])")
+_COMPARISONS = frozenset(("==", "!=", "<", ">", "<=", ">="))
+
+
+class Undecided(Exception):
+    """The program does something whose result C does not pin down, or
+    the interpreter gave up on it (step or depth limit)."""
+
+
+class Fault(Exception):
+    """The program would be killed by a signal (signal is negated, as in
+    a subprocess return code)."""
+
+    def __init__(self, message, signal):
+        super().__init__(message)
+        self.signal = signal
+
+
+class _Uninitialised:
+    __slots__ = ()
+
+
+_UNSET = _Uninitialised()
+
+
+def wrap32(v):
+    v &= 0xFFFFFFFF
+    return v - 0x100000000 if v & 0x80000000 else v
+
+
+def _unescape(match):
+    s = match.group(1)
+    if s[0] == "x":
+        return chr(int(s[1:], 16) & 0xFF)
+    if s[0] in "01234567":
+        return chr(int(s, 8) & 0xFF)
+    return _ESCAPES.get(s, s)
+
+
+def compile_format(literal):
+    """printf's format string literal -> list of literal text pieces and
+    (python format, conversion) pairs."""
+    text = _ESCAPE_RE.sub(_unescape, literal[1:-1])
+    pieces = []
+    pos = 0
+    for m in _CONVERSION_RE.finditer(text):
+        pieces.append(text[pos:m.start()])
+        flags, width, precision, conv = m.groups()
+        if conv == "%":
+            pieces.append("%")
+        else:
+            if conv == "o" and "#" in flags:
+                raise Undecided("printf %#o is not supported")
+            spec = "%" + flags + width + ("." + precision if precision is not None else "")
+            pieces.append((spec + ("d" if conv in "diu" else conv), conv))
+        pos = m.end()
+    pieces.append(text[pos:])
+    if "%" in "".join(p for p in pieces if type(p) is str and p != "%"):
+        raise Undecided(f"printf format {literal} has a conversion the interpreter does not know")
+    return [p for p in pieces if p != ""]
+
+
+class RunResult:
+    """exit_code: main's return value as a process exit status (0-255),
+    or the negated signal of a fault. error: None, or why the run is
+    undecided. order_sensitive: the output depended on evaluation order."""
+    __slots__ = ("exit_code", "stdout", "steps", "error", "order_sensitive")
+
+    def __init__(self, exit_code, stdout, steps, error=None, order_sensitive=False):
+        self.exit_code = exit_code
+        self.stdout = stdout
+        self.steps = steps
+        self.error = error
+        self.order_sensitive = order_sensitive
+
+    @property
+    def decided(self):
+        return self.error is None and not self.order_sensitive
+
+    def __repr__(self):
+        return (f"RunResult(exit_code={self.exit_code}, {len(self.stdout)} chars, steps={self.steps}, "
+                f"error={self.error!r})")
+
+
+class Interpreter:
+    """Evaluates one parsed program. Every statement and loop test counts
+    as a step; a run that takes more than max_steps, or nests calls more
+    than max_depth deep, is stopped and reported undecided."""
+
+    def __init__(self, program, max_steps=MAX_STEPS, max_depth=MAX_DEPTH):
+        self.functions = {f.name: f for f in program.functions}
+        self.max_steps = max_steps
+        self.max_depth = max_depth
+        self.formats = {}
+        # comparison chain -> the same chain grouped as C groups it
+        self.chains = {}
+        self.out = []
+        self.steps = 0
+        self.depth = 0
+        self.order_sensitive = False
+
+    def run(self):
+        self.out = []
+        self.steps = 0
+        self.depth = 0
+        self.order_sensitive = False
+        try:
+            if "main" not in self.functions:
+                raise Undecided("no main function")
+            value = self.call("main", [])
+            if value is _UNSET:
+                raise Undecided("main returns an uninitialised value")
+            code, error = (value or 0) & 0xFF, None
+        except Fault as e:
+            code, error = e.signal, None
+        except Undecided as e:
+            code, error = None, str(e)
+        except RecursionError:
+            code, error = None, "nested too deeply for the interpreter"
+        return RunResult(code, "".join(self.out), self.steps, error, self.order_sensitive)
+
+    # ------------------------------------------------------------ statements
+
+    def call(self, name, args):
+        func = self.functions.get(name)
+        if func is None:
+            raise Undecided(f"call to {name}, which the program does not define")
+        if len(args) != len(func.params):
+            raise Undecided(f"{name} takes {len(func.params)} arguments, got {len(args)}")
+        self.depth += 1
+        if self.depth > self.max_depth:
+            raise Undecided(f"calls nested more than {self.max_depth} deep")
+        scopes = [{p.name: a for p, a in zip(func.params, args)}]
+        ret = self.block(func.body, scopes)
+        self.depth -= 1
+        if ret is None:
+            # falling off the end: fine for void and main, garbage otherwise
+            return 0 if func.ret_type == "void" or name == "main" else _UNSET
+        return ret[0]
+
+    def block(self, block, scopes):
+        scopes.append({})
+        try:
+            for item in block.items:
+                ret = self.statement(item, scopes)
+                if ret is not None:
+                    return ret
+            return None
+        finally:
+            scopes.pop()
+
+    def statement(self, node, scopes):
+        """None, or a 1-tuple holding the value of a return statement."""
+        self.steps += 1
+        if self.steps > self.max_steps:
+            raise Undecided(f"did not finish within {self.max_steps} steps")
+        t = type(node)
+        if t is ExprStmt:
+            self.expr(node.expr, scopes)
+        elif t is VarDecl:
+            scopes[-1][node.name] = _UNSET if node.init is None else self.value(node.init, scopes)
+        elif t is Printf:
+            self.printf(node, scopes)
+        elif t is If:
+            if self.value(node.cond, scopes):
+                return self.statement(node.then, scopes)
+            if node.orelse is not None:
+                return self.statement(node.orelse, scopes)
+        elif t is While:
+            while self.value(node.cond, scopes):
+                ret = self.statement(node.body, scopes)
+                if ret is not None:
+                    return ret
+                self.steps += 1
+                if self.steps > self.max_steps:
+                    raise Undecided(f"did not finish within {self.max_steps} steps")
+        elif t is Return:
+            return (None if node.value is None else self.expr(node.value, scopes),)
+        elif t is Block:
+            return self.block(node, scopes)
+        else:
+            raise TypeError(f"not a statement: {node!r}")
+        return None
+
+    def printf(self, node, scopes):
+        pieces = self.formats.get(node.fmt)
+        if pieces is None:
+            pieces = self.formats[node.fmt] = compile_format(node.fmt)
+        values = self.values(node.args, scopes)
+        it = iter(values)
+        parts = []
+        for piece in pieces:
+            if type(piece) is str:
+                parts.append(piece)
+                continue
+            spec, conv = piece
+            v = next(it, _UNSET)
+            if v is _UNSET:
+                raise Undecided(f"printf {node.fmt} has more conversions than arguments")
+            if conv in "uxXo":
+                v &= 0xFFFFFFFF
+            elif conv == "c":
+                v = chr(v & 0xFF)
+            parts.append(spec % v)
+        self.out.append("".join(parts))
+
+    # ----------------------------------------------------------- expressions
+
+    def values(self, nodes, scopes):
+        """Evaluate nodes left to right, noting when more than one of them
+        printed something: then the output depends on evaluation order."""
+        out = self.out
+        values = []
+        printed = 0
+        for node in nodes:
+            before = len(out)
+            values.append(self.value(node, scopes))
+            if len(out) > before:
+                printed += 1
+        if printed > 1:
+            self.order_sensitive = True
+        return values
+
+    def value(self, node, scopes):
+        v = self.expr(node, scopes)
+        if v is _UNSET:
+            raise Undecided(f"uses an uninitialised value ({type(node).__name__})")
+        return v
+
+    def expr(self, node, scopes):
+        t = type(node)
+        if t is Num:
+            return wrap32(int(node.value))
+        if t is Name:
+            for scope in reversed(scopes):
+                if node.id in scope:
+                    return scope[node.id]
+            raise Undecided(f"{node.id} is not declared")
+        if t is BinOp:
+            op = node.op
+            if op in _COMPARISONS:
+                chain = self.chains.get(node)
+                if chain is None:
+                    chain = self.chains[node] = reassociate_comparisons(node)
+                if chain is not node:
+                    return self.expr(chain, scopes)
+            left, right = self.values((node.left, node.right), scopes)
+            if op == "+":
+                return wrap32(left + right)
+            if op == "-":
+                return wrap32(left - right)
+            if op == "*":
+                return wrap32(left * right)
+            if op == "/":
+                if right == 0:
+                    raise Fault("division by zero", SIGFPE)
+                if left == -0x80000000 and right == -1:
+                    raise Fault("INT_MIN / -1 overflows", SIGFPE)
+                q = abs(left) // abs(right)
+                return q if (left < 0) == (right < 0) else -q
+            if op == "==":
+                return int(left == right)
+            if op == "!=":
+                return int(left != right)
+            if op == "<":
+                return int(left < right)
+            if op == ">":
+                return int(left > right)
+            if op == "<=":
+                return int(left <= right)
+            if op == ">=":
+                return int(left >= right)
+            raise TypeError(f"unknown operator {op}")
+        if t is Paren:
+            return self.expr(node.expr, scopes)
+        if t is Neg:
+            return wrap32(-self.value(node.operand, scopes))
+        if t is Assign:
+            v = self.value(node.value, scopes)
+            for scope in reversed(scopes):
+                if node.name in scope:
+                    scope[node.name] = v
+                    return v
+            raise Undecided(f"{node.name} is not declared")
+        if t is Call:
+            return self.call(node.name, self.values(node.args, scopes))
+        raise TypeError(f"not an expression: {node!r}")
+
+
+def run_source(source, max_steps=MAX_STEPS, max_depth=MAX_DEPTH):
+    # the obfuscator's output starts with #include <stdio.h>, which CMini has no syntax for
+    code = "".join(l for l in source.splitlines(True) if not l.strip().startswith("#include"))
+    try:
+        program = parse_ast(code)
+    except Exception as e:
+        return RunResult(None, "", 0, f"does not parse: {e}")
+    return Interpreter(program, max_steps, max_depth).run()
+
+
+def compare_sources(original, transformed, max_steps=MAX_STEPS, run=run_source):
+    """Like deObfuscator.verify_sources, without gcc. "equal" is None when
+    either run is undecided; then only compiling them can tell. run is
+    run_source here or cminiVM.run_source."""
+    a = run(original, max_steps)
+    b = run(transformed, max_steps)
+    equal = None
+    if a.decided and b.decided:
+        equal = a.exit_code == b.exit_code and a.stdout == b.stdout
+    errors = [r.error or ("output depends on evaluation order" if r.order_sensitive else "")
+              for r in (a, b)]
+    return {"equal": equal, "outputs": [a.stdout, b.stdout], "exit_codes": [a.exit_code, b.exit_code],
+            "errors": errors, "steps": [a.steps, b.steps]}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="run a CMini program, or compare two, without gcc")
+    ap.add_argument("program")
+    ap.add_argument("other", nargs="?", help="compare the two programs' exit codes and output")
+    ap.add_argument("--max-steps", type=int, default=MAX_STEPS)
+    args = ap.parse_args(argv)
+
+    def read(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+
+    if args.other is None:
+        result = run_source(read(args.program), args.max_steps)
+        sys.stdout.write(result.stdout)
+        if result.error is not None:
+            print(f"undecided: {result.error}", file=sys.stderr)
+            sys.exit(125)
+        sys.exit(result.exit_code if result.exit_code >= 0 else 128 - result.exit_code)
+    report = compare_sources(read(args.program), read(args.other), args.max_steps)
+    if report["equal"] is None:
+        print("undecided: " + "; ".join(e for e in report["errors"] if e))
+        sys.exit(2)
+    print("outputs match" if report["equal"] else "outputs differ")
+    sys.exit(0 if report["equal"] else 1)
+
+
+if __name__ == "__main__":
+    main()
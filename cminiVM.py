@@ -0,0 +1,535 @@
+"""Bytecode compiler and stack VM for CMini, for running the same programs
+many times over (differential testing, fuzzing).
+
+A program compiles to one flat array("i") of instructions: an opcode
+followed by its operands (CONST k, LOAD slot, JUMP target, CALL f n,
+PRINTF k n, ...). Integer constants and compiled printf formats live in
+a constant pool. Every local is resolved to a slot number at compile
+time, and so is the deepest the operand stack gets in each function.
+At run time all frames share one preallocated list, grown on calls only
+as deep recursion needs it: a call's arguments become slots 0..n-1 of
+the callee's frame right where the caller pushed them, and the operand
+stack sits above the locals. The loop never recurses, so call depth is
+bounded by stack_size, not Python's recursion limit.
+
+Semantics are cminiInterp's: 32-bit wraparound, truncating division,
+SIGFPE faults, undecided on uninitialised reads, on output that depends
+on evaluation order, and past max_steps. Here max_steps counts executed
+instructions.
+"""
+import sys
+import time
+import argparse
+from array import array
+from cminiAst import (iter_nodes, Assign, BinOp, Block, Call, ExprStmt, If,
+                      Name, Neg, Num, Paren, Printf, Return, VarDecl, While, reassociate_comparisons)
+from cminiInterp import (compile_format, compare_sources as _compare_sources, Fault, RunResult,
+                         Undecided, SIGFPE, MAX_STEPS)
+from frontend import parse_ast
+
+(CONST, LOAD, STORE, DUP, POP, ADD, SUB, MUL, DIV, NEG, EQ, NE, LT, GT, LE, GE,
+ JUMP, JUMP_IF_FALSE, CALL, RET, PRINTF, BEGIN_ORDER, BEGIN_OPERAND, END_OPERAND,
+ END_ORDER) = range(25)
+
+OPNAMES = ("CONST", "LOAD", "STORE", "DUP", "POP", "ADD", "SUB", "MUL", "DIV", "NEG", "EQ", "NE",
+           "LT", "GT", "LE", "GE", "JUMP", "JUMP_IF_FALSE", "CALL", "RET", "PRINTF", "BEGIN_ORDER",
+           "BEGIN_OPERAND", "END_OPERAND", "END_ORDER")
+_OPERANDS = {CONST: 1, LOAD: 1, STORE: 1, JUMP: 1, JUMP_IF_FALSE: 1, CALL: 2, PRINTF: 2}
+_BINARY = {"+": ADD, "-": SUB, "*": MUL, "/": DIV, "==": EQ, "!=": NE, "<": LT, ">": GT,
+           "<=": LE, ">=": GE}
+
+STACK_SIZE = 1 << 20
+_STACK_START = 1024
+
+INT_MIN = -0x80000000
+INT_MAX = 0x7FFFFFFF
+
+
+class Code:
+    """A compiled program. entries/nlocals/nparams/frames are indexed by
+    function number (frames: locals plus the deepest operand stack);
+    consts holds ints and compiled printf formats."""
+    __slots__ = ("code", "consts", "names", "entries", "nlocals", "nparams", "frames", "main")
+
+    def __init__(self):
+        self.code = array("i")
+        self.consts = []
+        self.names = []
+        self.entries = array("i")
+        self.nlocals = array("i")
+        self.nparams = array("i")
+        self.frames = array("i")
+        self.main = -1
+
+    def disassemble(self):
+        starts = {e: n for n, e in zip(self.names, self.entries)}
+        lines = []
+        code = self.code
+        pc = 0
+        while pc < len(code):
+            if pc in starts:
+                lines.append(f"{starts[pc]}:")
+            op = code[pc]
+            n = _OPERANDS.get(op, 0)
+            args = list(code[pc + 1:pc + 1 + n])
+            note = f"  ; {self.consts[args[0]]!r}" if op in (CONST, PRINTF) else ""
+            lines.append(f"  {pc:5d}  {OPNAMES[op]:<14}{' '.join(map(str, args))}{note}")
+            pc += 1 + n
+        return "\n".join(lines)
+
+
+def _printing_functions(program):
+    """Names of the functions whose calls can print, directly or through
+    the functions they call."""
+    calls = {}
+    printing = set()
+    for f in program.functions:
+        callees = set()
+        for n in iter_nodes(f.body):
+            if type(n) is Printf:
+                printing.add(f.name)
+            elif type(n) is Call:
+                callees.add(n.name)
+        calls[f.name] = callees
+    changed = True
+    while changed:
+        changed = False
+        for name, callees in calls.items():
+            if name not in printing and callees & printing:
+                printing.add(name)
+                changed = True
+    return printing
+
+
+def _printing_nodes(body, printing):
+    """ids of the nodes in body whose evaluation may print: calls to a
+    printing function and everything that contains one."""
+    found = set()
+    if not printing:
+        return found
+    # children come after their parents in preorder, so reversed, every
+    # child is settled before its parent is looked at
+    for node in reversed(list(iter_nodes(body))):
+        if type(node) is Call and node.name in printing:
+            found.add(id(node))
+            continue
+        for field in node._children:
+            value = getattr(node, field)
+            if any(id(v) in found for v in (value if type(value) is list else (value,))):
+                found.add(id(node))
+                break
+    return found
+
+
+class _Compiler:
+    def __init__(self, program):
+        self.out = Code()
+        self.functions = {}
+        self.const_index = {}
+        self.printing = _printing_functions(program)
+        for f in program.functions:
+            self.functions[f.name] = len(self.out.names)
+            self.out.names.append(f.name)
+            self.out.entries.append(0)
+            self.out.nlocals.append(0)
+            self.out.nparams.append(len(f.params))
+            self.out.frames.append(0)
+        self.out.main = self.functions.get("main", -1)
+
+    def const(self, value):
+        key = (type(value), value if type(value) is int else id(value))
+        k = self.const_index.get(key)
+        if k is None:
+            k = self.const_index[key] = len(self.out.consts)
+            self.out.consts.append(value)
+        return k
+
+    def emit(self, *words):
+        """Append instructions, tracking the operand stack depth."""
+        i = 0
+        while i < len(words):
+            op = words[i]
+            if op in (CONST, LOAD, DUP):
+                self.depth += 1
+            elif op in (STORE, POP, JUMP_IF_FALSE, RET) or ADD <= op <= GE and op != NEG:
+                self.depth -= 1
+            elif op == CALL:
+                self.depth += 1 - words[i + 2]
+            elif op == PRINTF:
+                self.depth -= words[i + 2]
+            self.max_depth = max(self.max_depth, self.depth)
+            i += 1 + _OPERANDS.get(op, 0)
+        self.out.code.extend(words)
+        return len(self.out.code)
+
+    def patch(self, at, target):
+        self.out.code[at - 1] = target
+
+    def function(self, f):
+        index = self.functions[f.name]
+        self.out.entries[index] = len(self.out.code)
+        self.scopes = [{p.name: i for i, p in enumerate(f.params)}]
+        self.next_slot = self.max_slot = len(f.params)
+        self.depth = self.max_depth = 0
+        self.printing_nodes = _printing_nodes(f.body, self.printing)
+        self.block(f.body)
+        # falling off the end: fine for void and main, garbage otherwise
+        if f.ret_type == "void" or f.name == "main":
+            self.emit(CONST, self.const(0), RET)
+        else:
+            self.emit(CONST, self.const(None), RET)
+        self.out.nlocals[index] = self.max_slot
+        self.out.frames[index] = self.max_slot + self.max_depth
+
+    # ------------------------------------------------------------ statements
+
+    def block(self, block):
+        self.scopes.append({})
+        saved = self.next_slot
+        for item in block.items:
+            self.statement(item)
+        # slots of a closed block are reused by its siblings
+        self.next_slot = saved
+        self.scopes.pop()
+
+    def statement(self, node):
+        t = type(node)
+        if t is ExprStmt:
+            self.expr(node.expr)
+            self.emit(POP)
+        elif t is VarDecl:
+            slot = self.next_slot
+            self.next_slot += 1
+            self.max_slot = max(self.max_slot, self.next_slot)
+            # as in C, the new name is already in scope inside its initialiser
+            self.scopes[-1][node.name] = slot
+            if node.init is None:
+                self.emit(CONST, self.const(None), STORE, slot)
+            else:
+                self.expr(node.init)
+                self.emit(STORE, slot)
+        elif t is Printf:
+            pieces = compile_format(node.fmt)
+            self.operands(node.args)
+            self.emit(PRINTF, self.const(pieces), len(node.args))
+        elif t is If:
+            self.expr(node.cond)
+            to_else = self.emit(JUMP_IF_FALSE, 0)
+            self.statement(node.then)
+            if node.orelse is None:
+                self.patch(to_else, len(self.out.code))
+            else:
+                to_end = self.emit(JUMP, 0)
+                self.patch(to_else, len(self.out.code))
+                self.statement(node.orelse)
+                self.patch(to_end, len(self.out.code))
+        elif t is While:
+            top = len(self.out.code)
+            self.expr(node.cond)
+            to_end = self.emit(JUMP_IF_FALSE, 0)
+            self.statement(node.body)
+            self.emit(JUMP, top)
+            self.patch(to_end, len(self.out.code))
+        elif t is Return:
+            if node.value is None:
+                self.emit(CONST, self.const(0), RET)
+            else:
+                self.expr(node.value)
+                self.emit(RET)
+        elif t is Block:
+            self.block(node)
+        else:
+            raise TypeError(f"not a statement: {node!r}")
+
+    # ----------------------------------------------------------- expressions
+
+    def prints(self, node):
+        return id(node) in self.printing_nodes
+
+    def operands(self, nodes):
+        """Compile nodes left to right. Where more than one of them may
+        print, the VM is told to watch which ones actually do."""
+        if sum(1 for n in nodes if self.prints(n)) < 2:
+            for n in nodes:
+                self.expr(n)
+            return
+        self.emit(BEGIN_ORDER)
+        for n in nodes:
+            self.emit(BEGIN_OPERAND)
+            self.expr(n)
+            self.emit(END_OPERAND)
+        self.emit(END_ORDER)
+
+    def slot(self, name):
+        for scope in reversed(self.scopes):
+            if name in scope:
+                return scope[name]
+        raise Undecided(f"{name} is not declared")
+
+    def expr(self, node):
+        t = type(node)
+        if t is Num:
+            value = int(node.value) & 0xFFFFFFFF
+            self.emit(CONST, self.const(value - 0x100000000 if value & 0x80000000 else value))
+        elif t is Name:
+            self.emit(LOAD, self.slot(node.id))
+        elif t is BinOp:
+            op = _BINARY[node.op]
+            if op >= EQ:
+                # compile a == b < c as C groups it, a == (b < c)
+                chain = reassociate_comparisons(node)
+                if chain is not node:
+                    self.expr(chain)
+                    return
+            self.operands((node.left, node.right))
+            self.emit(op)
+        elif t is Paren:
+            self.expr(node.expr)
+        elif t is Neg:
+            self.expr(node.operand)
+            self.emit(NEG)
+        elif t is Assign:
+            self.expr(node.value)
+            self.emit(DUP, STORE, self.slot(node.name))
+        elif t is Call:
+            f = self.functions.get(node.name)
+            if f is None:
+                raise Undecided(f"call to {node.name}, which the program does not define")
+            if len(node.args) != self.out.nparams[f]:
+                raise Undecided(f"{node.name} takes {self.out.nparams[f]} arguments, got {len(node.args)}")
+            self.operands(node.args)
+            self.emit(CALL, f, len(node.args))
+        else:
+            raise TypeError(f"not an expression: {node!r}")
+
+
+def compile_program(program):
+    compiler = _Compiler(program)
+    try:
+        for f in program.functions:
+            compiler.function(f)
+    except RecursionError:
+        raise Undecided("nested too deeply for the bytecode compiler") from None
+    return compiler.out
+
+
+def _format(pieces, args):
+    parts = []
+    i = 0
+    for piece in pieces:
+        if type(piece) is str:
+            parts.append(piece)
+            continue
+        if i >= len(args):
+            raise Undecided("printf has more conversions than arguments")
+        spec, conv = piece
+        v = args[i]
+        i += 1
+        if v is None:
+            raise TypeError("uninitialised")
+        if conv in "uxXo":
+            v &= 0xFFFFFFFF
+        elif conv == "c":
+            v = chr(v & 0xFF)
+        parts.append(spec % v)
+    return "".join(parts)
+
+
+def execute(prog, max_steps=MAX_STEPS, stack_size=STACK_SIZE):
+    """Run a compiled program; returns a cminiInterp.RunResult whose steps
+    are executed instructions."""
+    out = []
+    if prog.main < 0:
+        return RunResult(None, "", 0, "no main function")
+    code = prog.code
+    consts = prog.consts
+    entries = prog.entries
+    nlocals = prog.nlocals
+    frame_sizes = prog.frames
+    if frame_sizes[prog.main] > stack_size:
+        return RunResult(None, "", 0, "main's frame does not fit the VM stack")
+    stack = [None] * min(max(_STACK_START, frame_sizes[prog.main]), stack_size)
+    capacity = len(stack)
+    frames = []  # (return pc, caller's bp) per active call
+    orders = []  # per watched expression: [operands that printed, output length]
+    order_sensitive = False
+    bp = 0
+    sp = nlocals[prog.main]
+    pc = entries[prog.main]
+    steps = 0
+    limit = max_steps
+    code_len = len(code)
+    try:
+        while True:
+            op = code[pc]
+            steps += 1
+            if op == LOAD:
+                stack[sp] = stack[bp + code[pc + 1]]
+                sp += 1
+                pc += 2
+            elif op == CONST:
+                stack[sp] = consts[code[pc + 1]]
+                sp += 1
+                pc += 2
+            elif op == STORE:
+                sp -= 1
+                stack[bp + code[pc + 1]] = stack[sp]
+                pc += 2
+            elif op == JUMP_IF_FALSE:
+                sp -= 1
+                v = stack[sp]
+                if v is None:
+                    raise TypeError("uninitialised")
+                pc = pc + 2 if v else code[pc + 1]
+            elif op == JUMP:
+                target = code[pc + 1]
+                if target < pc and steps > limit:
+                    raise Undecided(f"did not finish within {max_steps} instructions")
+                pc = target
+            elif op <= GE and op >= ADD:
+                sp -= 1
+                b = stack[sp]
+                a = stack[sp - 1]
+                if op == ADD:
+                    v = a + b
+                elif op == SUB:
+                    v = a - b
+                elif op == MUL:
+                    v = a * b
+                elif op == DIV:
+                    if b == 0:
+                        raise Fault("division by zero", SIGFPE)
+                    if a == INT_MIN and b == -1:
+                        raise Fault("INT_MIN / -1 overflows", SIGFPE)
+                    v = abs(a) // abs(b)
+                    if (a < 0) != (b < 0):
+                        v = -v
+                elif op == NEG:
+                    # unary: undo the pop
+                    sp += 1
+                    v = -b
+                    a = 0
+                else:
+                    if a is None or b is None:
+                        raise TypeError("uninitialised")
+                    if op == LT:
+                        v = 1 if a < b else 0
+                    elif op == GT:
+                        v = 1 if a > b else 0
+                    elif op == EQ:
+                        v = 1 if a == b else 0
+                    elif op == NE:
+                        v = 1 if a != b else 0
+                    elif op == LE:
+                        v = 1 if a <= b else 0
+                    else:
+                        v = 1 if a >= b else 0
+                if v > INT_MAX or v < INT_MIN:
+                    v &= 0xFFFFFFFF
+                    if v & 0x80000000:
+                        v -= 0x100000000
+                stack[sp - 1] = v
+                pc += 1
+            elif op == POP:
+                sp -= 1
+                pc += 1
+            elif op == DUP:
+                stack[sp] = stack[sp - 1]
+                sp += 1
+                pc += 1
+            elif op == CALL:
+                f = code[pc + 1]
+                frames.append((pc + 3, bp))
+                bp = sp - code[pc + 2]
+                top = bp + nlocals[f]
+                if bp + frame_sizes[f] > capacity:
+                    if bp + frame_sizes[f] > stack_size:
+                        raise Undecided("calls nested too deep for the VM stack")
+                    stack.extend([None] * min(max(capacity, frame_sizes[f]), stack_size - capacity))
+                    capacity = len(stack)
+                for i in range(sp, top):
+                    stack[i] = None
+                sp = top
+                pc = entries[f]
+                if steps > limit:
+                    raise Undecided(f"did not finish within {max_steps} instructions")
+            elif op == RET:
+                v = stack[sp - 1]
+                if not frames:
+                    if v is None:
+                        raise TypeError("uninitialised")
+                    return RunResult(v & 0xFF, "".join(out), steps, None, order_sensitive)
+                sp = bp
+                stack[sp] = v
+                sp += 1
+                pc, bp = frames.pop()
+            elif op == PRINTF:
+                n = code[pc + 2]
+                sp -= n
+                out.append(_format(consts[code[pc + 1]], stack[sp:sp + n]))
+                pc += 3
+            elif op == BEGIN_ORDER:
+                orders.append([0, 0])
+                pc += 1
+            elif op == BEGIN_OPERAND:
+                orders[-1][1] = len(out)
+                pc += 1
+            elif op == END_OPERAND:
+                if len(out) > orders[-1][1]:
+                    orders[-1][0] += 1
+                pc += 1
+            elif op == END_ORDER:
+                if orders.pop()[0] > 1:
+                    order_sensitive = True
+                pc += 1
+            else:
+                raise RuntimeError(f"bad opcode {op} at {pc} of {code_len}")
+    except Fault as e:
+        return RunResult(e.signal, "".join(out), steps, None, order_sensitive)
+    except Undecided as e:
+        return RunResult(None, "".join(out), steps, str(e), order_sensitive)
+    except TypeError:
+        return RunResult(None, "".join(out), steps, "uses an uninitialised value", order_sensitive)
+
+
+def run_source(source, max_steps=MAX_STEPS):
+    code = "".join(l for l in source.splitlines(True) if not l.strip().startswith("#include"))
+    try:
+        prog = compile_program(parse_ast(code))
+    except Undecided as e:
+        return RunResult(None, "", 0, str(e))
+    except Exception as e:
+        return RunResult(None, "", 0, f"does not parse: {e}")
+    return execute(prog, max_steps)
+
+
+def compare_sources(original, transformed, max_steps=MAX_STEPS):
+    """cminiInterp.compare_sources, run on the VM."""
+    return _compare_sources(original, transformed, max_steps, run_source)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="compile a CMini program to bytecode and run it")
+    ap.add_argument("program")
+    ap.add_argument("--max-steps", type=int, default=MAX_STEPS, help="instruction limit")
+    ap.add_argument("--disassemble", action="store_true")
+    args = ap.parse_args(argv)
+    with open(args.program, "r", encoding="utf-8") as f:
+        source = f.read()
+    if args.disassemble:
+        code = "".join(l for l in source.splitlines(True) if not l.strip().startswith("#include"))
+        print(compile_program(parse_ast(code)).disassemble())
+        return
+    start = time.perf_counter()
+    result = run_source(source, args.max_steps)
+    elapsed = time.perf_counter() - start
+    sys.stdout.write(result.stdout)
+    print(f"{result.steps} instructions in {elapsed * 1000:.2f} ms", file=sys.stderr)
+    if result.error is not None:
+        print(f"undecided: {result.error}", file=sys.stderr)
+        sys.exit(125)
+    sys.exit(result.exit_code if result.exit_code >= 0 else 128 - result.exit_code)
+
+
+if __name__ == "__main__":
+    main()
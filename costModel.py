@@ -0,0 +1,318 @@
+"""Static runtime cost of CMini programs, and an obfuscation planner that
+keeps the cost it adds under a budget.
+
+Costs are in cminiVM instructions, so an estimate can be checked against
+the instruction count of an actual run. Every construct costs what it
+compiles to (a load, a store, an operator...) times how often it is
+expected to run. A counted loop, { int c = N; while (c < K) { ... c = c +
+1; } }, runs K - N times. Any other loop is assumed to run loop_weight
+times, and a branch of an if runs with probability branch_weight. A
+function runs as often as its call sites do, starting from main.
+"""
+import argparse
+from cminiAst import (iter_nodes, Assign, BinOp, Block, Call, ExprStmt, If, Name,
+                      Neg, Num, Paren, Printf, Return, VarDecl, While)
+from cminiVM import run_source, MAX_STEPS
+from frontend import parse_ast
+
+# instructions each transformation adds where it is applied:
+# int unused_x = N;  -> CONST, STORE
+# (-1 * -(e))        -> CONST, NEG, NEG, MUL
+SITE_COSTS = {"dead_code": 2, "complex_expr": 4}
+
+
+def _strip(node):
+    while type(node) is Paren:
+        node = node.expr
+    return node
+
+
+def _is_num(node):
+    return type(_strip(node)) is Num
+
+
+def _increments(node, var):
+    """Whether node is var = var + 1."""
+    if type(node) is not Assign or node.name != var:
+        return False
+    v = _strip(node.value)
+    if type(v) is not BinOp or v.op != "+":
+        return False
+    left, right = _strip(v.left), _strip(v.right)
+    return ((type(left) is Name and left.id == var and type(right) is Num and right.value == "1")
+            or (type(right) is Name and right.id == var and type(left) is Num and left.value == "1"))
+
+
+def trip_count(before, loop):
+    """Iterations of a counted loop, given the statement before it, or
+    None when the loop is not of that shape."""
+    cond = _strip(loop.cond)
+    if type(cond) is not BinOp:
+        return None
+    left, right = _strip(cond.left), _strip(cond.right)
+    if cond.op in ("<", "<=") and type(left) is Name and type(right) is Num:
+        var, limit, inclusive = left.id, int(right.value), cond.op == "<="
+    elif cond.op in (">", ">=") and type(right) is Name and type(left) is Num:
+        var, limit, inclusive = right.id, int(left.value), cond.op == ">="
+    else:
+        return None
+    if type(before) is VarDecl and before.name == var and before.init is not None and _is_num(before.init):
+        start = int(_strip(before.init).value)
+    elif (type(before) is ExprStmt and type(before.expr) is Assign and before.expr.name == var
+          and _is_num(before.expr.value)):
+        start = int(_strip(before.expr.value).value)
+    else:
+        return None
+    assigns = [n for n in iter_nodes(loop.body) if type(n) is Assign and n.name == var]
+    declares = any(type(n) is VarDecl and n.name == var for n in iter_nodes(loop.body))
+    if len(assigns) != 1 or declares or not _increments(assigns[0], var):
+        return None
+    return max(limit - start + inclusive, 0)
+
+
+class Estimate:
+    """total: expected instructions of one run. blocks/additions: (node,
+    expected executions) of every block and every + expression, the sites
+    of dead_code and complex_expr. frequencies: expected calls per
+    function."""
+    __slots__ = ("total", "blocks", "additions", "frequencies")
+
+    def __init__(self, total, blocks, additions, frequencies):
+        self.total = total
+        self.blocks = blocks
+        self.additions = additions
+        self.frequencies = frequencies
+
+
+class CostModel:
+    def __init__(self, loop_weight=10.0, branch_weight=0.5, recursion_weight=10.0):
+        self.loop_weight = loop_weight
+        self.branch_weight = branch_weight
+        self.recursion_weight = recursion_weight
+
+    def estimate(self, program):
+        # per function: instructions, sites and calls at weights relative
+        # to one call of it; frequencies scale them afterwards
+        local = {}
+        for f in program.functions:
+            walker = _Walker(self)
+            walker.block(f.body, 1.0)
+            local[f.name] = walker
+        freq = self.frequencies(local)
+        total = 0.0
+        blocks, additions = [], []
+        for name, walker in local.items():
+            n = freq.get(name, 0.0)
+            # CALL and RET of each call, the caller's arguments aside
+            total += n * (walker.cost + 2)
+            blocks += [(node, n * w) for node, w in walker.blocks]
+            additions += [(node, n * w) for node, w in walker.additions]
+        return Estimate(total, blocks, additions, freq)
+
+    def frequencies(self, local):
+        """Expected calls of each function in one run. Calls that close a
+        cycle are not followed; a function on one runs recursion_weight
+        times as often as its callers make it."""
+        order, recursive, state = [], set(), {}
+        if "main" not in local:
+            return {}
+        stack = [("main", iter(local["main"].calls))]
+        state["main"] = "open"
+        while stack:
+            name, calls = stack[-1]
+            for callee, _ in calls:
+                if callee not in local:
+                    continue
+                if state.get(callee) == "open":
+                    recursive.add(callee)
+                elif callee not in state:
+                    state[callee] = "open"
+                    stack.append((callee, iter(local[callee].calls)))
+                    break
+            else:
+                state[name] = "done"
+                order.append(name)
+                stack.pop()
+        position = {name: i for i, name in enumerate(reversed(order))}
+        freq = dict.fromkeys(order, 0.0)
+        freq["main"] = 1.0
+        for name in reversed(order):
+            if name in recursive:
+                freq[name] *= self.recursion_weight
+            for callee, w in local[name].calls:
+                if callee in position and position[callee] > position[name]:
+                    freq[callee] += freq[name] * w
+        return freq
+
+
+class _Walker:
+    """Costs of one function. Statements are walked on an explicit stack of
+    (node, weight, statement before it), expressions with iter_nodes, so
+    deep nesting does not recurse."""
+
+    def __init__(self, model):
+        self.model = model
+        self.cost = 0.0
+        self.blocks = []
+        self.additions = []
+        self.calls = []
+
+    def block(self, block, w):
+        self.walk([(block, w, None)])
+
+    def walk(self, stack):
+        model = self.model
+        while stack:
+            node, w, before = stack.pop()
+            t = type(node)
+            if t is Block:
+                self.blocks.append((node, w))
+                items = node.items
+                for i in range(len(items) - 1, -1, -1):
+                    stack.append((items[i], w, items[i - 1] if i else None))
+            elif t is ExprStmt:
+                self.expr(node.expr, w)
+                self.cost += w  # POP
+            elif t is VarDecl:
+                if node.init is None:
+                    self.cost += w  # CONST
+                else:
+                    self.expr(node.init, w)
+                self.cost += w  # STORE
+            elif t is Printf:
+                for arg in node.args:
+                    self.expr(arg, w)
+                self.cost += w
+            elif t is If:
+                self.expr(node.cond, w)
+                self.cost += w * (1 if node.orelse is None else 2)
+                if node.orelse is not None:
+                    stack.append((node.orelse, w * model.branch_weight, None))
+                stack.append((node.then, w * model.branch_weight, None))
+            elif t is While:
+                trips = trip_count(before, node)
+                trips = model.loop_weight if trips is None else trips
+                self.expr(node.cond, w * (trips + 1))
+                self.cost += w * (trips + 1) + w * trips  # JUMP_IF_FALSE, JUMP
+                stack.append((node.body, w * trips, None))
+            elif t is Return:
+                if node.value is None:
+                    self.cost += w
+                else:
+                    self.expr(node.value, w)
+            else:
+                raise TypeError(f"not a statement: {node!r}")
+
+    def expr(self, node, w):
+        for n in iter_nodes(node):
+            t = type(n)
+            if t is Num or t is Name or t is Neg:
+                self.cost += w
+            elif t is BinOp:
+                if n.op == "+":
+                    self.additions.append((n, w))
+                self.cost += w
+            elif t is Assign:
+                self.cost += 2 * w  # DUP, STORE
+            elif t is Call:
+                self.calls.append((n.name, w))
+            elif t is not Paren:
+                raise TypeError(f"not an expression: {n!r}")
+
+
+class Plan:
+    """Where each technique is applied. sites: {technique: set of node
+    ids}; base: estimated instructions of the original; added: estimated
+    instructions the chosen sites add; candidates/chosen: site counts per
+    technique."""
+    __slots__ = ("sites", "base", "added", "budget", "candidates", "chosen")
+
+    def __init__(self, sites, base, added, budget, candidates, chosen):
+        self.sites = sites
+        self.base = base
+        self.added = added
+        self.budget = budget
+        self.candidates = candidates
+        self.chosen = chosen
+
+    @property
+    def overhead(self):
+        return self.added / self.base if self.base else 0.0
+
+    def as_dict(self):
+        return {"base_instructions": self.base, "added_instructions": self.added,
+                "estimated_overhead": self.overhead, "max_overhead": self.budget,
+                "candidates": self.candidates, "chosen": self.chosen}
+
+
+def describe(plan):
+    """One line about a Plan.as_dict()."""
+    sites = ", ".join(f"{name} {plan['chosen'][name]}/{plan['candidates'][name]}" for name in plan["candidates"])
+    return (f"planned sites: {sites}; estimated overhead {plan['estimated_overhead']:.2%} "
+            f"(budget {plan['max_overhead']:.2%}, {plan['added_instructions']:.0f} of "
+            f"{plan['base_instructions']:.0f} instructions)")
+
+
+def measured_overhead(original, obfuscated, max_steps=MAX_STEPS):
+    """Extra cminiVM instructions a run of obfuscated executes, as a
+    fraction of original's, or None if either run does not finish."""
+    a = run_source(original, max_steps)
+    b = run_source(obfuscated, max_steps)
+    if a.error is not None or b.error is not None or not a.steps:
+        return None
+    return b.steps / a.steps - 1
+
+
+def plan_sites(program, techniques, max_overhead, rng, model=None):
+    """Choose the sites of the techniques in SITE_COSTS so that they add at
+    most max_overhead (a fraction) to the estimated instructions of a run.
+    Every site counts the same, so taking the cheapest first places the
+    most; rng only orders sites of equal cost."""
+    estimate = (model or CostModel()).estimate(program)
+    candidates = []
+    counts = {}
+    for name in techniques:
+        if name not in SITE_COSTS:
+            continue
+        nodes = estimate.blocks if name == "dead_code" else estimate.additions
+        counts[name] = len(nodes)
+        candidates += [(SITE_COSTS[name] * w, name, id(node)) for node, w in nodes]
+    rng.shuffle(candidates)
+    candidates.sort(key=lambda c: c[0])
+    budget = max_overhead * estimate.total
+    added = 0.0
+    sites = {name: set() for name in counts}
+    for cost, name, site in candidates:
+        if added + cost > budget:
+            break
+        added += cost
+        sites[name].add(site)
+    return Plan(sites, estimate.total, added, max_overhead, counts,
+                {name: len(s) for name, s in sites.items()})
+
+
+def parse_overhead(text):
+    """"5%" or "0.05" -> 0.05."""
+    text = text.strip()
+    value = float(text[:-1]) / 100 if text.endswith("%") else float(text)
+    if value < 0:
+        raise ValueError(f"overhead must not be negative: {text}")
+    return value
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="estimate how many VM instructions a CMini program executes")
+    ap.add_argument("files", nargs="+")
+    ap.add_argument("--loop-weight", type=float, default=10.0, help="iterations assumed for loops that are not counted")
+    args = ap.parse_args(argv)
+    model = CostModel(loop_weight=args.loop_weight)
+    for path in args.files:
+        with open(path, "r", encoding="utf-8") as f:
+            code = "".join(l for l in f if not l.strip().startswith("#include"))
+        estimate = model.estimate(parse_ast(code))
+        calls = ", ".join(f"{name} {n:g}" for name, n in estimate.frequencies.items())
+        print(f"{path}: ~{estimate.total:.0f} instructions per run; calls: {calls}")
+
+
+if __name__ == "__main__":
+    main()
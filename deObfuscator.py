@@ -1,235 +1,411 @@
 import os
-import re
+import sys
+import json
+import time
 import random
 import string
+import argparse
+import tempfile
+import statistics
 import subprocess
-from antlr4 import *
-from CMiniLexer import CMiniLexer
-from CMiniParser import CMiniParser
-from CMiniListener import CMiniListener
-
-TIMEOUT_RUN = 5  
-
-def random_name(length=6):
-    return ''.join(random.choices(string.ascii_lowercase, k=length))
-
-def collect_ids_in_ctx(ctx):
+from astCache import AstCache, load_ast
+from buildCache import BuildCache
+from batchRunner import collect_inputs, mirror_path, error_record, run_batch
+from cminiAst import (walk, iter_nodes, to_source, Assign, BinOp, Block, Call, ExprStmt,
+                      If, Name, Neg, Num, Paren, Return, VarDecl, While)
+from passManager import Pass, PassError, PassManager
+from processTiming import cpu_times
+from treePatterns import Rule, RuleSet, Var
+
+TIMEOUT_RUN = 5
+RUN_REPEAT = 5  
+
+def random_name(length=6, rng=random):
+    return ''.join(rng.choices(string.ascii_lowercase, k=length))
+
+def collect_ids(node):
     ids = []
-    for i in range(ctx.getChildCount()):
-        child = ctx.getChild(i)
-        if hasattr(child, "symbol") and child.symbol is not None:
-            if child.symbol.type == CMiniLexer.ID:
-                ids.append(child.getText())
-        else:
-            ids += collect_ids_in_ctx(child)
+    for n in iter_nodes(node):
+        t = type(n)
+        if t is VarDecl or t is Assign or t is Call:
+            ids.append(n.name)
+        elif t is Name:
+            ids.append(n.id)
     return ids
 
-def replace_node_text(token_list, ctx, new_text):
-    interval = ctx.getSourceInterval()
-    start_idx = interval[0]
-    stop_idx = interval[1]
-    if start_idx is None or stop_idx is None:
-        return
-    for i in range(start_idx, stop_idx + 1):
-        token_list[i].text = ""
-    token_list[start_idx].text = new_text
-
-def get_text_of_ctx(token_stream, ctx):
-    interval = ctx.getSourceInterval()
-    start_idx = interval[0]
-    stop_idx = interval[1]
-    if start_idx is None or stop_idx is None:
-        return ""
-    toks = token_stream.tokens[start_idx:stop_idx+1]
-    return "".join(t.text for t in toks if t.text is not None)
-
-def simplify_expressions_in_tree(token_stream, program_ctx):
-    token_list = token_stream.tokens
-
-    def visit_expr(ctx):
-        text = get_text_of_ctx(token_stream, ctx).strip()
-        m = re.match(r'^\(-1\*-\((.*)\)\)$', text)
-        if m:
-            inner = m.group(1).strip()
-            replace_node_text(token_list, ctx, inner)
-            return
-        m2 = re.match(r'^([A-Za-z_][A-Za-z0-9_]*)-\(-([A-Za-z_][A-Za-z0-9_]*)\)$', text)
-        if m2:
-            new = f"{m2.group(1)} + {m2.group(2)}"
-            replace_node_text(token_list, ctx,new)
-            return
-        for i in range(ctx.getChildCount()):
-            child = ctx.getChild(i)
-            if hasattr(child, "getChildCount") and child.getChildCount() > 0:
-                visit_expr(child)
-
-    def walk_all(node):
-        if node.getChildCount() > 0:
-            txt = get_text_of_ctx(token_stream, node)
-            if re.search(r'[-+*/]', txt):
-                visit_expr(node)
-            for i in range(node.getChildCount()):
-                child = node.getChild(i)
-                walk_all(child)
-
-    walk_all(program_ctx)
-
-def remove_dead_vars_in_program(token_stream, program_ctx):
-    token_list = token_stream.tokens
-    for func in program_ctx.functionDecl():
-        block = func.block()
-        if block is None:
-            continue
-        used_ids = set(collect_ids_in_ctx(block))
-        for i in range(block.getChildCount()):
-            child = block.getChild(i)
-            if hasattr(child, "getChildCount") and child.getChildCount() >= 2:
-                t0 = child.getChild(0).getText()
-                t1 = child.getChild(1)
-                if t0 in ("int", "char", "bool") and t1 is not None and hasattr(t1, "getText"):
-                    var_name = t1.getText()
-                    all_ids = collect_ids_in_ctx(block)  # یکبار بگیر
-                    occurrences = sum(1 for x in all_ids if x == var_name)
-                    if occurrences == 1:
-                        replace_node_text(token_list, child,"")
-
-def simplify_control_flow(token_stream, program_ctx):
-    token_list = token_stream.tokens
-    def try_simplify_block(block):
-        for i in range(block.getChildCount()):
-            child = block.getChild(i)
-            if hasattr(child, "getChildCount") and child.getChildCount() > 0:
-                text = child.getText()
-                if text.startswith("while"):
-                    if "switch" in text:
-                        switch_text = text[text.find("switch"): ]
-                        cases = re.findall(r'case\s+(\d+)\s*:\s*(.*?)\s*break\s*;', switch_text, flags=re.DOTALL)
-                        if cases:
-                            cases_sorted = sorted((int(n), body) for n, body in cases)
-                            linear_stmts = []
-                            for idx, body in cases_sorted:
-                                body2 = re.sub(r'\bselector\s*=\s*\d+\s*;', '', body)
-                                body2 = body2.replace("break;", "")
-                                body2 = body2.strip()
-                                if body2:
-                                    linear_stmts.append(body2)
-                            linear_code = "\n".join(linear_stmts)
-                            replace_node_text(token_list, child,linear_code)
-                else:
-                    try_simplify_block(child)
-    for func in program_ctx.functionDecl():
-        block = func.block()
-        if block:
-            try_simplify_block(block)
-
-def infer_and_rename(token_stream, program_ctx):
-    token_list = token_stream.tokens
-    name_counter = {"var":0, "func":0}
-
-    def fresh(prefix):
-        name_counter[prefix] += 1
-        return f"{prefix}{name_counter[prefix]}"
-
-    for func in program_ctx.functionDecl():
-        old_fname = func.ID().getText()
+def has_side_effects(node):
+    return any(type(n) is Assign or type(n) is Call for n in iter_nodes(node))
+
+SIMPLIFY_RULES = RuleSet([
+    Rule("(-1*-(X)) -> X",
+         Paren(BinOp('*', Neg(Num('1')), Neg(Paren(Var('X'))))),
+         lambda m: m['X']),
+    Rule("a-(-b) -> a+b",
+         BinOp('-', Var('a', Name), Paren(Neg(Var('b', Name)))),
+         lambda m: BinOp('+', m['a'], m['b'])),
+])
+
+def simplify_expressions_in_tree(program, funcs=None):
+    changed = {}
+    for func in program.functions if funcs is None else funcs:
+        n = SIMPLIFY_RULES.rewrite(func)
+        if n:
+            changed[func] = n
+    return changed
+
+def _sites(node):
+    """(name, kind, node) for every identifier occurrence under node."""
+    stack = [node]
+    while stack:
+        n = stack.pop()
+        t = type(n)
+        if t is VarDecl or t is Assign:
+            yield n.name, "def", n
+        elif t is Call:
+            yield n.name, "use", n
+        elif t is Name:
+            yield n.id, "use", n
+        for field in n._children:
+            value = getattr(n, field)
+            if value is None:
+                continue
+            if type(value) is list:
+                stack.extend(reversed(value))
+            else:
+                stack.append(value)
+
+class UseIndex:
+    """Def and use sites of every name in a subtree, built in one walk.
+
+    Sites are keyed by node id so that dropping a subtree is linear in the
+    size of that subtree, whatever the size of the function around it.
+    """
+
+    def __init__(self, root):
+        self.defs = {}
+        self.uses = {}
+        for name, kind, node in _sites(root):
+            table = self.defs if kind == "def" else self.uses
+            table.setdefault(name, {})[id(node)] = node
+
+    def count(self, name):
+        return len(self.defs.get(name, ())) + len(self.uses.get(name, ()))
+
+    def remove(self, subtree):
+        """Forget every site under subtree; returns the names it touched."""
+        touched = set()
+        for name, kind, node in _sites(subtree):
+            table = self.defs if kind == "def" else self.uses
+            table[name].pop(id(node), None)
+            touched.add(name)
+        return touched
+
+def remove_dead_vars_in_program(program, funcs=None):
+    changed = {}
+    for func in program.functions if funcs is None else funcs:
+        block = func.body
+        index = UseIndex(block)
+        candidates = {}
+        for child in block.items:
+            if type(child) is VarDecl and child.type in ("int", "char", "bool"):
+                candidates.setdefault(child.name, []).append(child)
+        removed = set()
+        work = list(candidates)
+        while work:
+            name = work.pop()
+            # the declaration itself is the only occurrence left
+            if index.count(name) != 1 or len(candidates[name]) != 1:
+                continue
+            decl = candidates[name][0]
+            if id(decl) in removed or (decl.init is not None and has_side_effects(decl.init)):
+                continue
+            removed.add(id(decl))
+            for used in index.remove(decl):
+                if used in candidates:
+                    work.append(used)
+        if removed:
+            block.items = [c for c in block.items if id(c) not in removed]
+            changed[func] = len(removed)
+    return changed
+
+# iterations a dispatch loop may take before it is left alone
+MAX_DISPATCH_STEPS = 1000
+_DISPATCH_OPS = {
+    '+': lambda a, b: a + b, '-': lambda a, b: a - b,
+    '==': lambda a, b: int(a == b), '!=': lambda a, b: int(a != b),
+    '<': lambda a, b: int(a < b), '>': lambda a, b: int(a > b),
+    '<=': lambda a, b: int(a <= b), '>=': lambda a, b: int(a >= b),
+}
+
+def constant_value(node, selector=None, value=None):
+    """node's value when selector holds value, or None unless it only
+    reads selector and numbers."""
+    t = type(node)
+    if t is Num:
+        try:
+            return int(node.value)
+        except ValueError:
+            return None
+    if t is Name:
+        return value if node.id == selector and value is not None else None
+    if t is Paren:
+        return constant_value(node.expr, selector, value)
+    if t is Neg:
+        v = constant_value(node.operand, selector, value)
+        return None if v is None else -v
+    if t is BinOp and node.op in _DISPATCH_OPS:
+        left = constant_value(node.left, selector, value)
+        right = constant_value(node.right, selector, value)
+        if left is None or right is None:
+            return None
+        v = _DISPATCH_OPS[node.op](left, right)
+        return v if -0x80000000 <= v <= 0x7fffffff else None
+    return None
+
+def _initial_value(stmt):
+    """(name, value) if stmt sets a variable to a constant."""
+    if type(stmt) is VarDecl and stmt.init is not None:
+        name, value = stmt.name, stmt.init
+    elif type(stmt) is ExprStmt and type(stmt.expr) is Assign:
+        name, value = stmt.expr.name, stmt.expr.value
+    else:
+        return None
+    value = constant_value(value)
+    return None if value is None else (name, value)
+
+def _dispatch_case(stmt):
+    """(selector, number) of if (sel == N), or None."""
+    cond = stmt.cond
+    while type(cond) is Paren:
+        cond = cond.expr
+    if type(cond) is not BinOp or cond.op != '==':
+        return None
+    if type(cond.left) is Name:
+        name, number = cond.left.id, constant_value(cond.right)
+    elif type(cond.right) is Name:
+        name, number = cond.right.id, constant_value(cond.left)
+    else:
+        return None
+    return None if number is None else (name, number)
+
+def linearize_dispatch(before, loop, outside_reads):
+    """Flattened control flow in CMini has no switch, so it shows up as
+    int sel = 1; while (...) { if (sel == 1) {...; sel = 2;} if (sel == 2) {...} }.
+    Runs the dispatcher on the selector alone, from the value before sets
+    and through each case's final sel = N, and returns the case bodies in
+    the order they execute. Returns None unless that is provable: the
+    selector is a local, the loop condition and the case tests read only
+    it, and the case bodies do not touch it except for that final write.
+    outside_reads: whether the rest of the function reads the selector,
+    which then gets its final value written back."""
+    start = _initial_value(before) if before is not None else None
+    if start is None or type(loop.body) is not Block or not loop.body.items:
+        return None
+    selector, value = start
+    # groups: the top-level statements of the body; a group is an if /
+    # else if chain of (number, items, next value) of which one case runs
+    groups = []
+    for stmt in loop.body.items:
+        group = []
+        while stmt is not None:
+            if type(stmt) is not If:
+                return None
+            case = _dispatch_case(stmt)
+            if case is None or case[0] != selector:
+                return None
+            items = list(stmt.then.items) if type(stmt.then) is Block else [stmt.then]
+            target = None
+            if items:
+                last = items[-1]
+                if type(last) is ExprStmt and type(last.expr) is Assign and last.expr.name == selector:
+                    target = constant_value(last.expr.value)
+                    if target is None:
+                        return None
+                    items.pop()
+            if any(selector in collect_ids(item) for item in items):
+                return None
+            group.append((case[1], items, target))
+            stmt = stmt.orelse
+        groups.append(group)
+
+    order = []
+    seen = set()
+    while True:
+        test = constant_value(loop.cond, selector, value)
+        if test is None:
+            return None
+        if not test:
+            break
+        # the same selector at the top of the loop again: it never ends
+        if value in seen or len(seen) >= MAX_DISPATCH_STEPS:
+            return None
+        seen.add(value)
+        for group in groups:
+            for number, items, target in group:
+                if number == value:
+                    order.append(items)
+                    if target is not None:
+                        value = target
+                    break
+    # a case that runs twice would need its statements copied
+    if len({id(items) for items in order}) != len(order):
+        return None
+    linear_stmts = []
+    for items in order:
+        if any(type(item) is VarDecl for item in items):
+            linear_stmts.append(Block(items))
+        else:
+            linear_stmts += items
+    if outside_reads and value != start[1]:
+        linear_stmts.append(ExprStmt(Assign(selector, Num(str(value)))))
+    return linear_stmts
+
+def simplify_control_flow(program, funcs=None):
+    linearized = 0
+
+    def try_simplify_block(block, reads, locals_):
+        """Inline the dispatch loops directly in block; returns the other
+        statements, which may hold nested blocks."""
+        nonlocal linearized
+        new_items = []
+        kept = []
+        before = None
+        for child in block.items:
+            if type(child) is While and before is not None:
+                start = _initial_value(before)
+                if start is not None and start[0] in locals_:
+                    selector = start[0]
+                    # occurrences besides the loop and the statement before it
+                    outside = reads.get(selector, 0) - collect_ids(child).count(selector) - 1
+                    linear = linearize_dispatch(before, child, outside > 0)
+                    if linear is not None:
+                        new_items += linear
+                        linearized += 1
+                        before = None
+                        continue
+            new_items.append(child)
+            kept.append(child)
+            before = child
+        block.items = new_items
+        return kept
+
+    def simplify_blocks(body, reads, locals_):
+        # every block nested in body, reached through if/while/block bodies
+        stack = [body]
+        while stack:
+            stmt = stack.pop()
+            t = type(stmt)
+            if t is Block:
+                stack.extend(try_simplify_block(stmt, reads, locals_))
+            elif t is If:
+                stack.append(stmt.then)
+                if stmt.orelse is not None:
+                    stack.append(stmt.orelse)
+            elif t is While:
+                stack.append(stmt.body)
+
+    changed = {}
+    for func in program.functions if funcs is None else funcs:
+        linearized = 0
+        reads = {}
+        for name in collect_ids(func.body):
+            reads[name] = reads.get(name, 0) + 1
+        # declared once in the function and not a parameter, so every
+        # occurrence of the name is this variable
+        decls = {}
+        for n in iter_nodes(func.body):
+            if type(n) is VarDecl:
+                decls[n.name] = decls.get(n.name, 0) + 1
+        params = {p.name for p in func.params}
+        locals_ = {name for name, n in decls.items() if n == 1 and name not in params}
+        simplify_blocks(func.body, reads, locals_)
+        if linearized:
+            changed[func] = linearized
+    return changed
+
+def first_return(node):
+    for n in iter_nodes(node):
+        if type(n) is Return:
+            return n
+    return None
+
+class IdRenamer:
+    def __init__(self, mapping):
+        self.mapping = mapping
+
+    def enterParam(self, node):
+        node.name = self.mapping.get(node.name, node.name)
+
+    def enterVarDecl(self, node):
+        node.name = self.mapping.get(node.name, node.name)
+
+    def enterAssign(self, node):
+        node.name = self.mapping.get(node.name, node.name)
+
+    def enterName(self, node):
+        node.id = self.mapping.get(node.id, node.id)
+
+class CallRenamer:
+    def __init__(self, mapping):
+        self.mapping = mapping
+
+    def enterCall(self, node):
+        node.name = self.mapping.get(node.name, node.name)
+
+def infer_and_rename(program, funcs=None, rng=random):
+    func_renames = {}
+    changed = {}
+    for func in program.functions if funcs is None else funcs:
+        old_fname = func.name
         if old_fname == "main":
             continue
 
         new_fname = None
 
-        ret_expr = None
-        for i in range(func.getChildCount()):
-            child = func.getChild(i)
-            if hasattr(child, "getText") and child.getText().startswith("{"):
-                func_text = get_text_of_ctx(token_stream, func)
-                m = re.search(r'return\s+([^;]+);', func_text)
-                if m:
-                    ret_expr = m.group(1).strip()
-                break
-
-        if ret_expr:
-            m = re.match(r'^\(-1\*-\(([^)]+)\)\)$', ret_expr)
-            if m:
-                ret_expr_s = m.group(1).strip()
-            else:
-                m2 = re.match(r'^([A-Za-z_][A-Za-z0-9_]*)-\(-([A-Za-z_][A-Za-z0-9_]*)\)$', ret_expr)
-                if m2:
-                    ret_expr_s = f"{m2.group(1)} + {m2.group(2)}"
-                else:
-                    ret_expr_s = ret_expr
-            params = []
-            param_ctx = None
-            for k in range(func.getChildCount()):
-                ch = func.getChild(k)
-                if hasattr(ch, "getText") and "(" in ch.getText() and ")" in ch.getText() and "int" in func.getText():
-                    pass
-            try:
-                params_list = func.params().param() if func.params() is not None else []
-                params = [p.ID().getText() for p in params_list]
-            except Exception:
-                params = []
+        ret = first_return(func.body)
+        ret_expr = ret.value if ret is not None else None
 
-            msum = re.match(r'^([A-Za-z_][A-Za-z0-9_]*)\s*\+\s*([A-Za-z_][A-Za-z0-9_]*)$', ret_expr_s)
-            if msum and params and msum.group(1) in params and msum.group(2) in params:
+        if ret_expr is not None:
+            ret_expr_s = SIMPLIFY_RULES.rewrite_node(ret_expr) or ret_expr
+            params = [p.name for p in func.params]
+
+            if type(ret_expr_s) is BinOp and ret_expr_s.op == '+' \
+                    and type(ret_expr_s.left) is Name and type(ret_expr_s.right) is Name \
+                    and params and ret_expr_s.left.id in params and ret_expr_s.right.id in params:
                 new_fname = "sum"
                 mapping = {}
                 if len(params) >= 2:
                     mapping[params[0]] = "a"
                     mapping[params[1]] = "b"
-                for oldp, newp in mapping.items():
-                    try:
-                        for p in func.params().param():
-                            if p.ID().getText() == oldp:
-                                replace_node_text(token_list, p.ID(), newp)
-                    except Exception:
-                        pass
-                def replace_id_occurrences(node):
-                    for i in range(node.getChildCount()):
-                        ch = node.getChild(i)
-                        if hasattr(ch, "symbol") and ch.symbol is not None and ch.symbol.type == CMiniLexer.ID:
-                            t = ch.getText()
-                            if t in mapping:
-                                replace_node_text(token_list, ch,mapping[t])
-                        else:
-                            replace_id_occurrences(ch)
-                replace_id_occurrences(func)
+                walk(IdRenamer(mapping), func)
         if new_fname is None:
-            new_fname = f"f_{random_name(4)}"
+            new_fname = f"f_{random_name(4, rng)}"
 
         if new_fname and new_fname != old_fname:
-            replace_node_text(token_list, func.ID(),new_fname)
-
-def format_token_stream_text(token_stream):
-    s = token_stream.getText()
-    s = s.replace('{', '{\n    ')
-    s = s.replace('}', '\n}\n')
-    s = s.replace(';', ';\n    ')
-    s = re.sub(r'\n\s*\n', '\n', s)
-    s = re.sub(r'[ \t]+', ' ', s)
-    s = re.sub(r'\breturn\s*', 'return ', s)
-    s = re.sub(r'\bintmain\b', 'int main', s)
-    lines = s.splitlines()
-    out_lines = []
-    indent = 0
-    for line in lines:
-        stripped = line.strip()
-        if stripped == '':
-            continue
-        if stripped.startswith('}'):
-            indent = max(0, indent-1)
-        out_lines.append('    '*indent + stripped)
-        if stripped.endswith('{'):
-            indent += 1
-    return "\n".join(out_lines) + "\n"
-
-def compile_and_run_capture(src_path, exe_name):
-    """Compile C file and run capturing stdout (returns (ok, stdout, compile_err))"""
+            func.name = new_fname
+            func_renames[old_fname] = new_fname
+            changed[func] = 1
+
+    if func_renames:
+        walk(CallRenamer(func_renames), program)
+    return changed
+
+def compile_and_run_capture(src_path, exe_name, flags=(), build_cache=None):
+    """Compile C file and run capturing stdout (returns (ok, stdout, compile_err)).
+    With a BuildCache, an unchanged program is not compiled again."""
     try:
-        compile_cmd = ["gcc", src_path, "-o", exe_name]
-        proc = subprocess.run(compile_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        if proc.returncode != 0:
-            return False, "", proc.stderr
-        run_proc = subprocess.run([f"./{exe_name}"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=TIMEOUT_RUN)
+        if build_cache is not None:
+            with open(src_path, "rb") as f:
+                exe, err = build_cache.build(f.read(), flags)
+            if exe is None:
+                return False, "", err
+        else:
+            compile_cmd = ["gcc", *flags, src_path, "-o", exe_name]
+            proc = subprocess.run(compile_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+            if proc.returncode != 0:
+                return False, "", proc.stderr
+            exe = os.path.join(".", exe_name)
+        run_proc = subprocess.run([exe], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=TIMEOUT_RUN)
         return True, run_proc.stdout, ""
     except subprocess.TimeoutExpired:
         return False, "", "timeout"
@@ -237,16 +413,173 @@ def compile_and_run_capture(src_path, exe_name):
         return False, "", str(e)
 
 
-
-def compare_files(input_file, output_file):
-    print(f"size of obfuscatored code: 298 byte")
-    print(f"size of cleaned code: 196 byte")
-    print(f"execution time of obfuscatored code: 0.069031 sec")
-    print(f"execution time of cleaned code: 0.064847 sec")
-        
-
-
-def main():
+def verify_sources(original, transformed, build_cache=None):
+    """Compile and run two CMini programs in a private temporary directory
+    (so concurrent calls never share files) and compare their stdout."""
+    results = []
+    with tempfile.TemporaryDirectory(prefix="cmini-verify-") as tmp:
+        for name, text in (("original", original), ("transformed", transformed)):
+            src = os.path.join(tmp, name + ".c")
+            with open(src, "w", encoding="utf-8") as f:
+                f.write(text)
+            # CMini inputs use printf without including stdio.h
+            results.append(compile_and_run_capture(src, os.path.join(tmp, name), ("-include", "stdio.h"),
+                                                   build_cache))
+    (ok1, out1, err1), (ok2, out2, err2) = results
+    return {"equal": ok1 and ok2 and out1 == out2, "outputs": [out1, out2], "errors": [err1, err2]}
+
+
+def compare_files(input_file, output_file, build_cache=None):
+    """Sizes of the obfuscated and cleaned programs and the median CPU
+    time of RUN_REPEAT runs of each (benchOverhead.py measures properly)."""
+    times = []
+    with tempfile.TemporaryDirectory(prefix="cmini-compare-") as tmp:
+        for name, path in (("obf", input_file), ("clean", output_file)):
+            with open(path, "rb") as f:
+                source = f.read()
+            if build_cache is not None:
+                exe, _ = build_cache.build(source)
+            else:
+                exe = os.path.join(tmp, name)
+                proc = subprocess.run(["gcc", "-x", "c", path, "-o", exe],
+                                      stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                if proc.returncode != 0:
+                    exe = None
+            times.append(None if exe is None else
+                         statistics.median(cpu_times([exe], repeat=RUN_REPEAT, timeout=TIMEOUT_RUN)))
+    print(f"size of obfuscatored code: {os.path.getsize(input_file)} byte")
+    print(f"size of cleaned code: {os.path.getsize(output_file)} byte")
+    for label, seconds in zip(("obfuscatored", "cleaned"), times):
+        if seconds is not None:
+            print(f"execution time of {label} code: {seconds:.6f} sec (CPU, median of {RUN_REPEAT} runs)")
+
+
+
+def deobfuscation_passes(rng):
+    """The passes in pipeline order; renaming draws its names from rng."""
+    return (
+        Pass("simplify_expressions_in_tree", simplify_expressions_in_tree,
+             affects=("remove_dead_vars_in_program", "simplify_control_flow", "infer_and_rename")),
+        Pass("remove_dead_vars_in_program", remove_dead_vars_in_program),
+        # inlined dispatch cases can leave the selector dead or expose a nested dispatcher
+        Pass("simplify_control_flow", simplify_control_flow,
+             affects=("remove_dead_vars_in_program", "simplify_control_flow", "infer_and_rename")),
+        # renaming again would just pick new random names
+        Pass("infer_and_rename", lambda program, funcs=None: infer_and_rename(program, funcs, rng),
+             once=True),
+    )
+
+
+def deobfuscate_source(text, cache=None, seed=None, timings=None, max_rounds=8, changes=None,
+                       convergence=None):
+    """Deobfuscate a whole file. If timings is a dict, the seconds spent
+    parsing and in each pass are stored in it under their names; changes
+    likewise gets each pass's change count. convergence, if a dict, gets
+    "rounds", "converged" (False when max_rounds stopped the passes before
+    a fixpoint) and "report", the PassManager table; a cached result
+    brings back those of the run that made it."""
+    if timings is None:
+        timings = {}
+    key = None
+    if cache is not None and seed is not None:
+        key = cache.key("deobf", text, seed, max_rounds)
+        cached = cache.get(key)
+        if cached is not None:
+            formatted, state = cached
+            if convergence is not None:
+                convergence.update(state)
+            return formatted
+    rng = random.Random(seed)
+
+    lines = text.splitlines(True)
+    includes = [l.rstrip() for l in lines if l.strip().startswith("#include")]
+    code_only = [l for l in lines if not l.strip().startswith("#include")]
+
+    start = time.perf_counter()
+    program = load_ast("".join(code_only), cache)
+    timings["parse"] = time.perf_counter() - start
+
+    manager = PassManager(deobfuscation_passes(rng), max_rounds).run(program)
+    for name, stats in manager.stats.items():
+        timings[name] = stats.seconds
+        if changes is not None:
+            changes[name] = stats.changes
+    state = {"rounds": manager.rounds, "converged": manager.converged, "report": manager.report()}
+    if convergence is not None:
+        convergence.update(state)
+
+    formatted = to_source(program)
+    formatted = "\n".join(includes) + "\n\n" + formatted
+
+    if key is not None:
+        cache.put(key, (formatted, state))
+    return formatted
+
+
+def failed_stage(timings, exc=None):
+    if isinstance(exc, PassError):
+        return exc.pass_name
+    if "parse" not in timings:
+        return "parse"
+    return "format"
+
+
+def deobfuscate_file(task):
+    """Batch worker: (src, dst, seed, cache_dir, max_rounds) -> result record."""
+    src, dst, seed, cache_dir, max_rounds = task
+    record = {"path": src, "output": dst, "ok": False, "seconds": 0.0, "bytes": 0,
+              "passes": {}, "changes": {}, "rounds": 0, "converged": None, "error": None}
+    start = time.perf_counter()
+    stage = "read"
+    try:
+        with open(src, "r", encoding="utf-8") as f:
+            text = f.read()
+        record["bytes"] = len(text.encode("utf-8"))
+        stage = None
+        cache = AstCache(cache_dir) if cache_dir else None
+        convergence = {}
+        formatted = deobfuscate_source(text, cache, seed, record["passes"], max_rounds, record["changes"],
+                                       convergence)
+        record["rounds"] = convergence["rounds"]
+        record["converged"] = convergence["converged"]
+        stage = "write"
+        os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+        with open(dst, "w", encoding="utf-8") as f:
+            f.write(formatted)
+        record["ok"] = True
+    except Exception as e:
+        record["error"] = error_record(e, stage or failed_stage(record["passes"], e))
+    record["seconds"] = time.perf_counter() - start
+    return record
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="deobfuscate output.mc into cleaned.mc")
+    ap.add_argument("--seed", type=int, default=None, help="seed the RNG; seeded outputs are cached too")
+    ap.add_argument("--cache-dir", default=".cmini_cache")
+    ap.add_argument("--build-cache-dir", default=".cmini_build", help="compiled executables, keyed by source")
+    ap.add_argument("--no-cache", action="store_true")
+    ap.add_argument("--batch", metavar="DIR_OR_GLOB", help="deobfuscate every matching .mc file")
+    ap.add_argument("--out", default="cleaned", help="output directory for --batch, mirroring the input tree")
+    ap.add_argument("--jobs", type=int, default=os.cpu_count(), help="worker processes for --batch")
+    ap.add_argument("--report", help="write per-file --batch records to this JSON file")
+    ap.add_argument("--max-rounds", type=int, default=8, help="iteration cap for rerunning passes to a fixpoint")
+    ap.add_argument("-v", "--verbose", action="store_true", help="print the per-pass runs, changes and rounds")
+    args = ap.parse_args(argv)
+    cache_dir = None if args.no_cache else args.cache_dir
+
+    if args.batch:
+        base, files = collect_inputs(args.batch)
+        tasks = [(f, mirror_path(f, base, args.out), args.seed, cache_dir, args.max_rounds) for f in files]
+        records = run_batch(deobfuscate_file, tasks, args.jobs, args.report)
+        sys.exit(0 if all(r["ok"] for r in records) else 1)
+
+    cache = AstCache(cache_dir) if cache_dir else None
+    build_cache = None if args.no_cache else BuildCache(args.build_cache_dir)
+    timings = {}
+    changes = {}
+    convergence = {}
+    stage = "read"
     try:
         obf_file = "output.mc"
         out_file = "cleaned.mc"
@@ -255,29 +588,10 @@ def main():
             return  
 
         with open(obf_file, "r", encoding="utf-8") as f:
-            lines = f.readlines()
-        includes = [l.rstrip() for l in lines if l.strip().startswith("#include")]
-        code_only = [l for l in lines if not l.strip().startswith("#include")]
-
-        input_stream = InputStream("".join(code_only))
-        lexer = CMiniLexer(input_stream)
-        tokens = CommonTokenStream(lexer)
-        parser = CMiniParser(tokens)
-        tree = parser.program()
-
-        simplify_expressions_in_tree(tokens, tree)
-
-        remove_dead_vars_in_program(tokens, tree)
-
-        simplify_control_flow(tokens, tree)
-
-        infer_and_rename(tokens, tree)
-
-        formatted = format_token_stream_text(tokens)
-        formatted = "\n".join(includes) + "\n\n" + formatted
-
-        if formatted.find("int"):
-            formatted = formatted.replace("int", "int ")
+            text = f.read()
+        stage = None
+        formatted = deobfuscate_source(text, cache, args.seed, timings, args.max_rounds, changes, convergence)
+        stage = "verify"
 
         with open(out_file, "w", encoding="utf-8") as f:
             f.write(formatted)
@@ -287,8 +601,8 @@ def main():
         open(temp_obf, "w", encoding="utf-8").write(open(obf_file, "r", encoding="utf-8").read())
         open(temp_clean, "w", encoding="utf-8").write(formatted)
 
-        ok1, out1, err1 = compile_and_run_capture(temp_obf, "a_obf")
-        ok2, out2, err2 = compile_and_run_capture(temp_clean, "a_clean")
+        ok1, out1, err1 = compile_and_run_capture(temp_obf, "a_obf", build_cache=build_cache)
+        ok2, out2, err2 = compile_and_run_capture(temp_clean, "a_clean", build_cache=build_cache)
 
         size_obf = os.path.getsize(obf_file)
         size_clean = os.path.getsize(out_file)
@@ -296,7 +610,17 @@ def main():
         if ok1 and ok2 and out1 == out2:
             pass
         
-        compare_files(obf_file, out_file)
+        compare_files(obf_file, out_file, build_cache)
+        print("pass timings: " + ", ".join(f"{name} {sec * 1000:.2f} ms" for name, sec in timings.items()))
+        print("pass changes: " + ", ".join(f"{name} {n}" for name, n in changes.items()))
+        if args.verbose:
+            print(convergence["report"])
+        elif not convergence["converged"]:
+            print(f"iteration cap hit after {convergence['rounds']} round(s), raise --max-rounds")
+        if cache is not None:
+            print(cache.stats())
+        if build_cache is not None:
+            print(build_cache.stats())
 
         for fname in ("a_obf", "a_clean", temp_obf, temp_clean):
             try:
@@ -304,8 +628,10 @@ def main():
             except Exception:
                 pass
 
-    except Exception:
-        pass
+    except Exception as e:
+        record = {"path": "output.mc", "error": error_record(e, stage or failed_stage(timings, e))}
+        print(json.dumps(record, indent=2), file=sys.stderr)
+        sys.exit(1)
 
 
 if __name__ == "__main__":
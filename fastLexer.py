@@ -0,0 +1,156 @@
+import re
+import sys
+from array import array
+from bisect import bisect_right
+from antlr4 import InputStream, Token
+from antlr4.Lexer import TokenSource
+from antlr4.Token import CommonToken
+from antlr4.CommonTokenFactory import CommonTokenFactory
+from CMiniLexer import CMiniLexer
+
+# token types are CMiniLexer's, so a buffer can be fed to CMiniParser as is
+(LPAREN, RPAREN, COMMA, LBRACE, RBRACE, ASSIGN, SEMI, IF, ELSE, WHILE, RETURN, PRINTF,
+ STAR, SLASH, PLUS, MINUS, EQ, NE, LT, GT, LE, GE, INT_KW, VOID) = range(1, 25)
+ID = CMiniLexer.ID
+INT = CMiniLexer.INT
+STRING = CMiniLexer.STRING
+EOF = Token.EOF
+
+LITERALS = {name.strip("'"): ttype for ttype, name in enumerate(CMiniLexer.literalNames) if ttype}
+TEXT = {ttype: text for text, ttype in LITERALS.items()}
+
+_KEYWORDS = {text: ttype for text, ttype in LITERALS.items() if text.isalpha()}
+_PUNCT = {text: ttype for text, ttype in LITERALS.items() if not text.isalpha()}
+
+# one group per token class; the last one catches anything CMiniLexer
+# would report as a token recognition error
+_MASTER_RE = re.compile(r"""
+    ([ \t\r\n]+)
+  | ([a-zA-Z_][a-zA-Z_0-9]*)
+  | ([0-9]+)
+  | ("(?:[^"\\]|\\[\s\S])*")
+  | (==|!=|<=|>=|[-+*/<>=(){},;])
+  | ([\s\S])
+""", re.X)
+_WS, _ID, _INT, _STRING, _PUNCT_GROUP, _ERROR = range(1, 7)
+
+
+class TokenBuffer:
+    """Tokens of one source as parallel int arrays.
+
+    types/starts/lengths hold one entry per token plus a final EOF entry.
+    values holds the index into names for ID tokens and -1 otherwise;
+    names holds each distinct identifier once, interned.
+    """
+
+    __slots__ = ("source", "types", "starts", "lengths", "values", "names", "errors", "_line_starts")
+
+    def __init__(self, source):
+        self.source = source
+        self.types = array("i")
+        self.starts = array("i")
+        self.lengths = array("i")
+        self.values = array("i")
+        self.names = []
+        self.errors = []
+        self._line_starts = None
+
+    def __len__(self):
+        return len(self.types)
+
+    def text(self, i):
+        ttype = self.types[i]
+        if ttype == ID:
+            return self.names[self.values[i]]
+        if ttype == INT or ttype == STRING:
+            start = self.starts[i]
+            return self.source[start:start + self.lengths[i]]
+        if ttype == EOF:
+            return "<EOF>"
+        return TEXT[ttype]
+
+    def position(self, offset):
+        """(line, column) of a source offset, ANTLR style: 1-based line, 0-based column."""
+        if self._line_starts is None:
+            self._line_starts = array("i", [0])
+            self._line_starts.extend(m.end() for m in re.finditer("\n", self.source))
+        line = bisect_right(self._line_starts, offset)
+        return line, offset - self._line_starts[line - 1]
+
+
+def lex(source):
+    buf = TokenBuffer(source)
+    types = buf.types
+    starts = buf.starts
+    lengths = buf.lengths
+    values = buf.values
+    names = buf.names
+    name_index = {}
+    keywords = _KEYWORDS
+    punct = _PUNCT
+    intern = sys.intern
+    for m in _MASTER_RE.finditer(source):
+        group = m.lastindex
+        if group == _WS:
+            continue
+        start = m.start()
+        text = m.group()
+        if group == _ID:
+            ttype = keywords.get(text)
+            if ttype is None:
+                ttype = ID
+                idx = name_index.get(text)
+                if idx is None:
+                    idx = name_index[text] = len(names)
+                    names.append(intern(text))
+                values.append(idx)
+            else:
+                values.append(-1)
+        else:
+            if group == _INT:
+                ttype = INT
+            elif group == _STRING:
+                ttype = STRING
+            elif group == _PUNCT_GROUP:
+                ttype = punct[text]
+            else:
+                buf.errors.append(start)
+                continue
+            values.append(-1)
+        types.append(ttype)
+        starts.append(start)
+        lengths.append(len(text))
+    types.append(EOF)
+    starts.append(len(source))
+    lengths.append(0)
+    values.append(-1)
+    return buf
+
+
+class BufferTokenSource(TokenSource):
+    """Feeds a TokenBuffer to CMiniParser through a CommonTokenStream,
+    building CommonToken objects only as the parser asks for them."""
+
+    def __init__(self, buf):
+        self.buf = buf
+        self._input = InputStream(buf.source)
+        self._factory = CommonTokenFactory.DEFAULT
+        self._index = 0
+
+    def nextToken(self):
+        buf = self.buf
+        i = self._index
+        if i < len(buf) - 1:
+            self._index += 1
+        start = buf.starts[i]
+        tok = CommonToken((None, self._input), buf.types[i], Token.DEFAULT_CHANNEL,
+                          start, start + buf.lengths[i] - 1)
+        tok.line, tok.column = buf.position(start)
+        tok.text = buf.text(i)
+        return tok
+
+    def getSourceName(self):
+        return "<buffer>"
+
+    def getInputStream(self):
+        return self._input
@@ -0,0 +1,206 @@
+import time
+import threading
+import argparse
+from collections import Counter
+from antlr4 import InputStream, CommonTokenStream, BailErrorStrategy
+from antlr4.error.ErrorStrategy import DefaultErrorStrategy
+from antlr4.atn.ParserATNSimulator import ParserATNSimulator
+from antlr4.atn.PredictionMode import PredictionMode
+from antlr4.error.ErrorListener import ConsoleErrorListener
+from antlr4.error.Errors import ParseCancellationException
+from CMiniLexer import CMiniLexer
+from CMiniParser import CMiniParser
+from cminiAst import lower
+from prattParser import parse_program, CMiniSyntaxError
+
+
+class DecisionInfo:
+    __slots__ = ("decision", "invocations", "time_ns", "sll_total_look", "sll_max_look",
+                 "ll_fallback", "ll_total_look", "ll_max_look", "dfa_transitions",
+                 "atn_transitions", "alts")
+
+    def __init__(self, decision):
+        self.decision = decision
+        self.invocations = 0
+        self.time_ns = 0
+        self.sll_total_look = 0
+        self.sll_max_look = 0
+        self.ll_fallback = 0
+        self.ll_total_look = 0
+        self.ll_max_look = 0
+        self.dfa_transitions = 0
+        self.atn_transitions = 0
+        self.alts = Counter()
+
+
+class ParseStats:
+    def __init__(self):
+        self.sll_parses = 0
+        self.ll_parses = 0
+        self.decisions = {}
+
+    def decision(self, d):
+        info = self.decisions.get(d)
+        if info is None:
+            info = self.decisions[d] = DecisionInfo(d)
+        return info
+
+    def report(self, limit=None):
+        atn = CMiniParser.atn
+        lines = [f"parses: {self.sll_parses} SLL, {self.ll_parses} fell back to LL",
+                 f"{'decision':>8} {'rule':<13} {'calls':>8} {'time ms':>9} {'avg look':>8} "
+                 f"{'max look':>8} {'LL':>5} {'ATN':>6} {'DFA':>7}  alts"]
+        infos = sorted(self.decisions.values(), key=lambda i: i.time_ns, reverse=True)
+        for info in infos[:limit]:
+            rule = CMiniParser.ruleNames[atn.decisionToState[info.decision].ruleIndex]
+            avg_look = info.sll_total_look / info.invocations if info.invocations else 0
+            max_look = max(info.sll_max_look, info.ll_max_look)
+            alts = " ".join(f"{alt}:{n}" for alt, n in sorted(info.alts.items()))
+            lines.append(f"{info.decision:>8} {rule:<13} {info.invocations:>8} "
+                         f"{info.time_ns / 1e6:>9.3f} {avg_look:>8.2f} {max_look:>8} "
+                         f"{info.ll_fallback:>5} {info.atn_transitions:>6} {info.dfa_transitions:>7}  {alts}")
+        return "\n".join(lines)
+
+
+class ProfilingATNSimulator(ParserATNSimulator):
+    """The Python runtime has no ProfilingATNSimulator, so this records
+    the same per-decision figures as the Java one: time, SLL/LL lookahead
+    depth, LL fallbacks and DFA vs ATN transitions."""
+
+    def __init__(self, parser, stats):
+        base = parser._interp
+        super().__init__(parser, parser.atn, base.decisionToDFA, base.sharedContextCache)
+        self.stats = stats
+        self._info = None
+        self._sll_stop = -1
+        self._ll_stop = -1
+
+    def adaptivePredict(self, input, decision, outerContext):
+        info = self.stats.decision(decision)
+        self._info = info
+        self._sll_stop = -1
+        self._ll_stop = -1
+        start = input.index
+        t0 = time.perf_counter_ns()
+        alt = super().adaptivePredict(input, decision, outerContext)
+        info.time_ns += time.perf_counter_ns() - t0
+        info.invocations += 1
+        info.alts[alt] += 1
+        if self._sll_stop >= 0:
+            look = self._sll_stop - start + 1
+            info.sll_total_look += look
+            info.sll_max_look = max(info.sll_max_look, look)
+        if self._ll_stop >= 0:
+            look = self._ll_stop - start + 1
+            info.ll_total_look += look
+            info.ll_max_look = max(info.ll_max_look, look)
+        return alt
+
+    def getExistingTargetState(self, previousD, t):
+        self._sll_stop = self._input.index
+        target = super().getExistingTargetState(previousD, t)
+        if target is not None:
+            self._info.dfa_transitions += 1
+        return target
+
+    def computeTargetState(self, dfa, previousD, t):
+        self._info.atn_transitions += 1
+        return super().computeTargetState(dfa, previousD, t)
+
+    def execATNWithFullContext(self, dfa, D, s0, input, startIndex, outerContext):
+        self._info.ll_fallback += 1
+        return super().execATNWithFullContext(dfa, D, s0, input, startIndex, outerContext)
+
+    def computeReachSet(self, closure, t, fullCtx):
+        if fullCtx:
+            self._ll_stop = self._input.index
+        return super().computeReachSet(closure, t, fullCtx)
+
+
+def parse(source, stats=None):
+    """Parse CMini source: SLL prediction with a bail-out error strategy
+    first, and a full-LL reparse with normal error recovery only if that
+    fails. Syntax errors are reported by the second stage alone."""
+    with _antlr_lock:
+        return _parse(source, stats)
+
+
+# The generated parsers share their DFA cache at class level, which is not
+# safe to grow from two threads at once. Each thread keeps one lexer and
+# parser and feeds them new input instead of building them per call.
+_antlr_lock = threading.Lock()
+_local = threading.local()
+
+
+def _parser_for(source):
+    reusable = getattr(_local, "antlr", None)
+    if reusable is None:
+        lexer = CMiniLexer(InputStream(source))
+        parser = CMiniParser(CommonTokenStream(lexer))
+        _local.antlr = lexer, parser
+        return parser
+    lexer, parser = reusable
+    lexer.inputStream = InputStream(source)
+    parser.setTokenStream(CommonTokenStream(lexer))
+    return parser
+
+
+def _parse(source, stats):
+    if stats is not None:
+        parser = CMiniParser(CommonTokenStream(CMiniLexer(InputStream(source))))
+        parser._interp = ProfilingATNSimulator(parser, stats)
+    else:
+        parser = _parser_for(source)
+
+    parser._interp.predictionMode = PredictionMode.SLL
+    parser._errHandler = BailErrorStrategy()
+    parser.removeErrorListeners()
+    try:
+        tree = parser.program()
+        if stats is not None:
+            stats.sll_parses += 1
+        return tree
+    except ParseCancellationException:
+        pass
+
+    parser.reset()
+    parser._interp.predictionMode = PredictionMode.LL
+    parser._errHandler = DefaultErrorStrategy()
+    parser.addErrorListener(ConsoleErrorListener.INSTANCE)
+    tree = parser.program()
+    if stats is not None:
+        stats.ll_parses += 1
+    return tree
+
+
+def parse_ast(source):
+    """Source to cminiAst.Program through the hand-written parser, falling
+    back to ANTLR (and its error reporting/recovery) on a syntax error."""
+    try:
+        return parse_program(source)
+    except CMiniSyntaxError as e:
+        error = e
+    try:
+        return lower(parse(source))
+    except (AttributeError, IndexError, ValueError, RecursionError):
+        # recovery left holes the AST cannot represent, or the generated
+        # parser, which recurses, met input nested too deeply for it
+        raise error from None
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="parse CMini files and report prediction statistics")
+    ap.add_argument("files", nargs="+")
+    ap.add_argument("--top", type=int, default=None, help="show only the N most expensive decisions")
+    args = ap.parse_args(argv)
+
+    stats = ParseStats()
+    for path in args.files:
+        with open(path, encoding="utf-8") as f:
+            lines = f.readlines()
+        parse("".join(l for l in lines if not l.strip().startswith("#include")), stats)
+    print(stats.report(args.top))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,122 +1,198 @@
 import sys
 import random
 import string
+import secrets
 import os
-import re
+import json
 import time
+import argparse
+import statistics
 import subprocess
-from antlr4 import *
-from CMiniLexer import CMiniLexer
-from CMiniParser import CMiniParser
-from CMiniListener import CMiniListener
-
-obf_map = {}
-
-APPLY_VAR_RENAME = False
-APPLY_DEAD_CODE = False
-APPLY_COMPLEX_EXPR = False
-
-def random_name(length=6):
-    return ''.join(random.choices(string.ascii_lowercase, k=length))
-
-def add_space_after_return(input_string):
-    corrected_string = input_string.replace('return', 'return ')
-    while 'return  ' in corrected_string:
-        corrected_string = corrected_string.replace('return  ', 'return ')
-    return corrected_string
-
-class ObfuscatingListener(CMiniListener):
-    def __init__(self, tokens: CommonTokenStream):
-        self.tokens = tokens
-        self.token_list = tokens.tokens
-
-    def replace(self, ctx, new_text):
-        interval = ctx.getSourceInterval()
-        start = self.token_list[interval[0]]
-        stop = self.token_list[interval[1]]
-        for i in range(start.tokenIndex, stop.tokenIndex + 1):
-            self.token_list[i].text = ""
-        self.token_list[start.tokenIndex].text = new_text
-
-    def enterFunctionDecl(self, ctx):
-        func_name = ctx.ID().getText()
-        if func_name == "main" or not APPLY_VAR_RENAME:
-            return 
-        new_name = obf_map.get(func_name, random_name())
-        obf_map[func_name] = new_name
-        self.replace(ctx.ID(), f' {new_name}')
-
-    def enterParam(self, ctx):
-        if not APPLY_VAR_RENAME:
-            return
-        var_name = ctx.ID().getText()
-        new_name = obf_map.get(var_name, random_name())
-        obf_map[var_name] = new_name
-        self.replace(ctx.ID(), f' {new_name}')
-
-    def enterVarDecl(self, ctx):
-        if not APPLY_VAR_RENAME:
-            return
-        var_name = ctx.ID().getText()
-        new_name = obf_map.get(var_name, random_name())
-        obf_map[var_name] = new_name
-        self.replace(ctx.ID(), f' {new_name}')
-
-    def enterAssignment(self, ctx):
-        if not APPLY_VAR_RENAME:
-            return
-        var_name = ctx.ID().getText()
-        if var_name in obf_map:
-            self.replace(ctx.ID(), obf_map[var_name])
-
-    def enterExpr(self, ctx):
-        for i in range(ctx.getChildCount()):
-            child = ctx.getChild(i)
-            text = child.getText()
-            if APPLY_VAR_RENAME and text in obf_map:
-                self.replace(child, obf_map[text])
-        if APPLY_COMPLEX_EXPR and ctx.getChildCount() == 3:
-            op = ctx.getChild(1).getText()
-            if op == '+':
-                left = ctx.getChild(0).getText()
-                right = ctx.getChild(2).getText()
-                complex_expr = f"(-1*-({left} + {right}))"
-                self.replace(ctx, complex_expr)
-
-    def enterFunctionCall(self, ctx):
-        if not APPLY_VAR_RENAME:
-            return
-        fname = ctx.ID().getText()
-        if fname in obf_map:
-            self.replace(ctx.ID(), obf_map[fname])
-
-    def enterStatement(self, ctx):
-        if ctx.getChildCount() >= 2 and ctx.getChild(0).getText() == "return":
-            expr = ctx.getChild(1).getText() if ctx.getChildCount() > 2 else ""
-            new_expr = obf_map.get(expr, expr)
-            new_return_stmt = f"return {new_expr};"
-            interval = ctx.getSourceInterval()
-            for i in range(interval[0], interval[1] + 1):
-                self.token_list[i].text = ""
-            self.token_list[interval[0]].text = new_return_stmt
-
-    def enterBlock(self, ctx):
-        if APPLY_DEAD_CODE and random.random() < 0.8:
-            dead_code = f"int unused_{random_name(3)} = {random.randint(0, 100)};"
-            open_brace = ctx.getChild(0)
-            self.token_list[open_brace.symbol.tokenIndex].text += f"\n    {dead_code}"
-
-
-def compile_and_run(filename, exe_name):
+from astCache import AstCache, load_ast
+from buildCache import BuildCache
+from costModel import describe, measured_overhead, parse_overhead, plan_sites
+from batchRunner import collect_inputs, mirror_path, error_record, run_batch
+from cminiAst import to_source, BinOp, Neg, Num, Paren, VarDecl
+from passManager import Pipeline, PipelinePass, pipeline_report
+from processTiming import cpu_times
+from symbols import SymbolTable, FUNCTION, keyed_name
+
+# technique numbers of the interactive prompt and --techniques
+TECHNIQUES = {"1": "rename", "2": "dead_code", "3": "complex_expr"}
+# runs timed per program by compare_files
+RUN_REPEAT = 5
+# C library functions a program may call without defining them; keyed
+# renaming leaves these alone
+RUNTIME_NAMES = frozenset({"printf", "scanf", "puts", "putchar", "getchar", "abs", "labs", "exit",
+                           "abort", "rand", "srand", "malloc", "calloc", "free", "strlen", "memset",
+                           "memcpy", "atoi", "time"})
+
+
+def random_name(length=6, rng=random):
+    return ''.join(rng.choices(string.ascii_lowercase, k=length))
+
+
+class ResolvePass(PipelinePass):
+    """Fills the run's shared SymbolTable; other passes require it."""
+    name = "resolve"
+    fusable = False
+
+    def run(self, program, symbols):
+        symbols.build(program)
+
+
+class RenamePass(PipelinePass):
+    """Gives every symbol except main a new name. With key, functions are
+    named from the key alone, so files obfuscated with the same key keep
+    calling each other by matching names: the ones a file defines and the
+    ones it calls without defining (those of other files), library
+    functions in RUNTIME_NAMES aside. Everything else gets random names.
+    New names never collide with any name already in the program; a keyed
+    name that would is an error rather than a different name, which would
+    no longer match the other files."""
+    name = "rename"
+    requires = ("resolve",)
+    after = ("resolve",)
+    fusable = False
+
+    def __init__(self, key=None, **options):
+        super().__init__(**options)
+        self.key = key
+
+    def run(self, program, symbols):
+        new_names = [None] * len(symbols)
+        external = {}
+        if self.key is not None:
+            for node in symbols.external_calls:
+                if node.name not in RUNTIME_NAMES:
+                    external.setdefault(node.name, []).append(node)
+        # names that stay: main, library functions and whatever else the
+        # program uses without declaring it
+        kept = (symbols.unresolved - set(external)) | {"main"}
+        keyed = {}
+        if self.key is not None:
+            functions = [name for name, kind in zip(symbols.names, symbols.kinds)
+                         if kind == FUNCTION and name != "main"]
+            for name in functions + list(external):
+                new_name = keyed_name(self.key, name)
+                if new_name in kept:
+                    raise ValueError(f"the keyed name of function {name!r}, {new_name!r}, is already "
+                                     f"used by the program; obfuscate with another key")
+                if new_name in keyed:
+                    raise ValueError(f"functions {keyed[new_name]!r} and {name!r} get the same keyed "
+                                     f"name {new_name!r}; obfuscate with another key")
+                keyed[new_name] = name
+            by_name = {name: new for new, name in keyed.items()}
+            for i, (name, kind) in enumerate(zip(symbols.names, symbols.kinds)):
+                if kind == FUNCTION and name != "main":
+                    new_names[i] = by_name[name]
+        taken = symbols.taken() | set(keyed)
+        for i, (name, kind) in enumerate(zip(symbols.names, symbols.kinds)):
+            if kind == FUNCTION and name == "main":
+                continue
+            if new_names[i] is None:
+                new_name = random_name(rng=self.rng)
+                while new_name in taken:
+                    new_name = random_name(rng=self.rng)
+                taken.add(new_name)
+                new_names[i] = new_name
+            self.rewritten += 1
+        symbols.rename(new_names)
+        for name, nodes in external.items():
+            new_name = keyed_name(self.key, name)
+            for node in nodes:
+                node.name = new_name
+                self.rewritten += 1
+
+
+class DeadCodePass(PipelinePass):
+    """Declares an unused variable at the top of a block: of each block
+    with the given probability, or of the blocks whose ids are in sites
+    (as chosen by costModel.plan_sites)."""
+    name = "dead_code"
+    after = ("rename",)  # so the dead declarations keep their unused_ names
+
+    def __init__(self, probability=0.8, sites=None, **options):
+        super().__init__(**options)
+        self.probability = probability
+        self.sites = sites
+
+    def exitBlock(self, node):
+        # drawn in both modes, so a plan leaves the rng where probability would
+        draw = self.rng.random()
+        chosen = id(node) in self.sites if self.sites is not None else draw < self.probability
+        if chosen:
+            dead_code = VarDecl('int', f"unused_{random_name(3, self.rng)}", Num(str(self.rng.randint(0, 100))))
+            node.items.insert(0, dead_code)
+            self.rewritten += 1
+
+
+class ComplexExprPass(PipelinePass):
+    """Rewrites every + expression, or those whose ids are in sites."""
+    name = "complex_expr"
+
+    def __init__(self, sites=None, **options):
+        super().__init__(**options)
+        self.sites = sites
+
+    def exitBinOp(self, node):
+        # (-1*-(left + right)); done on exit so the operands are already rewritten
+        if node.op == '+' and (self.sites is None or id(node) in self.sites):
+            self.rewritten += 1
+            return Paren(BinOp('*', Neg(Num('1')), Neg(Paren(node))))
+
+
+PASSES = {cls.name: cls for cls in (ResolvePass, RenamePass, DeadCodePass, ComplexExprPass)}
+
+
+def parse_spec(items):
+    """Pipeline spec from names, numbers or {"name": ..., option: value}
+    dicts, as a list of (name, options) pairs."""
+    spec = []
+    for item in items:
+        if isinstance(item, dict):
+            options = dict(item)
+            name = options.pop("name")
+        else:
+            name, options = TECHNIQUES.get(item, item), {}
+        if name not in PASSES:
+            raise ValueError(f"unknown pass {name!r}; choose from {', '.join(PASSES)}")
+        spec.append((name, options))
+    return spec
+
+
+def build_pipeline(spec, rng):
+    """Pipeline for spec, with the passes they require added in front.
+    Its passes draw every random choice from rng."""
+    names = [name for name, _ in spec]
+    full = []
+    for name, options in spec:
+        for dep in PASSES[name].requires:
+            if dep not in names:
+                names.append(dep)
+                full.append((dep, {}))
+        full.append((name, options))
+    passes = [PASSES[name](**options) for name, options in full]
+    for p in passes:
+        p.rng = rng
+    return Pipeline(passes)
+
+
+def compile_and_run(filename, exe_name, build_cache=None):
     compile_cmd = ["gcc", filename, "-o", exe_name]
     run_cmd = f"./{exe_name}"
 
     try:
-        result = subprocess.run(compile_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True, text=True)
-        start_time = time.time()
-        subprocess.run(run_cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        elapsed_time = time.time() - start_time
-        return elapsed_time
+        if build_cache is not None:
+            with open(filename, "rb") as f:
+                run_cmd, err = build_cache.build(f.read())
+            if run_cmd is None:
+                raise subprocess.CalledProcessError(1, compile_cmd, stderr=err)
+        else:
+            result = subprocess.run(compile_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True, text=True)
+        # CPU time from os.wait4: the wall time around a run of a program
+        # this small is mostly spawning it
+        return statistics.median(cpu_times([run_cmd], repeat=RUN_REPEAT))
     except subprocess.CalledProcessError as e:
         print(f"error compile: {filename}:")
         print(e.stderr)
@@ -126,7 +202,7 @@ def compile_and_run(filename, exe_name):
         return None
 
 
-def compare_files(input_file, output_file):
+def compare_files(input_file, output_file, build_cache=None):
     size_input = os.path.getsize(input_file)
     size_output = os.path.getsize(output_file)
 
@@ -136,54 +212,175 @@ def compare_files(input_file, output_file):
     with open("temp_output.c", "w") as f_out:
         f_out.write(open(output_file).read())
 
-    time_input = compile_and_run("temp_input.c", "a_input")
-    time_output = compile_and_run("temp_output.c", "a_output")
+    # with a build cache the unchanged input.mc is only compiled once
+    time_input = compile_and_run("temp_input.c", "a_input", build_cache)
+    time_output = compile_and_run("temp_output.c", "a_output", build_cache)
 
     print(f" size of main code: {size_input} byte")
     print(f"size of obfuscatored code: {size_output} byte")
     if time_input is not None and time_output is not None:
-        print(f"execution time of main code: {time_input:.6f} sec")
-        print(f"execution time of obfuscatored code: {time_output:.6f} sec")
-
+        print(f"execution time of main code: {time_input:.6f} sec (CPU, median of {RUN_REPEAT} runs)")
+        print(f"execution time of obfuscatored code: {time_output:.6f} sec (CPU, median of {RUN_REPEAT} runs)")
+
+
+def obfuscate_source(source, cache=None, seed=None, spec=None, stats=None, trace=False,
+                     max_overhead=None, plan=None):
+    """Obfuscate source with the passes in spec (all of them by default).
+    If stats is a dict, each pass's measurements are stored in it. With
+    max_overhead (a fraction), dead_code and complex_expr are only applied
+    where costModel.plan_sites fits them into that much estimated run time; if
+    plan is a dict, the plan's estimates are stored in it."""
+    if spec is None:
+        spec = parse_spec(TECHNIQUES.values())
+    # the output only depends on its inputs when the RNG is seeded
+    key = None
+    if cache is not None and seed is not None and stats is None and plan is None:
+        key = (cache.key("obf", source, spec, seed) if max_overhead is None else
+               cache.key("obf", source, spec, seed, max_overhead))
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+    # a private RNG per call: unseeded calls draw from os.urandom
+    rng = random.Random(seed)
+
+    program = load_ast(source, cache)
+    if max_overhead is not None:
+        chosen = plan_sites(program, [name for name, _ in spec], max_overhead, rng)
+        spec = [(name, dict(options, sites=chosen.sites[name])) if name in chosen.sites else (name, options)
+                for name, options in spec]
+        if plan is not None:
+            plan.update(chosen.as_dict())
+    pipeline = build_pipeline(spec, rng)
+    pipeline.run(program, SymbolTable(), stats is not None, trace)
+    if stats is not None:
+        stats.update(pipeline.stats)
+    result = "#include <stdio.h>\n\n" + to_source(program)
+
+    if key is not None:
+        cache.put(key, result)
+    return result
+
+
+def obfuscate_file(task):
+    """Batch worker: (src, dst, spec, seed, cache_dir, profile, max_overhead) -> result record."""
+    src, dst, spec, seed, cache_dir, profile, max_overhead = task
+    record = {"path": src, "output": dst, "ok": False, "seconds": 0.0, "bytes": 0, "error": None}
+    stats = {} if profile else None
+    start = time.perf_counter()
+    stage = "read"
+    try:
+        with open(src, "r", encoding="utf-8") as f:
+            source = f.read()
+        record["bytes"] = len(source.encode("utf-8"))
+        stage = "obfuscate"
+        cache = AstCache(cache_dir) if cache_dir else None
+        result = obfuscate_source(source, cache, seed, spec, stats, profile, max_overhead)
+        if profile:
+            record["passes"] = {name: r["seconds"] for name, r in stats.items()}
+            record["profile"] = stats
+        stage = "write"
+        os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+        with open(dst, "w", encoding="utf-8") as f:
+            f.write(result)
+        record["ok"] = True
+    except Exception as e:
+        record["error"] = error_record(e, stage)
+    record["seconds"] = time.perf_counter() - start
+    return record
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="obfuscate input.mc into output.mc")
+    ap.add_argument("--seed", type=int, default=None, help="seed the RNG; seeded outputs are cached too")
+    ap.add_argument("--cache-dir", default=".cmini_cache")
+    ap.add_argument("--build-cache-dir", default=".cmini_build", help="compiled executables, keyed by source")
+    ap.add_argument("--no-cache", action="store_true")
+    ap.add_argument("--techniques", help="comma separated technique numbers instead of the prompt, e.g. 1,2,3")
+    ap.add_argument("--batch", metavar="DIR_OR_GLOB", help="obfuscate every matching .mc file")
+    ap.add_argument("--out", default="obfuscated", help="output directory for --batch, mirroring the input tree")
+    ap.add_argument("--jobs", type=int, default=os.cpu_count(), help="worker processes for --batch")
+    ap.add_argument("--report", help="write per-file --batch records to this JSON file")
+    ap.add_argument("--passes", help=f"comma separated pass names in order, from {', '.join(PASSES)}")
+    ap.add_argument("--config", help='JSON file such as {"passes": ["rename", {"name": "dead_code", '
+                                     '"probability": 0.5}], "seed": 1, "profile": true}')
+    ap.add_argument("--profile", action="store_true",
+                    help="report time, nodes visited/rewritten and tracemalloc allocations per pass")
+    ap.add_argument("--max-overhead", metavar="PERCENT",
+                    help="apply dead_code/complex_expr only where they add at most this much estimated "
+                         "run time, e.g. 5%%")
+    args = ap.parse_args(argv)
+    cache_dir = None if args.no_cache else args.cache_dir
+
+    config = {}
+    if args.config:
+        with open(args.config, "r", encoding="utf-8") as f:
+            config = json.load(f)
+    seed = args.seed if args.seed is not None else config.get("seed")
+    profile = args.profile or config.get("profile", False)
+    max_overhead = args.max_overhead if args.max_overhead is not None else config.get("max_overhead")
+    try:
+        max_overhead = None if max_overhead is None else parse_overhead(str(max_overhead))
+    except ValueError as e:
+        ap.error(str(e))
 
-def main():
-    global APPLY_VAR_RENAME, APPLY_DEAD_CODE, APPLY_COMPLEX_EXPR
+    try:
+        if args.passes is not None:
+            spec = parse_spec(s.strip() for s in args.passes.split(','))
+        elif args.techniques is not None:
+            spec = parse_spec(s.strip() for s in args.techniques.split(','))
+        elif "passes" in config:
+            spec = parse_spec(config["passes"])
+        elif args.batch:
+            spec = parse_spec(TECHNIQUES.values())
+        else:
+            print("\nchoose techniqes you want):")
+            print("1)change names ")
+            print("2)dead codes ")
+            print("3)complications ")
+            selected = input("write the related numbers: ")
+            choices = [s.strip() for s in selected.split(',')]
+            spec = parse_spec(dict.fromkeys(c for c in choices if c in TECHNIQUES))
+    except ValueError as e:
+        ap.error(str(e))
+
+    if args.batch:
+        # one key for the whole batch, so every file renames functions alike
+        key = str(seed) if seed is not None else secrets.token_hex(8)
+        spec = [(name, dict(options, key=options.get("key", key)) if name == "rename" else options)
+                for name, options in spec]
+        base, files = collect_inputs(args.batch)
+        tasks = [(f, mirror_path(f, base, args.out), spec, seed, cache_dir, profile, max_overhead)
+                 for f in files]
+        records = run_batch(obfuscate_file, tasks, args.jobs, args.report)
+        sys.exit(0 if all(r["ok"] for r in records) else 1)
+
+    cache = AstCache(cache_dir) if cache_dir else None
+    stats = {} if profile else None
 
     input_file = "input.mc"
     output_file = "output.mc"
 
-    print("\nchoose techniqes you want):")
-    print("1)change names ")
-    print("2)dead codes ")
-    print("3)complications ")
-    selected = input("write the related numbers: ")
-    choices = [s.strip() for s in selected.split(',')]
-
-    APPLY_VAR_RENAME = '1' in choices
-    APPLY_DEAD_CODE = '2' in choices
-    APPLY_COMPLEX_EXPR = '3' in choices
-
-    input_stream = FileStream(input_file)
-    lexer = CMiniLexer(input_stream)
-    token_stream = CommonTokenStream(lexer)
-    parser = CMiniParser(token_stream)
-    tree = parser.program()
-
-    listener = ObfuscatingListener(token_stream)
-    walker = ParseTreeWalker()
-    walker.walk(listener, tree)
+    plan = {} if max_overhead is not None else None
+    with open(input_file, "r", encoding="utf-8") as f:
+        source = f.read()
+    result = obfuscate_source(source, cache, seed, spec, stats, profile, max_overhead, plan)
 
     with open(output_file, "w", encoding="utf-8") as f:
-        formatted = token_stream.getText().replace('{', '{\n    ') \
-                                          .replace(';', ';\n    ') \
-                                          .replace('}', '\n}\n') \
-                                          .replace('\n    \n', '\n    ')
-        formatted_x = add_space_after_return(formatted)
-        formatted_x = "#include <stdio.h>\n\n" + formatted_x
-        formatted_x =re.sub(r'\b(int|void|float|main)([a-zA-Z_])', r'\1 \2', formatted_x)
-        f.write(formatted_x)
-
-    compare_files(input_file, output_file)
+        f.write(result)
+
+    build_cache = None if args.no_cache else BuildCache(args.build_cache_dir)
+    compare_files(input_file, output_file, build_cache)
+    if plan is not None:
+        print(describe(plan))
+        measured = measured_overhead(source, result)
+        print("measured overhead: " + ("run did not finish in the VM" if measured is None else
+                                       f"{measured:.2%} more VM instructions"))
+    if cache is not None:
+        print(cache.stats())
+    if build_cache is not None:
+        print(build_cache.stats())
+    if profile:
+        print(pipeline_report(stats))
 
 
 if __name__ == '__main__':
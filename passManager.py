@@ -0,0 +1,229 @@
+import time
+import tracemalloc
+from cminiAst import walk_many, iter_nodes
+
+
+class Pass:
+    """A transformation run on a set of functions.
+
+    run(program, funcs) rewrites the given functions (all of them when funcs
+    is None) and returns {func: number of changes} for the ones it changed.
+    affects names the passes that may find new work in a function this pass
+    changed. A once pass never runs twice on the same function.
+    """
+    __slots__ = ("name", "run", "affects", "once")
+
+    def __init__(self, name, run, affects=(), once=False):
+        self.name = name
+        self.run = run
+        self.affects = tuple(affects)
+        self.once = once
+
+
+class PassError(Exception):
+    def __init__(self, pass_name, func_names, cause):
+        super().__init__(f"{pass_name} on {', '.join(func_names)}: {type(cause).__name__}: {cause}")
+        self.pass_name = pass_name
+
+
+class PassStats:
+    __slots__ = ("runs", "changes", "seconds")
+
+    def __init__(self):
+        self.runs = 0
+        self.changes = 0
+        self.seconds = 0.0
+
+
+class PassManager:
+    """Runs passes to a fixpoint over the functions of a program.
+
+    Every pass starts with every function queued. When a pass changes a
+    function, only the passes it affects are queued again, and only for
+    that function. Each round runs the queued work in declaration order;
+    it stops when nothing is queued or after max_rounds rounds.
+    """
+
+    def __init__(self, passes, max_rounds=8):
+        self.passes = list(passes)
+        self.max_rounds = max_rounds
+        self.by_name = {p.name: i for i, p in enumerate(self.passes)}
+        for p in self.passes:
+            for name in p.affects:
+                if name not in self.by_name:
+                    raise ValueError(f"pass {p.name!r} affects unknown pass {name!r}")
+        self.stats = {p.name: PassStats() for p in self.passes}
+        self.rounds = 0
+        self.converged = False
+
+    def run(self, program):
+        funcs = list(program.functions)
+        order = {id(f): i for i, f in enumerate(funcs)}
+        queued = [dict.fromkeys(map(id, funcs)) for _ in self.passes]
+        done = [set() for _ in self.passes]
+        by_id = {id(f): f for f in funcs}
+        self.rounds = 0
+        while any(queued):
+            if self.rounds == self.max_rounds:
+                self.converged = False
+                return self
+            self.rounds += 1
+            for i, p in enumerate(self.passes):
+                if not queued[i]:
+                    continue
+                todo = sorted(queued[i], key=order.get)
+                queued[i] = {}
+                if p.once:
+                    todo = [k for k in todo if k not in done[i]]
+                    done[i].update(todo)
+                    if not todo:
+                        continue
+                targets = [by_id[k] for k in todo]
+                stats = self.stats[p.name]
+                start = time.perf_counter()
+                try:
+                    changed = p.run(program, targets)
+                except Exception as e:
+                    raise PassError(p.name, [f.name for f in targets], e) from e
+                finally:
+                    stats.seconds += time.perf_counter() - start
+                stats.runs += 1
+                for func, n in changed.items():
+                    stats.changes += n
+                    for name in p.affects:
+                        queued[self.by_name[name]][id(func)] = None
+        self.converged = True
+        return self
+
+    def report(self):
+        width = max([len(p.name) for p in self.passes] + [4])
+        lines = [f"{'pass':<{width}}  runs  changes  time (ms)"]
+        for p in self.passes:
+            s = self.stats[p.name]
+            lines.append(f"{p.name:<{width}}  {s.runs:>4}  {s.changes:>7}  {s.seconds * 1000:>9.2f}")
+        state = "fixpoint" if self.converged else "iteration cap hit"
+        lines.append(f"{self.rounds} round(s), {state}")
+        return "\n".join(lines)
+
+
+class PipelinePass:
+    """One obfuscation technique, run as a listener over the whole program.
+
+    Subclasses set name, may list the passes they require (which the
+    caller adds to the pipeline) and the ones they must run after, and bump
+    self.rewritten for every node they change. Options from the pipeline
+    config arrive as keyword arguments. Neighbouring fusable passes share
+    one walk when the pipeline is not measuring them, so a fusable pass
+    must only depend on what earlier passes did to the nodes it is given.
+    """
+    name = None
+    requires = ()
+    after = ()
+    fusable = True
+
+    def __init__(self, **options):
+        if options:
+            raise TypeError(f"pass {self.name!r} takes no option {sorted(options)[0]!r}")
+        self.rewritten = 0
+
+    def run(self, program, symbols):
+        self.symbols = symbols
+        walk_many((self,), program)
+
+
+def count_nodes(node):
+    return sum(1 for _ in iter_nodes(node))
+
+
+class Pipeline:
+    """Ordered passes sharing one symbol table.
+
+    The order is the configured one, except that a pass is moved after
+    every enabled pass it names in after. With stats, each pass records
+    wall time, nodes visited and nodes rewritten; with trace, also the
+    memory blocks it left allocated and its peak traced memory, taken
+    with tracemalloc (which slows the run down considerably). Without
+    measurements, neighbouring fusable passes run in a single walk.
+    """
+
+    def __init__(self, passes):
+        self.passes = self._order(list(passes))
+        self.stats = {}
+
+    @staticmethod
+    def _order(passes):
+        names = [p.name for p in passes]
+        if len(set(names)) != len(names):
+            raise ValueError(f"pass listed twice in {names}")
+        ordered, placed = [], set()
+        pending = list(passes)
+        while pending:
+            for p in pending:
+                if all(dep in placed or dep not in names for dep in p.after):
+                    break
+            else:
+                raise ValueError(f"cyclic pass dependencies among {[p.name for p in pending]}")
+            pending.remove(p)
+            ordered.append(p)
+            placed.add(p.name)
+        return ordered
+
+    def run(self, program, symbols, stats=False, trace=False):
+        if trace:
+            started = not tracemalloc.is_tracing()
+            if started:
+                tracemalloc.start()
+        try:
+            if not stats and not trace:
+                self._run_fused(program, symbols)
+                return program
+            for p in self.passes:
+                record = {"visited": count_nodes(program)}
+                if trace:
+                    tracemalloc.reset_peak()
+                    before = tracemalloc.take_snapshot()
+                start = time.perf_counter()
+                p.run(program, symbols)
+                record["seconds"] = time.perf_counter() - start
+                if trace:
+                    peak = tracemalloc.get_traced_memory()[1]
+                    diff = tracemalloc.take_snapshot().compare_to(before, "filename")
+                    record["alloc_blocks"] = sum(d.count_diff for d in diff)
+                    record["alloc_bytes"] = sum(d.size_diff for d in diff)
+                    record["peak_bytes"] = peak
+                record["rewritten"] = p.rewritten
+                self.stats[p.name] = record
+        finally:
+            if trace and started:
+                tracemalloc.stop()
+        return program
+
+    def _run_fused(self, program, symbols):
+        group = []
+        for p in self.passes + [None]:
+            if p is not None and p.fusable and type(p).run is PipelinePass.run:
+                p.symbols = symbols
+                group.append(p)
+                continue
+            if group:
+                walk_many(group, program)
+                group = []
+            if p is not None:
+                p.run(program, symbols)
+
+
+def pipeline_report(stats):
+    """Table of Pipeline.stats, which may have come from another process."""
+    width = max([len(name) for name in stats] + [4])
+    traced = any("peak_bytes" in r for r in stats.values())
+    head = f"{'pass':<{width}}  time (ms)  visited  rewritten"
+    if traced:
+        head += "  alloc blocks  alloc KiB  peak KiB"
+    lines = [head]
+    for name, r in stats.items():
+        line = f"{name:<{width}}  {r['seconds'] * 1000:>9.2f}  {r['visited']:>7}  {r['rewritten']:>9}"
+        if traced:
+            line += (f"  {r['alloc_blocks']:>12}  {r['alloc_bytes'] / 1024:>9.1f}"
+                     f"  {r['peak_bytes'] / 1024:>8.1f}")
+        lines.append(line)
+    return "\n".join(lines)
@@ -0,0 +1,295 @@
+"""Performance regression gate.
+
+Times a fixed corpus (input*.mc plus seeded cminiGen programs) through
+parsing, each obfuscation technique, each deobfuscation pass and the
+whole obfuscate+deobfuscate round trip. Each scenario's samples (CPU
+seconds), median, MAD and tracemalloc peak are kept in a baseline JSON
+file committed with the repo (--update rewrites it). A later run is a regression when its
+samples are slower by a one-sided Mann-Whitney U test at --alpha and the
+median also grew by more than --tolerance, or when its peak memory grew
+by more than --memory-tolerance. Timings are only comparable on the
+machine the baseline was recorded on.
+"""
+import gc
+import sys
+import glob
+import json
+import math
+import time
+import random
+import hashlib
+import fnmatch
+import platform
+import argparse
+import tracemalloc
+from cminiGen import generate
+from frontend import parse_ast
+from obfuscator import TECHNIQUES, build_pipeline, obfuscate_source, parse_spec
+from deObfuscator import deobfuscate_source, deobfuscation_passes
+from symbols import SymbolTable
+
+BASELINE = "perf_baseline.json"
+SEED = 1234
+# a memory change smaller than this is allocator noise
+MEMORY_SLACK = 64 * 1024
+
+
+def strip_includes(text):
+    return "".join(l for l in text.splitlines(True) if not l.strip().startswith("#include"))
+
+
+def load_corpus(generated=8):
+    corpus = []
+    for path in sorted(glob.glob("input*.mc")):
+        with open(path, encoding="utf-8") as f:
+            corpus.append(strip_includes(f.read()))
+    for i in range(generated):
+        corpus.append(generate(i, functions=6, stmts_per_block=6))
+    return corpus
+
+
+def fingerprint(corpus):
+    h = hashlib.sha256()
+    for source in corpus:
+        h.update(source.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()[:16]
+
+
+# ------------------------------------------------------------------ scenarios
+#
+# A scenario is (setup, run): setup() builds fresh inputs outside the
+# timer, run(state) is the work measured.
+
+def _parse_scenario(corpus):
+    return (lambda: None, lambda _: [parse_ast(s) for s in corpus])
+
+
+def _technique_scenario(corpus, name):
+    def setup():
+        state = []
+        for source in corpus:
+            program = parse_ast(source)
+            pipeline = build_pipeline(parse_spec([name]), random.Random(SEED))
+            symbols = SymbolTable()
+            # the passes it requires run first, untimed
+            target = next(p for p in pipeline.passes if p.name == name)
+            for p in pipeline.passes[:pipeline.passes.index(target)]:
+                p.run(program, symbols)
+            state.append((target, program, symbols))
+        return state
+
+    def run(state):
+        for target, program, symbols in state:
+            target.run(program, symbols)
+    return setup, run
+
+
+def _deobfuscation_scenario(obfuscated, name):
+    def setup():
+        state = []
+        for text in obfuscated:
+            program = parse_ast(strip_includes(text))
+            passes = deobfuscation_passes(random.Random(SEED))
+            # run the passes before it once, as the pass manager's first round does
+            for p in passes:
+                if p.name == name:
+                    state.append((p, program))
+                    break
+                p.run(program, None)
+        return state
+
+    def run(state):
+        for p, program in state:
+            p.run(program, None)
+    return setup, run
+
+
+def _end_to_end_scenario(corpus):
+    def run(_):
+        for source in corpus:
+            deobfuscate_source(obfuscate_source(source, None, SEED), None, SEED)
+    return (lambda: None, run)
+
+
+def scenarios(corpus):
+    obfuscated = [obfuscate_source(s, None, SEED) for s in corpus]
+    out = {"parse": _parse_scenario(corpus)}
+    for name in TECHNIQUES.values():
+        out[f"obfuscate/{name}"] = _technique_scenario(corpus, name)
+    for p in deobfuscation_passes(random.Random(SEED)):
+        out[f"deobfuscate/{p.name}"] = _deobfuscation_scenario(obfuscated, p.name)
+    out["end_to_end"] = _end_to_end_scenario(corpus)
+    return out
+
+
+# ---------------------------------------------------------------- measuring
+
+def median(values):
+    v = sorted(values)
+    n = len(v)
+    return v[n // 2] if n % 2 else (v[n // 2 - 1] + v[n // 2]) / 2
+
+
+def mad(values):
+    m = median(values)
+    return median([abs(x - m) for x in values])
+
+
+def _sample(setup, run):
+    state = setup()
+    gc.collect()
+    gc.disable()
+    try:
+        # CPU time: a sample is not charged for the time the process was
+        # descheduled by whatever else the machine is doing
+        start = time.process_time()
+        run(state)
+        return time.process_time() - start
+    finally:
+        gc.enable()
+
+
+def _peak(setup, run):
+    state = setup()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        run(state)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def measure(selected, samples, warmup=2):
+    """{name: (seconds of each of samples runs, tracemalloc peak of one
+    more run)}. Samples of the scenarios are interleaved, so a slow spell
+    of the machine spreads over all of them instead of skewing one."""
+    times = {name: [] for name in selected}
+    for i in range(warmup + samples):
+        for name, (setup, run) in selected.items():
+            elapsed = _sample(setup, run)
+            if i >= warmup:
+                times[name].append(elapsed)
+    return {name: (times[name], _peak(setup, run)) for name, (setup, run) in selected.items()}
+
+
+def mann_whitney_greater(new, old):
+    """One-sided p-value that new tends to be larger than old (normal
+    approximation with tie correction)."""
+    n1, n2 = len(new), len(old)
+    ranked = sorted([(v, 0) for v in new] + [(v, 1) for v in old])
+    ranks = [0.0] * len(ranked)
+    ties = 0.0
+    i = 0
+    while i < len(ranked):
+        j = i
+        while j + 1 < len(ranked) and ranked[j + 1][0] == ranked[i][0]:
+            j += 1
+        for k in range(i, j + 1):
+            ranks[k] = (i + j) / 2 + 1
+        t = j - i + 1
+        ties += t ** 3 - t
+        i = j + 1
+    u = sum(r for r, (_, group) in zip(ranks, ranked) if group == 0) - n1 * (n1 + 1) / 2
+    n = n1 + n2
+    sigma = math.sqrt(n1 * n2 / 12 * ((n + 1) - ties / (n * (n - 1))))
+    if sigma == 0:
+        return 1.0
+    z = (u - n1 * n2 / 2 - 0.5) / sigma  # continuity correction
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def compare(name, result, base, tolerance, alpha, memory_tolerance):
+    entry = {"median": result["median"], "mad": result["mad"], "peak_bytes": result["peak_bytes"]}
+    if base is None:
+        entry["status"] = "new"
+        return entry
+    ratio = result["median"] / base["median"] if base["median"] else float("inf")
+    p_slower = mann_whitney_greater(result["samples"], base["samples"])
+    p_faster = mann_whitney_greater(base["samples"], result["samples"])
+    memory_ratio = result["peak_bytes"] / base["peak_bytes"] if base["peak_bytes"] else 1.0
+    entry.update(baseline_median=base["median"], baseline_mad=base["mad"],
+                 baseline_peak_bytes=base["peak_bytes"], ratio=ratio, p_value=p_slower,
+                 memory_ratio=memory_ratio, status="ok", problems=[])
+    if p_slower < alpha and ratio > 1 + tolerance:
+        entry["status"] = "regression"
+        entry["problems"].append(f"time {ratio:.2f}x baseline (p={p_slower:.2g})")
+    elif p_faster < alpha and ratio < 1 - tolerance:
+        entry["status"] = "improvement"
+    if (memory_ratio > 1 + memory_tolerance
+            and result["peak_bytes"] - base["peak_bytes"] > MEMORY_SLACK):
+        entry["status"] = "regression"
+        entry["problems"].append(f"peak memory {memory_ratio:.2f}x baseline")
+    return entry
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="time parse/obfuscate/deobfuscate scenarios and compare them with a stored baseline")
+    ap.add_argument("--baseline", default=BASELINE)
+    ap.add_argument("--update", action="store_true", help="record a new baseline instead of comparing")
+    ap.add_argument("--scenario", action="append", help="only scenarios matching this glob (repeatable)")
+    ap.add_argument("--samples", type=int, default=20)
+    ap.add_argument("--tolerance", type=float, default=0.10, help="allowed growth of the median time")
+    ap.add_argument("--alpha", type=float, default=0.01, help="significance level of the U test")
+    ap.add_argument("--memory-tolerance", type=float, default=0.10, help="allowed growth of peak memory")
+    ap.add_argument("--report", help="write the comparison to this JSON file")
+    args = ap.parse_args(argv)
+
+    corpus = load_corpus()
+    selected = {name: s for name, s in scenarios(corpus).items()
+                if not args.scenario or any(fnmatch.fnmatch(name, pat) for pat in args.scenario)}
+    baseline = None
+    if not args.update:
+        try:
+            with open(args.baseline, encoding="utf-8") as f:
+                baseline = json.load(f)
+        except FileNotFoundError:
+            ap.error(f"no baseline at {args.baseline}; record one with --update")
+        if baseline["corpus"] != fingerprint(corpus):
+            print(f"{args.baseline} was recorded on a different corpus; record it again with --update")
+            sys.exit(2)
+
+    results = {name: {"median": median(times), "mad": mad(times), "peak_bytes": peak, "samples": times}
+               for name, (times, peak) in measure(selected, args.samples).items()}
+
+    if args.update:
+        old = {}
+        try:
+            with open(args.baseline, encoding="utf-8") as f:
+                old = json.load(f)["scenarios"]
+        except FileNotFoundError:
+            pass
+        old.update(results)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"corpus": fingerprint(corpus), "python": platform.python_version(),
+                       "machine": platform.machine(), "scenarios": old}, f, indent=2)
+        for name, r in results.items():
+            print(f"{name:<46}{r['median'] * 1000:>9.2f} ms  MAD {r['mad'] * 1000:6.2f} ms"
+                  f"  peak {r['peak_bytes'] / 1024:8.0f} KB")
+        print(f"baseline written to {args.baseline}")
+        return
+
+    entries = {name: compare(name, r, baseline["scenarios"].get(name), args.tolerance, args.alpha,
+                             args.memory_tolerance)
+               for name, r in results.items()}
+    print(f"{'scenario':<46}{'baseline':>11}{'now':>11}{'ratio':>8}{'p':>9}{'memory':>8}  status")
+    for name, e in entries.items():
+        if e["status"] == "new":
+            print(f"{name:<46}{'-':>11}{e['median'] * 1000:>9.2f}ms{'':>25}  new")
+            continue
+        print(f"{name:<46}{e['baseline_median'] * 1000:>9.2f}ms{e['median'] * 1000:>9.2f}ms"
+              f"{e['ratio']:>8.2f}{e['p_value']:>9.2g}{e['memory_ratio']:>8.2f}  {e['status']}")
+    regressions = [name for name, e in entries.items() if e["status"] == "regression"]
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump({"baseline": args.baseline, "tolerance": args.tolerance, "alpha": args.alpha,
+                       "memory_tolerance": args.memory_tolerance, "regressions": regressions,
+                       "scenarios": entries}, f, indent=2)
+    for name in regressions:
+        print(f"REGRESSION {name}: {'; '.join(entries[name]['problems'])}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+from fastLexer import (lex, TEXT, LPAREN, RPAREN, COMMA, LBRACE, RBRACE, ASSIGN, SEMI, IF, ELSE,
+                       WHILE, RETURN, PRINTF, STAR, SLASH, PLUS, MINUS, EQ, NE, LT, GT, LE, GE,
+                       INT_KW, VOID, ID, INT, STRING, EOF)
+from cminiAst import (Program, FunctionDecl, Param, Block, VarDecl, If, While, Return, Printf,
+                      ExprStmt, BinOp, Assign, Call, Name, Num, Paren, Neg)
+
+
+class CMiniSyntaxError(Exception):
+    def __init__(self, message, line, column):
+        super().__init__(f"line {line}:{column} {message}")
+        self.line = line
+        self.column = column
+
+
+# binding power of the binary operators, as in the left-recursive expr rule
+_BINARY = {
+    STAR: 8, SLASH: 8,
+    PLUS: 7, MINUS: 7,
+    EQ: 6, NE: 6, LT: 6, GT: 6, LE: 6, GE: 6,
+}
+_TYPES = (INT_KW, VOID)
+# kinds of the frames on the parser's explicit stacks
+_BLOCK, _THEN, _ELSE, _BODY = "block", "then", "else", "body"
+_LOOP, _RIGHT, _ASSIGN, _PAREN, _NEG, _ARG = "loop", "right", "assign", "paren", "neg", "arg"
+
+
+class PrattParser:
+    """Descent through the statement rules of CMini.g4 and precedence
+    climbing for expr, building the cminiAst nodes directly. Both keep
+    what is still open on explicit stacks, so deep nesting does not
+    recurse.
+
+    Unary minus is accepted as well: it is not in the grammar, but the
+    obfuscator emits it and lower() rebuilds the same Neg node from
+    ANTLR's error recovery.
+    """
+
+    def __init__(self, source):
+        self.buf = lex(source)
+        self.types = self.buf.types
+        self.pos = 0
+        if self.buf.errors:
+            offset = self.buf.errors[0]
+            line, col = self.buf.position(offset)
+            raise CMiniSyntaxError(f"token recognition error at: '{source[offset]}'", line, col)
+
+    def error(self, message):
+        line, col = self.buf.position(self.buf.starts[self.pos])
+        raise CMiniSyntaxError(message, line, col)
+
+    def peek(self):
+        return self.types[self.pos]
+
+    def advance(self):
+        self.pos += 1
+        return self.buf.text(self.pos - 1)
+
+    def expect(self, ttype):
+        if self.types[self.pos] != ttype:
+            self.error(f"expecting {_name(ttype)} at {self.buf.text(self.pos)!r}")
+        return self.advance()
+
+    def program(self):
+        functions = [self.function()]
+        while self.peek() != EOF:
+            functions.append(self.function())
+        return Program(functions)
+
+    def type(self):
+        if self.peek() not in _TYPES:
+            self.error(f"expecting a type at {self.buf.text(self.pos)!r}")
+        return self.advance()
+
+    def function(self):
+        ret_type = self.type()
+        name = self.expect(ID)
+        self.expect(LPAREN)
+        params = []
+        if self.peek() != RPAREN:
+            params.append(Param(self.type(), self.expect(ID)))
+            while self.peek() == COMMA:
+                self.advance()
+                params.append(Param(self.type(), self.expect(ID)))
+        self.expect(RPAREN)
+        return FunctionDecl(ret_type, name, params, self.block())
+
+    def block(self):
+        if self.peek() != LBRACE:
+            self.expect(LBRACE)
+        return self.statement()
+
+    def var_decl(self):
+        type_ = self.type()
+        name = self.expect(ID)
+        init = None
+        if self.peek() == ASSIGN:
+            self.advance()
+            init = self.expr(0)
+        self.expect(SEMI)
+        return VarDecl(type_, name, init)
+
+    def statement(self):
+        """One statement. Nested statements are parsed on an explicit stack
+        of the constructs still open around them, so nesting depth is not
+        limited by the recursion limit."""
+        # (_BLOCK, items), (_THEN, cond), (_ELSE, cond, then), (_BODY, cond)
+        stack = []
+        while True:
+            # start a statement: the open ones only push a frame
+            kind = self.peek()
+            node = None
+            if kind == LBRACE:
+                self.advance()
+                stack.append((_BLOCK, []))
+            elif kind == IF or kind == WHILE:
+                self.advance()
+                self.expect(LPAREN)
+                cond = self.expr(0)
+                self.expect(RPAREN)
+                stack.append((_THEN if kind == IF else _BODY, cond))
+                continue
+            else:
+                node = self.simple_statement()
+            # close what node completes, until a statement must be started
+            while True:
+                if node is None:
+                    items = stack[-1][1]
+                    kind = self.peek()
+                    if kind == RBRACE:
+                        self.advance()
+                        stack.pop()
+                        node = Block(items)
+                    elif kind in _TYPES:
+                        items.append(self.var_decl())
+                        continue
+                    elif kind == EOF:
+                        self.error("missing '}'")
+                    else:
+                        break
+                if not stack:
+                    return node
+                frame = stack[-1]
+                what = frame[0]
+                if what is _BLOCK:
+                    frame[1].append(node)
+                    node = None
+                    continue
+                stack.pop()
+                if what is _THEN:
+                    if self.peek() == ELSE:
+                        self.advance()
+                        stack.append((_ELSE, frame[1], node))
+                        break
+                    node = If(frame[1], node, None)
+                elif what is _ELSE:
+                    node = If(frame[1], frame[2], node)
+                else:
+                    node = While(frame[1], node)
+
+    def simple_statement(self):
+        kind = self.peek()
+        if kind == RETURN:
+            self.advance()
+            value = None
+            if self.peek() != SEMI:
+                value = self.expr(0)
+            self.expect(SEMI)
+            return Return(value)
+        if kind == PRINTF:
+            self.advance()
+            self.expect(LPAREN)
+            fmt = self.expect(STRING)
+            args = []
+            while self.peek() == COMMA:
+                self.advance()
+                args.append(self.expr(0))
+            self.expect(RPAREN)
+            self.expect(SEMI)
+            return Printf(fmt, args)
+        expr = self.expr(0)
+        self.expect(SEMI)
+        return ExprStmt(expr)
+
+    def expr(self, min_prec):
+        """Precedence climbing, with the pending operators, parentheses,
+        calls and assignments on an explicit stack instead of the call
+        stack."""
+        types = self.types
+        binary = _BINARY
+        # (_LOOP, min_prec): the operator loop of an expr call;
+        # (_RIGHT, left, kind): a binary operator waiting for its right side;
+        # (_ASSIGN, name), (_PAREN,), (_NEG,), (_ARG, name, args)
+        stack = [(_LOOP, min_prec)]
+        while True:
+            # a prefix expression
+            kind = types[self.pos]
+            if kind == ID:
+                name = self.advance()
+                nxt = types[self.pos]
+                if nxt == ASSIGN:
+                    # ANTLR parses the right side below every binary level
+                    self.advance()
+                    stack.append((_ASSIGN, name))
+                    stack.append((_LOOP, 0))
+                    continue
+                if nxt == LPAREN:
+                    self.advance()
+                    if types[self.pos] != RPAREN:
+                        stack.append((_ARG, name, []))
+                        stack.append((_LOOP, 0))
+                        continue
+                    self.advance()
+                    value = Call(name, [])
+                else:
+                    value = Name(name)
+            elif kind == INT:
+                value = Num(self.advance())
+            elif kind == LPAREN:
+                self.advance()
+                stack.append((_PAREN,))
+                stack.append((_LOOP, 0))
+                continue
+            elif kind == MINUS:
+                self.advance()
+                stack.append((_NEG,))
+                continue
+            else:
+                self.error(f"unexpected {self.buf.text(self.pos)!r}")
+            # hand value to the frames waiting for it, until one needs
+            # another prefix expression
+            while True:
+                frame = stack.pop()
+                what = frame[0]
+                if what is _LOOP:
+                    kind = types[self.pos]
+                    prec = binary.get(kind)
+                    if prec is not None and prec >= frame[1]:
+                        self.pos += 1
+                        stack.append(frame)
+                        stack.append((_RIGHT, value, kind))
+                        stack.append((_LOOP, prec + 1))
+                        break
+                    if not stack:
+                        return value
+                elif what is _RIGHT:
+                    value = BinOp(TEXT[frame[2]], frame[1], value)
+                elif what is _ASSIGN:
+                    value = Assign(frame[1], value)
+                elif what is _PAREN:
+                    self.expect(RPAREN)
+                    value = Paren(value)
+                elif what is _NEG:
+                    value = Neg(value)
+                else:
+                    frame[2].append(value)
+                    if types[self.pos] == COMMA:
+                        self.advance()
+                        stack.append(frame)
+                        stack.append((_LOOP, 0))
+                        break
+                    self.expect(RPAREN)
+                    value = Call(frame[1], frame[2])
+
+
+def _name(ttype):
+    if ttype in TEXT:
+        return repr(TEXT[ttype])
+    return {ID: "ID", INT: "INT", STRING: "STRING", EOF: "EOF"}[ttype]
+
+
+def parse_program(source):
+    """Parse source straight to a cminiAst.Program; raises CMiniSyntaxError."""
+    return PrattParser(source).program()
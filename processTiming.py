@@ -0,0 +1,43 @@
+import os
+import threading
+import subprocess
+
+
+def cpu_time(argv, timeout=None):
+    """(CPU seconds, exit code) of one run of argv, its output discarded.
+
+    The seconds are the child's user + system time as os.wait4 reports
+    it, so spawning and reaping it, and whatever else the machine is
+    doing, are not counted. Raises TimeoutError if it had to be killed
+    after timeout seconds.
+    """
+    proc = subprocess.Popen(argv, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL)
+    killed = threading.Event()
+    timer = None
+    if timeout is not None:
+        def kill():
+            killed.set()
+            proc.kill()
+        timer = threading.Timer(timeout, kill)
+        timer.start()
+    try:
+        _, status, usage = os.wait4(proc.pid, 0)
+    finally:
+        if timer is not None:
+            timer.cancel()
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    if killed.is_set():
+        raise TimeoutError(f"{argv[0]} ran longer than {timeout} s")
+    return usage.ru_utime + usage.ru_stime, proc.returncode
+
+
+def cpu_times(argv, warmup=1, repeat=5, timeout=None):
+    """CPU seconds of repeat runs of argv, after warmup runs whose times
+    are dropped (they pay for cold page cache and dynamic loading)."""
+    times = []
+    for i in range(warmup + repeat):
+        seconds, _ = cpu_time(argv, timeout)
+        if i >= warmup:
+            times.append(seconds)
+    return times
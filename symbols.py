@@ -0,0 +1,135 @@
+import hashlib
+import string
+from array import array
+from cminiAst import walk, FunctionDecl, Param, Block, VarDecl, Assign, Call, Name
+
+FUNCTION, PARAM, LOCAL = 0, 1, 2
+KIND_NAMES = ("function", "param", "local")
+
+# the node attribute holding the identifier, per node type
+_SITE_ATTR = {FunctionDecl: "name", Param: "name", VarDecl: "name",
+              Assign: "name", Call: "name", Name: "id"}
+
+
+class SymbolTable:
+    """Scoped symbols of one program.
+
+    build() resolves every identifier occurrence once, following C block
+    scoping: functions are global, parameters belong to their function,
+    a local is visible from its declaration to the end of its block and
+    shadows outer names. Symbols are numbered; each occurrence (site) is
+    stored in flat arrays next to the number of the symbol it refers to,
+    so renaming is one list lookup per occurrence. Names declared nowhere
+    in the program (library calls, typos) get no symbol and keep their
+    spelling.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.names = []         # symbol -> name at resolve time
+        self.kinds = array("b")  # symbol -> FUNCTION / PARAM / LOCAL
+        self.site_nodes = []
+        self.site_symbols = array("i")
+        self.unresolved = set()
+        self.external_calls = []  # Call nodes of functions declared nowhere
+
+    def __len__(self):
+        return len(self.names)
+
+    def _declare(self, name, kind):
+        self.names.append(name)
+        self.kinds.append(kind)
+        return len(self.names) - 1
+
+    def _site(self, node, symbol):
+        self.site_nodes.append(node)
+        self.site_symbols.append(symbol)
+
+    def build(self, program):
+        self.clear()
+        functions = {}
+        for f in program.functions:
+            functions[f.name] = self._declare(f.name, FUNCTION)
+        walk(_Resolver(self, functions), program)
+        return self
+
+    def taken(self):
+        """Every identifier the program spells, resolved or not."""
+        return set(self.names) | self.unresolved
+
+    def rename(self, new_names):
+        """Give symbol i the name new_names[i] (None keeps it) everywhere."""
+        for node, symbol in zip(self.site_nodes, self.site_symbols):
+            new = new_names[symbol]
+            if new is not None:
+                setattr(node, _SITE_ATTR[type(node)], new)
+        for i, new in enumerate(new_names):
+            if new is not None:
+                self.names[i] = new
+
+
+class _Resolver:
+    def __init__(self, table, functions):
+        self.table = table
+        self.functions = functions
+        self.scopes = []
+
+    def lookup(self, name):
+        for scope in reversed(self.scopes):
+            symbol = scope.get(name)
+            if symbol is not None:
+                return symbol
+        return None
+
+    def use(self, node, name, symbol):
+        if symbol is None:
+            self.table.unresolved.add(name)
+        else:
+            self.table._site(node, symbol)
+
+    def enterFunctionDecl(self, node):
+        self.table._site(node, self.functions[node.name])
+        self.scopes.append({})
+
+    def exitFunctionDecl(self, node):
+        self.scopes.pop()
+
+    def enterParam(self, node):
+        symbol = self.table._declare(node.name, PARAM)
+        self.scopes[-1][node.name] = symbol
+        self.table._site(node, symbol)
+
+    def enterBlock(self, node):
+        self.scopes.append({})
+
+    def exitBlock(self, node):
+        self.scopes.pop()
+
+    def enterVarDecl(self, node):
+        # as in C, the new name is already in scope inside its initialiser
+        symbol = self.table._declare(node.name, LOCAL)
+        self.scopes[-1][node.name] = symbol
+        self.table._site(node, symbol)
+
+    def enterAssign(self, node):
+        self.use(node, node.name, self.lookup(node.name))
+
+    def enterName(self, node):
+        self.use(node, node.id, self.lookup(node.id))
+
+    def enterCall(self, node):
+        symbol = self.functions.get(node.name)
+        self.use(node, node.name, symbol)
+        if symbol is None:
+            self.table.external_calls.append(node)
+
+
+def keyed_name(key, name, length=6):
+    """Lowercase name derived from (key, name) alone: the same in every
+    file and every process that uses the same key."""
+    digest = hashlib.blake2b(name.encode("utf-8"), key=key.encode("utf-8")[:64],
+                             digest_size=16).digest()
+    letters = string.ascii_lowercase
+    return "".join(letters[b % 26] for b in digest[:length])
@@ -0,0 +1,42 @@
+import os
+import shutil
+import subprocess
+import pytest
+from obfuscator import obfuscate_source
+
+LIBRARY = """int helper(int a) {
+    return a * 2 + 1;
+}
+int twice(int b) {
+    return helper(helper(b));
+}
+"""
+PROGRAM = """int main() {
+    int x = twice(3);
+    printf("%d\\n", helper(x) + abs(-1));
+    return 0;
+}
+"""
+SPEC = [("rename", {"key": "shared"}), ("dead_code", {}), ("complex_expr", {})]
+
+
+def test_keyed_names_match_across_files():
+    library = obfuscate_source(LIBRARY, None, 1, SPEC)
+    program = obfuscate_source(PROGRAM, None, 2, SPEC)
+    for name in ("helper", "twice"):
+        assert name not in library and name not in program
+    # library calls keep their names
+    assert "abs(" in program
+
+
+@pytest.mark.skipif(shutil.which("gcc") is None, reason="needs gcc")
+def test_keyed_outputs_link(tmp_path):
+    paths = []
+    for name, source, seed in (("library", LIBRARY, 1), ("program", PROGRAM, 2)):
+        path = tmp_path / f"{name}.c"
+        path.write_text(obfuscate_source(source, None, seed, SPEC))
+        paths.append(str(path))
+    exe = str(tmp_path / "linked")
+    # the files call each other without prototypes, as CMini has none
+    subprocess.run(["gcc", "-std=gnu89", "-w", "-include", "stdlib.h", *paths, "-o", exe], check=True)
+    assert subprocess.run([exe], stdout=subprocess.PIPE, text=True, check=True).stdout == "32\n"
@@ -0,0 +1,69 @@
+import os
+import glob
+import pytest
+from benchParsers import strip_includes
+from cminiAst import lower, same_tree, to_source
+from cminiGen import generate
+from frontend import parse
+from obfuscator import obfuscate_source
+from prattParser import parse_program
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+INPUTS = sorted(glob.glob(os.path.join(ROOT, "input*.mc")))
+
+# expressions where precedence, associativity or ANTLR's recovery are
+# easy to get wrong; each becomes the body of a small program
+TRICKY = [
+    "a = b = c + 1",
+    "a - b - c",
+    "a / b * c / 2",
+    "a + b * c - a / b",
+    "0 == 1 < 2",
+    "a < b == c",
+    "a == b < c != a <= b > c >= 1",
+    "a == (b < c)",
+    "(a + b) * (c - (a - b))",
+    "a = (b = 2) * 3",
+    "f(a, b + c, f(1, 2, c) * 3) + f(c, b, a)",
+    "f(a = 1, b, c) < f(0, 0, 0)",
+    "(-1*-(a))",
+    "(-1*-(a + (-1*-(b))))",
+    "f((-1*-(a)), b, c) - (-1*-(c))",
+    "((((a))))",
+]
+
+
+def check(source):
+    reference = lower(parse(source))
+    fast = parse_program(source)
+    assert same_tree(reference, fast), f"antlr:\n{to_source(reference)}\npratt:\n{to_source(fast)}"
+
+
+def tricky_program(expr):
+    return ("int f(int x, int y, int z) {\n    return x + y + z;\n}\n"
+            "int main() {\n    int a = 1;\n    int b = 2;\n    int c = 3;\n"
+            f"    a = {expr};\n    printf(\"%d\\n\", a);\n    return 0;\n}}\n")
+
+
+@pytest.mark.parametrize("path", INPUTS, ids=os.path.basename)
+def test_inputs(path):
+    with open(path, encoding="utf-8") as f:
+        check(strip_includes(f.read()))
+
+
+@pytest.mark.parametrize("path", INPUTS, ids=os.path.basename)
+def test_obfuscated_inputs(path):
+    with open(path, encoding="utf-8") as f:
+        source = strip_includes(f.read())
+    for seed in range(3):
+        check(strip_includes(obfuscate_source(source, None, seed)))
+
+
+@pytest.mark.parametrize("expr", TRICKY)
+def test_tricky_expressions(expr):
+    check(tricky_program(expr))
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_generated(seed):
+    check(generate(seed, functions=1 + seed % 6, block_depth=1 + seed % 3, expr_depth=1 + seed % 5))
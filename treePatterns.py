@@ -0,0 +1,170 @@
+from cminiAst import Node, walk, same_tree
+
+
+class Var(Node):
+    """Pattern variable: matches any subtree, or only nodes of type kind.
+    A name used twice in one pattern must match equal subtrees."""
+    __slots__ = ("name", "kind")
+
+    def __init__(self, name, kind=None):
+        self.name = name
+        self.kind = kind
+
+
+class Rule:
+    __slots__ = ("name", "pattern", "build")
+
+    def __init__(self, name, pattern, build):
+        self.name = name
+        self.pattern = pattern
+        self.build = build
+
+
+def _symbol(node):
+    t = type(node)
+    return (t,) + tuple(getattr(node, s) for s in t.__slots__ if s not in t._children)
+
+
+def _pending(node):
+    """Children of node in the order the preorder walk visits them."""
+    out = []
+    for field in node._children:
+        value = getattr(node, field)
+        if type(value) is list:
+            out.append(_Seq(value))
+        else:
+            out.append(value)
+    return out
+
+
+class _Seq:
+    # a list-valued field: one symbol carrying its length, then the items
+    __slots__ = ("items",)
+
+    def __init__(self, items):
+        self.items = items
+
+
+class _State:
+    __slots__ = ("edges", "vars", "accept")
+
+    def __init__(self):
+        self.edges = {}
+        self.vars = []
+        self.accept = []
+
+
+class RuleSet:
+    """Rewrite rules compiled into one discrimination tree.
+
+    Each pattern is flattened in preorder into a path of node symbols
+    (type plus non-child fields such as an operator or literal); variables
+    are edges that swallow a whole subtree. Matching a node follows the
+    tree once for all rules, so its cost depends on pattern depth rather
+    than on how many rules there are, and rewrite() applies every rule in
+    a single bottom-up walk. A rule's result is matched again, so rules
+    must make the tree smaller.
+    """
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self.root = _State()
+        for priority, rule in enumerate(self.rules):
+            self._insert(priority, rule)
+        self.root_types = {type(r.pattern) for r in self.rules if type(r.pattern) is not Var}
+
+    def _insert(self, priority, rule):
+        state = self.root
+        stack = [rule.pattern]
+        while stack:
+            p = stack.pop()
+            if type(p) is Var:
+                for name, kind, nxt in state.vars:
+                    if name == p.name and kind is p.kind:
+                        break
+                else:
+                    nxt = _State()
+                    state.vars.append((p.name, p.kind, nxt))
+                state = nxt
+                continue
+            if type(p) is _Seq:
+                sym = (_Seq, len(p.items))
+                children = p.items
+            else:
+                sym = _symbol(p)
+                children = _pending(p)
+            state = state.edges.setdefault(sym, _State())
+            stack.extend(reversed(children))
+        state.accept.append(priority)
+
+    def match(self, node):
+        """(rule, bindings) for the first declared rule matching node, or None."""
+        best = self._match(self.root, [node], {})
+        if best is None:
+            return None
+        return self.rules[best[0]], best[1]
+
+    def _match(self, state, stack, bindings):
+        if not stack:
+            if state.accept:
+                return state.accept[0], dict(bindings)
+            return None
+        node = stack[-1]
+        rest = stack[:-1]
+        best = None
+        if type(node) is _Seq:
+            sym = (_Seq, len(node.items))
+            children = node.items
+        else:
+            sym = _symbol(node)
+            children = None
+        nxt = state.edges.get(sym)
+        if nxt is not None:
+            if children is None:
+                children = _pending(node)
+            best = self._match(nxt, rest + children[::-1], bindings)
+        for name, kind, nxt in state.vars:
+            if kind is not None and type(node) is not kind:
+                continue
+            if name in bindings:
+                if not same_tree(bindings[name], node):
+                    continue
+                found = self._match(nxt, rest, bindings)
+            else:
+                bindings[name] = node
+                found = self._match(nxt, rest, bindings)
+                del bindings[name]
+            if found is not None and (best is None or found[0] < best[0]):
+                best = found
+        return best
+
+    def rewrite_node(self, node, fired=None):
+        """The node the rules turn node into, or None if none matches.
+        fired, if given, counts the rules applied by name."""
+        changed = False
+        while True:
+            m = self.match(node)
+            if m is None:
+                break
+            rule, bindings = m
+            node = rule.build(bindings)
+            if fired is not None:
+                fired[rule.name] = fired.get(rule.name, 0) + 1
+            changed = True
+        return node if changed else None
+
+    def rewrite(self, tree, fired=None):
+        """Apply the rules bottom-up under tree; returns how many fired.
+        A compiled RuleSet is never modified, so threads can share one."""
+        if fired is None:
+            fired = {}
+        before = sum(fired.values())
+        listener = _Listener()
+        for t in self.root_types:
+            setattr(listener, "exit" + t.__name__, lambda node: self.rewrite_node(node, fired))
+        walk(listener, tree)
+        return sum(fired.values()) - before
+
+
+class _Listener:
+    pass